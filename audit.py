@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import math
+import random
+import argparse
+from statistics import NormalDist
+from collections.abc import Iterable
+
+from logger_class import LoggerClass
+from library_catalog import LibraryCatalog, split_title_year
+from movie_class import Movie
+from movie_subtitle_manager import SubtitleManager
+from misc_utils import PathFilter, add_path_filter_arguments
+from fs_backend import get_fs, add_fs_arguments, configure_fs
+from probe_supervisor import ProbeSupervisor, add_probe_arguments
+from fix_subs import iter_movie_folders, contains_movie_file
+from fix_year import analyze_folder_name
+
+
+# Checks estimated by the audit, in report order
+CHECKS = {
+    'missing_subtitle': "no subtitle file, no embedded track, nothing to copy",
+    'placeable_subtitle': "subtitle file that fix_subs would copy next to the movie",
+    'has_subtitle': "subtitle already in place or embedded",
+    'bad_name': "folder that fix_year would rename",
+    'no_year': "no year in the folder name",
+}
+
+
+def reservoir_sample(items: Iterable, size: int, rng: random.Random) -> tuple[list, int]:
+    """
+    Pick items uniformly at random from a stream of unknown length in a single pass (reservoir sampling).
+
+    Args:
+        items (Iterable): The items to sample from.
+        size (int): Number of items to pick.
+        rng (random.Random): Random number generator.
+
+    Returns:
+        tuple: (sample, population) where population is the number of items seen.
+    """
+    sample = []
+    population = 0
+    for item in items:
+        population += 1
+        if len(sample) < size:
+            sample.append(item)
+        else:
+            slot = rng.randrange(population)
+            if slot < size:
+                sample[slot] = item
+    return sample, population
+
+
+def wilson_interval(count: int, sample: int, population: int, confidence: float) -> tuple[float, float]:
+    """
+    Confidence interval of a proportion estimated from a sample (Wilson score interval, with the
+    finite population correction since the sample is drawn without replacement).
+
+    Args:
+        count (int): Number of sampled items having the property.
+        sample (int): Sample size.
+        population (int): Population size.
+        confidence (float): Confidence level, e.g. 0.95.
+
+    Returns:
+        tuple: (low, high) bounds of the proportion.
+    """
+    if not sample:
+        return 0.0, 1.0
+    p = count / sample
+    if sample >= population:
+        return p, p
+    # shrinking the variance by (N - n) / (N - 1) is the same as growing the sample size by its inverse
+    n = sample * (population - 1) / (population - sample)
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    margin = z / (1 + z * z / n) * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return max(center - margin, 0.0), min(center + margin, 1.0)
+
+
+def audit_folder(folder_path: str, movie_file: str, subtitle_manager: SubtitleManager, logger: LoggerClass) -> dict[str, bool]:
+    """
+    Run the fix_subs and fix_year decisions on a movie folder without changing anything.
+
+    Args:
+        folder_path (str): The path of the movie folder.
+        movie_file (str): The path of the movie file.
+        subtitle_manager (SubtitleManager): The subtitle manager deciding the subtitle.
+        logger (LoggerClass): The logger instance for logging messages.
+
+    Returns:
+        dict: The result of each of CHECKS for the folder.
+    """
+    folder_name = os.path.basename(folder_path)
+    source, _, _ = subtitle_manager.plan_subtitle(Movie(movie_file, True, logger))
+    logger.log_debug(f"Audited [{folder_path}]: subtitle {source}")
+    return {
+        'missing_subtitle': source == 'none',
+        'placeable_subtitle': source in ('folder', 'subs', 'archive', 'orphan'),
+        'has_subtitle': source in ('existing', 'embedded'),
+        'bad_name': analyze_folder_name(folder_name, True, logger) is not None,
+        'no_year': split_title_year(folder_name)[1] is None,
+    }
+
+
+def run_audit(path: str, sample_size: int, rng: random.Random, logger: LoggerClass, catalog_file: str = None,
+              recurse: bool = False, path_filter: PathFilter = None, confidence: float = 0.95) -> dict:
+    """
+    Estimate the health of the library from a uniform random sample of its movie folders.
+
+    Args:
+        path (str): The library folder.
+        sample_size (int): Number of movie folders to audit.
+        rng (random.Random): Random number generator.
+        logger (LoggerClass): The logger instance for logging messages.
+        catalog_file (str): Sample the folders recorded in this catalog instead of walking the library.
+        recurse (bool): Walk subfolders recursively (walk only).
+        path_filter (PathFilter): Optional filter pruning folders by name and depth (walk only).
+        confidence (float): Confidence level of the intervals.
+
+    Returns:
+        dict: The report: population, sample size, stale entries and, per check, count, proportion and interval.
+    """
+    if catalog_file:
+        with LibraryCatalog(catalog_file) as catalog:
+            sample, population = reservoir_sample(catalog.iter_folders(under=path), sample_size, rng)
+    else:
+        sample, population = reservoir_sample(iter_movie_folders(path, recurse, logger, path_filter), sample_size, rng)
+    logger.log_info(f"Sampled {len(sample)} of {population} movie folder{'s' if population != 1 else ''}")
+
+    subtitle_manager = SubtitleManager(logger, True)
+    counts = dict.fromkeys(CHECKS, 0)
+    audited = stale = 0
+    for folder_path, movie_file in sample:
+        if not movie_file or not get_fs().exists(movie_file):
+            # catalog entries can be out of date: look for the movie file again
+            movie_file = get_fs().isdir(folder_path) and contains_movie_file(folder_path, logger)
+        if not movie_file:
+            logger.log_warning(f"*** No movie file in [{folder_path}] anymore, left out of the audit ***")
+            stale += 1
+            continue
+        try:
+            results = audit_folder(folder_path, movie_file, subtitle_manager, logger)
+        except OSError as e:
+            logger.log_error(f"*** Could not audit [{folder_path}]: {e} ***")
+            stale += 1
+            continue
+        audited += 1
+        for check, result in results.items():
+            counts[check] += result
+
+    checks = {}
+    for check, count in counts.items():
+        low, high = wilson_interval(count, audited, population, confidence)
+        checks[check] = {'count': count, 'proportion': count / audited if audited else None, 'low': low, 'high': high,
+                         'estimated_folders': round(count / audited * population) if audited else None}
+    return {'population': population, 'sample': audited, 'stale': stale, 'confidence': confidence,
+            'source': 'catalog' if catalog_file else 'walk', 'checks': checks}
+
+
+def write_report(report: dict, output_format: str, out=sys.stdout):
+    """
+    Write the audit report to the output.
+
+    Args:
+        report (dict): The report returned by run_audit.
+        output_format (str): table or json.
+        out (file): Output stream.
+    """
+    if output_format == 'json':
+        json.dump(report, out, indent=2)
+        out.write('\n')
+        return
+    level = f"{report['confidence']:.0%}"
+    out.write(f"Audited {report['sample']} of {report['population']} movie folders ({report['source']}"
+              f"{', %d stale entries left out' % report['stale'] if report['stale'] else ''}), {level} confidence intervals\n")
+    out.write(f"{'check':<20} {'count':>6} {'estimate':>9}  {level + ' interval':<20} {'~folders':>9}  description\n")
+    for check, result in report['checks'].items():
+        if result['proportion'] is None:
+            continue
+        interval = f"[{result['low']:6.1%}, {result['high']:6.1%}]"
+        out.write(f"{check:<20} {result['count']:>6} {result['proportion']:>9.1%}  {interval:<20} {result['estimated_folders']:>9}  {CHECKS[check]}\n")
+
+
+def main(path, sample_size, seed, catalog_file, recurse, confidence, output_format, log_to_file, logfile, loglevel, silent,
+         excludes=None, includes=None, max_depth=None, default_excludes=True, snapshot_file=None, latency_ms=0.0, probe_latency_ms=0.0,
+         probe_timeout=60.0, probe_memory_mb=2048, quarantine_file=None):
+    """
+    Main function to execute the sampling audit.
+
+    Args:
+        path (str): Path to the library folder.
+        sample_size (int): Number of movie folders to audit.
+        seed (int): Seed of the random sample, None for a different sample on every run.
+        catalog_file (str): Sample the folders of this catalog instead of walking the library.
+        recurse (bool): Whether to recursively search subfolders for movie folders.
+        confidence (float): Confidence level of the intervals.
+        output_format (str): table or json.
+        log_to_file (bool): Whether to enable logging to a file.
+        logfile (str): Name of the log file, if logging to a file is enabled.
+        loglevel (str): Logging level to use (DEBUG, INFO, ERROR).
+        silent (bool): Whether to suppress console log output (the report is still written).
+        excludes (list[str]): Glob patterns of folder names to skip.
+        includes (list[str]): Glob patterns of folder names to audit (others are only traversed).
+        max_depth (int): Deepest folder level traversed.
+        default_excludes (bool): Whether to skip NAS metadata and extras folders by default.
+        snapshot_file (str): Audit this library snapshot instead of the real filesystem.
+        latency_ms (float): Snapshot mode: latency added to every filesystem operation.
+        probe_latency_ms (float): Snapshot mode: latency added to every probe.
+        probe_timeout (float): Seconds a MediaInfo probe may take before the file is quarantined (0 = probe in-process).
+        probe_memory_mb (int): Memory limit of the MediaInfo probe process in MB.
+        quarantine_file (str): File persisting the quarantined movie files, so later runs skip them.
+    """
+    logger = LoggerClass(log_to_file=log_to_file, log_file=logfile, loglevel=loglevel, silent=silent, log_prefix=f"{os.path.splitext(os.path.basename(__file__))[0]}")
+
+    logger.log_debug(f"Parameters -> path: {path}")
+    logger.log_debug(f"Parameters -> sample: {sample_size} (seed {seed})")
+    logger.log_debug(f"Parameters -> catalog: {catalog_file}")
+    logger.log_debug(f"Parameters -> recurse: {recurse}")
+    logger.log_debug(f"Parameters -> confidence: {confidence}")
+    logger.log_debug(f"Parameters -> excludes: {excludes} (default excludes: {default_excludes})")
+    logger.log_debug(f"Parameters -> includes: {includes}")
+    logger.log_debug(f"Parameters -> max_depth: {max_depth}")
+    logger.log_debug(f"Parameters -> snapshot: {snapshot_file} (latency {latency_ms} ms, probe latency {probe_latency_ms} ms)")
+
+    probe_supervisor = ProbeSupervisor(probe_timeout, probe_memory_mb, quarantine_file) if probe_timeout else None
+    configure_fs(snapshot_file, latency_ms, probe_latency_ms, probe_supervisor)
+    path = os.path.abspath(path)
+    if not get_fs().isdir(path):
+        logger.log_error(f"Path '{path}' is not a directory.")
+        sys.exit(1)
+    if catalog_file and not os.path.exists(catalog_file):
+        logger.log_error(f"Catalog '{catalog_file}' does not exist.")
+        sys.exit(1)
+
+    logger.log_info(f"Auditing {sample_size} random movie folders of '{path}' "
+                    f"({'from catalog ' + catalog_file if catalog_file else 'recursive walk' if recurse else 'walk'})")
+    try:
+        report = run_audit(path, sample_size, random.Random(seed), logger, catalog_file, recurse,
+                           PathFilter(excludes, includes, max_depth, default_excludes), confidence)
+    finally:
+        if probe_supervisor:
+            probe_supervisor.close()
+    write_report(report, output_format)
+
+
+def parse_args():
+    """
+    Parse command line arguments.
+
+    Returns:
+        Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Estimate the share of the library missing subtitles or with badly formatted names "
+                                                 "from a random sample of movie folders, without changing anything.")
+
+    parser.add_argument('path', type=str, help="Path to the library folder.")
+    parser.add_argument('--sample', '-n', type=int, default=200, help="Number of movie folders to audit (default 200).")
+    parser.add_argument('--seed', type=int, default=None, help="Seed of the random sample, to repeat an audit on the same folders.")
+    parser.add_argument('--catalog', '-C', type=str, default=None, help="Sample the folders of this catalog (see library_catalog.py) instead of walking the library.")
+    parser.add_argument('--recurse', '-R', action='store_true', help="Recursively search subfolders for movie folders.")
+    parser.add_argument('--confidence', type=float, default=0.95, help="Confidence level of the intervals (default 0.95).")
+    parser.add_argument('--format', '-f', choices=['table', 'json'], default='table', help="Report format.")
+    parser.add_argument('--log_to_file', '--log', '-L', action='store_true', help="Enable logging to a file.")
+    parser.add_argument('--logfile', '-F', type=str, default='', help="Specify log file name.")
+    parser.add_argument('--loglevel', '-LL', type=str, choices=['DEBUG', 'INFO', 'ERROR'], default='INFO', help="Set the logging level (DEBUG, INFO, ERROR).")
+    parser.add_argument('--silent', '-S', action='store_true', help="Suppress console log output (the report is still written).")
+    add_path_filter_arguments(parser)
+    add_fs_arguments(parser)
+    add_probe_arguments(parser)
+
+    args = parser.parse_args()
+    if args.sample < 1:
+        parser.error("--sample must be at least 1")
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must be between 0 and 1")
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(path=args.path,
+         sample_size=args.sample,
+         seed=args.seed,
+         catalog_file=args.catalog,
+         recurse=args.recurse,
+         confidence=args.confidence,
+         output_format=args.format,
+         log_to_file=args.log_to_file,
+         logfile=args.logfile,
+         loglevel=args.loglevel,
+         silent=args.silent,
+         excludes=args.exclude,
+         includes=args.include,
+         max_depth=args.max_depth,
+         default_excludes=not args.no_default_excludes,
+         snapshot_file=args.snapshot,
+         latency_ms=args.latency_ms,
+         probe_latency_ms=args.probe_latency_ms,
+         probe_timeout=args.probe_timeout,
+         probe_memory_mb=args.probe_memory_mb,
+         quarantine_file=args.quarantine)
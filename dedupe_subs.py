@@ -0,0 +1,280 @@
+import os
+import sys
+import stat
+import sqlite3
+import hashlib
+import secrets
+import tempfile
+import argparse
+from collections import defaultdict
+
+from logger_class import LoggerClass
+
+try:
+    import xxhash  # optional, faster than blake2b when installed
+except ImportError:
+    xxhash = None
+
+
+SUBTITLE_EXTENSIONS = {'.srt', '.sub', '.vtt', '.ass', '.ssa', '.idx'}
+CHUNK_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl cloning the extents of a file (reflink) on btrfs/xfs/bcachefs
+
+
+class HashCache:
+    """
+    HashCache persists file content hashes keyed by (device, inode, size, mtime) in SQLite,
+    so repeat runs only hash the files that are new or changed.
+    """
+
+    def __init__(self, db_path: str, algorithm: str):
+        """
+        Open (and create if needed) the cache database.
+
+        Args:
+            db_path (str): Path of the SQLite database file (':memory:' for no persistence).
+            algorithm (str): Name of the hash algorithm, cached hashes of another algorithm are ignored.
+        """
+        self.algorithm = algorithm
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, algorithm TEXT, digest TEXT,
+                PRIMARY KEY (dev, ino)
+            )""")
+
+    def get(self, st: os.stat_result) -> str | None:
+        row = self.conn.execute("SELECT digest FROM hashes WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ? AND algorithm = ?",
+                                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, self.algorithm)).fetchone()
+        return row[0] if row else None
+
+    def put(self, st: os.stat_result, digest: str):
+        self.conn.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+                          (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, self.algorithm, digest))
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def file_digest(file_path: str) -> str:
+    """
+    Hash a file by streaming it in fixed-size chunks.
+
+    Args:
+        file_path (str): Path of the file to hash.
+
+    Returns:
+        str: Hex digest (xxh3_128 when xxhash is installed, blake2b-128 otherwise).
+    """
+    hasher = xxhash.xxh3_128() if xxhash else hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def find_duplicates(root: str, cache: HashCache, logger: LoggerClass) -> list[list[tuple[str, os.stat_result]]]:
+    """
+    Find groups of identical subtitle files below a folder.
+
+    Candidates are grouped by device and size first (only files sharing both can be linked), files that are
+    already links to the same inode count once, and only the remaining candidates are hashed.
+
+    Args:
+        root (str): The folder to search.
+        cache (HashCache): Cache of the hashes computed by previous runs.
+        logger (LoggerClass): The logger instance for logging messages.
+
+    Returns:
+        list: Groups of (path, stat) of identical files with distinct inodes, each with 2 or more entries.
+    """
+    by_size = defaultdict(dict)
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if os.path.splitext(file_name)[1].lower() not in SUBTITLE_EXTENSIONS:
+                continue
+            file_path = os.path.join(dir_path, file_name)
+            try:
+                st = os.stat(file_path, follow_symlinks=False)
+            except OSError as e:
+                logger.log_error(f"*** Could not stat [{file_path}]: {e} ***")
+                continue
+            if stat.S_ISREG(st.st_mode) and st.st_size > 0:
+                # one entry per inode, hard links of the same file are already deduplicated
+                by_size[(st.st_dev, st.st_size)].setdefault(st.st_ino, (file_path, st))
+
+    groups = []
+    hashed = cached = 0
+    for candidates in by_size.values():
+        if len(candidates) < 2:
+            continue
+        by_digest = defaultdict(list)
+        for file_path, st in candidates.values():
+            digest = cache.get(st)
+            if digest:
+                cached += 1
+            else:
+                try:
+                    digest = file_digest(file_path)
+                except OSError as e:
+                    logger.log_error(f"*** Could not read [{file_path}]: {e} ***")
+                    continue
+                cache.put(st, digest)
+                hashed += 1
+            by_digest[digest].append((file_path, st))
+        groups.extend(group for group in by_digest.values() if len(group) > 1)
+
+    logger.log_debug(f"Hashed {hashed} file{'s' if hashed != 1 else ''}, {cached} hash{'es' if cached != 1 else ''} from cache")
+    return groups
+
+
+def link_file(source: str, target: str, method: str):
+    """
+    Replace target with a link to source, atomically (the link is made next to target, then renamed over it).
+
+    Args:
+        source (str): The file to keep.
+        target (str): The duplicate to replace.
+        method (str): hardlink or reflink.
+    """
+    folder, name = os.path.split(target)
+    tmp_path = None  # set once this call created the temporary file, the only file it may remove
+    try:
+        if method == 'reflink':
+            import fcntl
+            fd, path = tempfile.mkstemp(prefix=f".{name}.", suffix='.dedupe.tmp', dir=folder)
+            tmp_path = path
+            with open(source, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        else:
+            # os.link never overwrites: pick another name if this one is taken
+            while tmp_path is None:
+                path = os.path.join(folder, f".{name}.{secrets.token_hex(4)}.dedupe.tmp")
+                try:
+                    os.link(source, path)
+                    tmp_path = path
+                except FileExistsError:
+                    continue
+        os.replace(tmp_path, target)
+    except BaseException:
+        if tmp_path and os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def dedupe(root: str, method: str, demo: bool, cache: HashCache, logger: LoggerClass) -> int:
+    """
+    Replace identical subtitle files below a folder with links to a single copy.
+
+    Args:
+        root (str): The folder to process.
+        method (str): hardlink or reflink.
+        demo (bool): Flag to enable demo mode where no actual changes are made.
+        cache (HashCache): Cache of the file hashes.
+        logger (LoggerClass): The logger instance for logging messages.
+
+    Returns:
+        int: Number of bytes reclaimed (or reclaimable in demo mode).
+    """
+    reclaimed = 0
+    for group in find_duplicates(root, cache, logger):
+        # keep the oldest copy, it is the one the others were most likely copied from
+        group.sort(key=lambda entry: (entry[1].st_mtime_ns, entry[0]))
+        keep_path = group[0][0]
+        logger.log_info(f"Keeping [{keep_path}] ({group[0][1].st_size} bytes, {len(group) - 1} duplicate{'s' if len(group) != 2 else ''})")
+        for file_path, st in group[1:]:
+            if demo:
+                logger.log_info(f"\t{method}: [{file_path}]")
+                reclaimed += st.st_size
+                continue
+            try:
+                link_file(keep_path, file_path, method)
+                logger.log_info(f"\tLinked [{file_path}]")
+                reclaimed += st.st_size
+            except OSError as e:
+                logger.log_error(f"*** Could not {method} [{file_path}] to [{keep_path}]: {e} ***")
+    return reclaimed
+
+
+def default_cache_file() -> str:
+    """
+    Get the default path of the hash cache, in the user cache folder rather than in the library being deduplicated
+    (where it would be scanned and would change the library even on demo runs).
+
+    Returns:
+        str: $XDG_CACHE_HOME/fix_subs/dedupe_subs_cache.sqlite (~/.cache by default), the folder is created if needed.
+    """
+    cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'fix_subs')
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, 'dedupe_subs_cache.sqlite')
+
+
+def main(path, method, cache_file, log_to_file, logfile, loglevel, silent, demo):
+    """
+    Main function to execute the subtitle deduplication.
+
+    Args:
+        path (str): Path to the directory to deduplicate.
+        method (str): hardlink or reflink.
+        cache_file (str): Path of the hash cache database.
+        log_to_file (bool): Whether to enable logging to a file.
+        logfile (str): Name of the log file, if logging to a file is enabled.
+        loglevel (str): Logging level to use (DEBUG, INFO, ERROR).
+        silent (bool): Whether to suppress console output.
+        demo (bool): Whether to enable demo mode where no actual changes are made.
+    """
+    logger = LoggerClass(log_to_file=log_to_file, log_file=logfile, loglevel=loglevel, silent=silent, demo=demo, log_prefix=f"{os.path.splitext(os.path.basename(__file__))[0]}")
+
+    if not os.path.isdir(path):
+        logger.log_error(f"Path '{path}' is not a directory.")
+        sys.exit(1)
+    path = os.path.abspath(path)
+    if not cache_file:
+        cache_file = default_cache_file()
+
+    logger.log_info(f"folder_path: {path}")
+    logger.log_info(f"Hash cache: {cache_file} ({'xxh3_128' if xxhash else 'blake2b'})")
+    if demo:
+        logger.log_info("Demo mode enabled")
+
+    cache = HashCache(cache_file, 'xxh3_128' if xxhash else 'blake2b')
+    try:
+        reclaimed = dedupe(path, method, demo, cache, logger)
+    finally:
+        cache.close()
+    logger.log_info(f"{'Reclaimable' if demo else 'Reclaimed'}: {reclaimed / 1024:.1f} KB")
+
+
+def parse_args():
+    """
+    Parse command line arguments.
+
+    Returns:
+        Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Find identical subtitle files across the library and replace the copies with links to one file. "
+                                                 "Note: hard-linked files share their content, editing one edits all of them.")
+
+    parser.add_argument('path', type=str, help="Path to the directory to deduplicate.")
+    parser.add_argument('--link', choices=['hardlink', 'reflink'], default='hardlink', help="Replace duplicates with hard links or reflinks (copy-on-write clones, btrfs/xfs).")
+    parser.add_argument('--cache', type=str, default='', help="Hash cache database (default: ~/.cache/fix_subs/dedupe_subs_cache.sqlite).")
+    parser.add_argument('--log_to_file', '--log', '-L', action='store_true', help="Enable logging to a file.")
+    parser.add_argument('--logfile', '-F', type=str, default='', help="Specify log file name.")
+    parser.add_argument('--loglevel', '-LL', type=str, choices=['DEBUG', 'INFO', 'ERROR'], default='INFO', help="Set the logging level (DEBUG, INFO, ERROR).")
+    parser.add_argument('--silent', '-S', action='store_true', help="Suppress console output.")
+    parser.add_argument('--demo', '-D', action='store_true', help="Enable demo mode where no actual changes are made.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(path=args.path,
+         method=args.link,
+         cache_file=args.cache,
+         log_to_file=args.log_to_file,
+         logfile=args.logfile,
+         loglevel=args.loglevel,
+         silent=args.silent,
+         demo=args.demo)
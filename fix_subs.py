@@ -1,11 +1,19 @@
 import argparse
 import os
 import sys
-from misc_utils import _files, _subdirs, _movie_files, _subtitle_files
+from misc_utils import _files, _subdirs, _movie_files, _subtitle_files, PathFilter, add_path_filter_arguments
 from datetime import datetime
 from movie_class import Movie
 from movie_subtitle_manager import SubtitleManager
 from logger_class import LoggerClass
+from library_catalog import LibraryCatalog
+from run_metrics import get_metrics
+from work_scheduler import WorkScheduler
+from fs_backend import get_fs, add_fs_arguments, configure_fs
+from progress_display import ProgressDisplay
+from probe_supervisor import ProbeSupervisor, add_probe_arguments
+from io_throttle import add_throttle_arguments, configure_throttle
+from subtitle_index import SubtitleIndex
 
 
 def contains_movie_file(folder_path, logger):
@@ -19,56 +27,122 @@ def contains_movie_file(folder_path, logger):
         str: The name of the movie file if found, otherwise None.
     """
     movie_extensions = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.mpg'}
+    fs = get_fs()
     
-    for file_name in os.listdir(folder_path):
+    for file_name, is_dir in fs.scandir(folder_path):
         movfile = os.path.join(folder_path, file_name)
-        if  any(file_name.lower().endswith(ext) for ext in movie_extensions) and \
-            os.path.getsize(movfile) > 0 and \
-            os.access(movfile, os.R_OK|os.W_OK):
+        if  not is_dir and \
+            any(file_name.lower().endswith(ext) for ext in movie_extensions) and \
+            fs.getsize(movfile) > 0 and \
+            fs.access(movfile, os.R_OK|os.W_OK):
                 logger.log_debug(f"Movie file found: [{file_name}]")
                 return movfile
     return None
 
-def process_folder(folder_path, recurse, demo, logger):
+def iter_movie_folders(folder_path, recurse, logger, path_filter=None, depth=1, progress=None):
     """
-    Process a folder to find and manage movie files, and their associated subtitles.
+    Walk a folder and yield the subfolders containing a movie file, in the order they are found.
 
     Args:
         folder_path (str): The path of the parent folder.
         recurse (bool): Flag to enable recursive processing of subdirectories.
-        demo (bool): Flag to enable demo mode where no actual changes are made.
         logger (LoggerClass): The logger instance for logging messages.
-    """
-
-    #folders_to_process = []
-    subtitle_manager = SubtitleManager(logger, demo)
+        path_filter (PathFilter): Optional filter pruning folders by name and depth before they are opened.
+        depth (int): Level of the subfolders of folder_path, 1 being the children of the root.
+        progress (ProgressDisplay): Optional progress display estimating the total from the folders found.
 
-    # First pass: run thru dirs and check for movies, if recurse, check subpath if any subdirs with movies
+    Yields:
+        tuple: (subfolder_path, movie_file) for each movie folder found.
+    """
+    # run thru dirs and check for movies, if recurse, check subpath if any subdirs with movies
+    folder_names = []
     for folder_name in _subdirs(folder_path):
         if folder_name.lower() == 'subs':
             continue
+        if path_filter and not path_filter.allows(folder_name, depth):
+            logger.log_debug(f"Skipping excluded folder [{os.path.join(folder_path, folder_name)}]")
+            continue
+        folder_names.append(folder_name)
+    if progress:
+        progress.discover(len(folder_names))
+
+    for folder_name in folder_names:
         subfolder_path = os.path.join(folder_path, folder_name)
+        get_metrics().inc('folders_scanned')
 
         logger.log_debug("\n")
         logger.log_debug("*" * 80)
         logger.log_debug("\n")
         logger.log_debug(f"Folder Path: [{folder_path}] Folder Name: [{folder_name}]")
 
-        movie_file = contains_movie_file(subfolder_path, logger)
+        movie_file = None
+        if not path_filter or path_filter.includes_folder(folder_name):
+            movie_file = contains_movie_file(subfolder_path, logger)
+        if progress:
+            progress.visit(movie_file is not None)
         if movie_file:
-            #logger.log_debug(f"Folder to process: [{subfolder_path}]")
-            #folders_to_process.append(Movie(movie_file, logger))
-            subtitle_manager.manage_subtitles_for_movie(Movie(movie_file, demo, logger))
+            yield subfolder_path, movie_file
 
         if recurse:
             # Recursively process subfolders
-            process_folder(subfolder_path, recurse, demo, logger)
-    
-    # Second pass: Process collected directories
-    #for movie in folders_to_process:
-        
+            yield from iter_movie_folders(subfolder_path, recurse, logger, path_filter, depth + 1, progress)
 
-def main(path, log_to_file, logfile, loglevel, silent, demo, recurse):
+def process_movie_folder(subfolder_path, movie_file, subtitle_manager, demo, logger, catalog=None):
+    """
+    Manage the subtitles of the movie found in a folder.
+
+    Args:
+        subfolder_path (str): The path of the movie folder.
+        movie_file (str): The path of the movie file.
+        subtitle_manager (SubtitleManager): The subtitle manager deciding and placing the subtitle.
+        demo (bool): Flag to enable demo mode where no actual changes are made.
+        logger (LoggerClass): The logger instance for logging messages.
+        catalog (LibraryCatalog): Optional catalog to record the findings of the movie folder in.
+    """
+    with get_metrics().timer('folder_duration'):
+        movie = Movie(movie_file, demo, logger)
+        subtitle_manager.manage_subtitles_for_movie(movie)
+        if catalog:
+            subtitle_path, subtitle_source = movie.subtitle_path, movie.subtitle_source
+            if demo and subtitle_source not in ('existing', 'embedded', 'none'):
+                # a demo run only planned the placement: record what is on disk, not the plan
+                subtitle_path = subtitle_source = None
+            catalog.upsert_movie(subfolder_path, movie_file=movie.full_path, text_langs=movie.text_languages,
+                                 subtitle_path=subtitle_path, subtitle_source=subtitle_source)
+
+def process_folder(folder_path, recurse, demo, logger, catalog=None, scheduler=None, path_filter=None, progress=None, orphan_index=None):
+    """
+    Process a folder to find and manage movie files, and their associated subtitles.
+
+    Args:
+        folder_path (str): The path of the parent folder.
+        recurse (bool): Flag to enable recursive processing of subdirectories.
+        demo (bool): Flag to enable demo mode where no actual changes are made.
+        logger (LoggerClass): The logger instance for logging messages.
+        catalog (LibraryCatalog): Optional catalog to record the findings of each movie folder in.
+        scheduler (WorkScheduler): Optional scheduler ordering the movie folders and bounding the run.
+        path_filter (PathFilter): Optional filter pruning folders by name and depth.
+        progress (ProgressDisplay): Optional live progress display.
+        orphan_index (SubtitleIndex): Optional index of the stray subtitles, searched for movies with no subtitle.
+    """
+    subtitle_manager = SubtitleManager(logger, demo, orphan_index)
+
+    movie_folders = iter_movie_folders(folder_path, recurse, logger, path_filter, progress=progress)
+    if scheduler:
+        movie_folders = scheduler.run(movie_folders)
+
+    for subfolder_path, movie_file in movie_folders:
+        process_movie_folder(subfolder_path, movie_file, subtitle_manager, demo, logger, catalog)
+        if progress:
+            progress.advance()
+
+def main(path, log_to_file, logfile, loglevel, silent, demo, recurse, catalog_file=None, metrics_file=None, metrics_interval=30.0,
+         log_buffered=False, log_retention_mb=512, log_retention_days=None,
+         order='listdir', max_seconds=None, max_items=None, cursor_file=None,
+         excludes=None, includes=None, max_depth=None, default_excludes=True,
+         snapshot_file=None, latency_ms=0.0, probe_latency_ms=0.0, show_progress=False,
+         probe_timeout=60.0, probe_memory_mb=2048, quarantine_file=None,
+         max_meta_ops=None, max_probes=None, max_copy_mbps=None, adaptive_io=False, orphan_roots=None):
     """
     Main function to execute the subtitle management process.
 
@@ -80,29 +154,77 @@ def main(path, log_to_file, logfile, loglevel, silent, demo, recurse):
         silent (bool): Whether to suppress console output.
         demo (bool): Whether to enable demo mode where no actual changes are made.
         recurse (bool): Whether to recursively search subfolders for movie files.
+        catalog_file (str): Path of the SQLite library catalog to update, if any.
+        metrics_file (str): Path of the Prometheus textfile-collector file to write, if any.
+        metrics_interval (float): Seconds between metrics file updates during the run.
+        log_buffered (bool): Buffer the log file in memory and rotate to compressed segments (for long DEBUG runs).
+        log_retention_mb (float): Buffered log: maximum total size of the rotated segments in MB.
+        log_retention_days (float): Buffered log: maximum age of the rotated segments in days.
+        order (str): Order of the movie folders: listdir (as found), newest/oldest (folder mtime) or name.
+        max_seconds (float): Wall-clock budget of the run in seconds, the run stops cleanly when it is used up.
+        max_items (int): Maximum number of movie folders processed in the run.
+        cursor_file (str): File persisting the folders done, so the next run continues where this one stopped.
+        excludes (list[str]): Glob patterns of folder names to skip.
+        includes (list[str]): Glob patterns of folder names to process (others are only traversed).
+        max_depth (int): Deepest folder level traversed.
+        default_excludes (bool): Whether to skip NAS metadata and extras folders by default.
+        snapshot_file (str): Replay against this library snapshot instead of the real filesystem.
+        latency_ms (float): Snapshot mode: latency added to every filesystem operation.
+        probe_latency_ms (float): Snapshot mode: latency added to every probe.
+        show_progress (bool): Show a live status line with throughput and ETA (terminal only).
+        probe_timeout (float): Seconds a MediaInfo probe may take before the file is quarantined (0 = probe in-process).
+        probe_memory_mb (int): Memory limit of the MediaInfo probe process in MB.
+        quarantine_file (str): File persisting the quarantined movie files, so later runs skip them.
+        max_meta_ops (float): Limit of filesystem metadata operations per second.
+        max_probes (float): Limit of movie file probes per second.
+        max_copy_mbps (float): Limit of the subtitle copy bandwidth in MB/s.
+        adaptive_io (bool): Lower the I/O limits while the filesystem latency is above its baseline.
+        orphan_roots (list[str]): Folders scanned for stray subtitles (e.g. the library root), matched to movies with no subtitle.
     """
     # Initialize the logger
-    logger = LoggerClass(log_to_file=log_to_file, log_file=logfile, loglevel=loglevel, silent=silent, demo=demo, log_prefix=f"{os.path.splitext(os.path.basename(__file__))[0]}")
+    log_options = {}
+    if log_buffered:
+        log_options = dict(buffered=True, max_file_size=16 * 1024 * 1024, retention_days=log_retention_days,
+                           retention_bytes=int(log_retention_mb * 1024 * 1024) if log_retention_mb else None)
+    logger = LoggerClass(log_to_file=log_to_file, log_file=logfile, loglevel=loglevel, silent=silent, demo=demo, log_prefix=f"{os.path.splitext(os.path.basename(__file__))[0]}", **log_options)
 
     logger.log_debug(f"Parameters -> path: {path}")
     logger.log_debug(f"Parameters -> demo: {demo}")
     logger.log_debug(f"Parameters -> log: {log_to_file}")
     logger.log_debug(f"Parameters -> log_file: {logfile}")
     logger.log_debug(f"Parameters -> loglevel: {loglevel}")
+    logger.log_debug(f"Parameters -> log_buffered: {log_buffered}")
     logger.log_debug(f"Parameters -> silent: {silent}" )
     logger.log_debug(f"Parameters -> recurse: {recurse}")
+    logger.log_debug(f"Parameters -> catalog: {catalog_file}")
+    logger.log_debug(f"Parameters -> order: {order}")
+    logger.log_debug(f"Parameters -> max_seconds: {max_seconds}")
+    logger.log_debug(f"Parameters -> max_items: {max_items}")
+    logger.log_debug(f"Parameters -> cursor: {cursor_file}")
+    logger.log_debug(f"Parameters -> excludes: {excludes} (default excludes: {default_excludes})")
+    logger.log_debug(f"Parameters -> includes: {includes}")
+    logger.log_debug(f"Parameters -> max_depth: {max_depth}")
+    logger.log_debug(f"Parameters -> snapshot: {snapshot_file} (latency {latency_ms} ms, probe latency {probe_latency_ms} ms)")
+    logger.log_debug(f"Parameters -> metrics_file: {metrics_file}")
+    logger.log_debug(f"Parameters -> progress: {show_progress}")
+    logger.log_debug(f"Parameters -> probe_timeout: {probe_timeout} (memory {probe_memory_mb} MB, quarantine {quarantine_file})")
+    logger.log_debug(f"Parameters -> orphan_roots: {orphan_roots}")
+    logger.log_debug(f"Parameters -> io limits: {max_meta_ops} ops/s, {max_probes} probes/s, {max_copy_mbps} MB/s (adaptive: {adaptive_io})")
    
     # Validate the path
     #if not path:
     #    folder_path = os.getcwd()
 
-    if not os.path.exists(path):
+    probe_supervisor = ProbeSupervisor(probe_timeout, probe_memory_mb, quarantine_file) if probe_timeout else None
+    configure_fs(snapshot_file, latency_ms, probe_latency_ms, probe_supervisor)
+    throttled_fs = configure_throttle(max_meta_ops, max_probes, max_copy_mbps, adaptive_io, logger)
+    path = os.path.abspath(path) # get absolute path
+
+    if not get_fs().exists(path):
         logger.log_error(f"Path '{path}' does not exist.")
         sys.exit(1)
-    
-    path = os.path.abspath(path) # get absolute path
 
-    if not os.path.isdir(path):
+    if not get_fs().isdir(path):
         logger.log_error(f"Path '{path}' is not a directory.")
         sys.exit(1)
 
@@ -116,13 +238,54 @@ def main(path, log_to_file, logfile, loglevel, silent, demo, recurse):
         logger.log_info(f"Logging enabled, logging level {loglevel}")
     if demo:
         logger.log_info("Demo mode enabled")
+    if snapshot_file:
+        logger.log_info(f"Replaying snapshot {snapshot_file} (changes are kept in memory)")
     if silent:
         logger.log_info("Silent mode: Console output suppressed")
+    if catalog_file:
+        logger.log_info(f"Updating library catalog: {catalog_file}")
+    if metrics_file:
+        logger.log_info(f"Writing metrics to: {metrics_file}")
+    if throttled_fs:
+        logger.log_info(f"I/O limits: {throttled_fs.meta.rate or 'unlimited'} ops/s, {throttled_fs.probe.rate or 'unlimited'} probes/s, "
+                        f"{f'{throttled_fs.copy.rate / 1024 / 1024:g} MB/s' if throttled_fs.copy.rate else 'unlimited'} copies"
+                        + (" (adaptive)" if adaptive_io else ''))
+    path_filter = PathFilter(excludes, includes, max_depth, default_excludes)
+    scheduler = None
+    if order != 'listdir' or max_seconds or max_items or cursor_file:
+        scheduler = WorkScheduler(logger, order=order, max_seconds=max_seconds, max_items=max_items, cursor_file=cursor_file, demo=demo)
+        logger.log_info(f"Scheduling: order {order}" + (f", budget {max_seconds}s" if max_seconds else '') +
+                        (f", at most {max_items} folders" if max_items else '') + (f", cursor {cursor_file}" if cursor_file else ''))
     logger.log_info(f"{'Recursively s' if recurse else 'S'}earching '{path}' for movie files.")
     logger.log_info("\n")
     
     # Process the directory
-    process_folder(path, recurse, demo, logger)
+    catalog = LibraryCatalog(catalog_file) if catalog_file else None
+    metrics = get_metrics()
+    metrics.start(os.path.splitext(os.path.basename(__file__))[0], metrics_file, metrics_interval)
+    progress = None
+    success = False
+    try:
+        orphan_index = None
+        if orphan_roots:
+            orphan_index = SubtitleIndex(logger)
+            for orphan_root in orphan_roots:
+                orphan_index.scan(orphan_root, path_filter)
+        progress = ProgressDisplay(silent) if show_progress else None
+        if progress and progress.enabled:
+            progress.start(getattr(logger, 'console_handler', None))
+        process_folder(path, recurse, demo, logger, catalog, scheduler, path_filter, progress, orphan_index)
+        success = True
+    finally:
+        if progress:
+            progress.stop()
+        if probe_supervisor:
+            probe_supervisor.close()
+        if throttled_fs:
+            logger.log_info(f"I/O limits delayed the run by {throttled_fs.waited():.1f}s")
+        if catalog:
+            catalog.close()
+        metrics.finish(success)
     
 def parse_args():
     """
@@ -140,9 +303,25 @@ def parse_args():
     parser.add_argument('--log_to_file', '--log', '-L', action='store_true', help="Enable logging to a file.")
     parser.add_argument('--logfile', '-F', type=str, default='', help="Specify log file name.")
     parser.add_argument('--loglevel', '-LL', type=str, choices=['DEBUG', 'INFO', 'ERROR'], default='INFO', help="Set the logging level (DEBUG, INFO, ERROR).")
+    parser.add_argument('--logbuffer', '-LB', action='store_true', help="Buffer the log file in memory and rotate to gzip-compressed segments kept by total size/age (for long DEBUG runs).")
+    parser.add_argument('--log-retention-mb', type=float, default=512, help="Buffered log: maximum total size of rotated segments in MB (default 512, 0 = unlimited).")
+    parser.add_argument('--log-retention-days', type=float, default=None, help="Buffered log: maximum age of rotated segments in days.")
     parser.add_argument('--silent', '-S', action='store_true', help="Suppress console output.")
     parser.add_argument('--demo', '-D', action='store_true', help="Enable demo mode where no actual changes are made.")
     parser.add_argument('--recurse', '-R', action='store_true', help="Recursively search subfolders for movie files.")
+    add_path_filter_arguments(parser)
+    add_fs_arguments(parser)
+    add_probe_arguments(parser)
+    add_throttle_arguments(parser)
+    parser.add_argument('--order', '-O', choices=WorkScheduler.ORDERS, default='listdir', help="Order of the movie folders: listdir (as found), newest/oldest (folder modification time) or name.")
+    parser.add_argument('--max-seconds', type=float, default=None, help="Stop cleanly after this many seconds, the crawl included (a sorted order stops collecting folders once they are spent).")
+    parser.add_argument('--max-items', type=int, default=None, help="Stop cleanly after processing this many movie folders.")
+    parser.add_argument('--cursor', type=str, default=None, help="Persist the folders done in this file, so the next run continues where this one stopped.")
+    parser.add_argument('--metrics-file', '-M', type=str, default=None, help="Write run metrics to this file in Prometheus textfile-collector format.")
+    parser.add_argument('--metrics-interval', type=float, default=30.0, help="Seconds between metrics file updates during the run (default 30).")
+    parser.add_argument('--progress', '-P', action='store_true', help="Show a live status line with folders/s, probes/s, bytes copied, elapsed time and ETA (terminal only).")
+    parser.add_argument('--orphan-index', '-OI', action='append', default=[], metavar='PATH', help="Index the stray subtitles below this folder (e.g. the library root, repeatable) in one scan, and give movies with no subtitle their best match.")
+    parser.add_argument('--catalog', '-C', type=str, default=None, help="Update the SQLite library catalog at this path (query it with library_catalog.py).")
     
     return parser.parse_args()
 
@@ -154,4 +333,30 @@ if __name__ == '__main__':
          loglevel=args.loglevel,
          silent=args.silent,
          demo=args.demo,
-         recurse=args.recurse)
+         recurse=args.recurse,
+         catalog_file=args.catalog,
+         metrics_file=args.metrics_file,
+         metrics_interval=args.metrics_interval,
+         log_buffered=args.logbuffer,
+         log_retention_mb=args.log_retention_mb,
+         log_retention_days=args.log_retention_days,
+         order=args.order,
+         max_seconds=args.max_seconds,
+         max_items=args.max_items,
+         cursor_file=args.cursor,
+         excludes=args.exclude,
+         includes=args.include,
+         max_depth=args.max_depth,
+         default_excludes=not args.no_default_excludes,
+         snapshot_file=args.snapshot,
+         latency_ms=args.latency_ms,
+         probe_latency_ms=args.probe_latency_ms,
+         show_progress=args.progress,
+         probe_timeout=args.probe_timeout,
+         probe_memory_mb=args.probe_memory_mb,
+         quarantine_file=args.quarantine,
+         max_meta_ops=args.max_meta_ops,
+         max_probes=args.max_probes,
+         max_copy_mbps=args.max_copy_mbps,
+         adaptive_io=args.adaptive_io,
+         orphan_roots=args.orphan_index)
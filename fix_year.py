@@ -1,8 +1,17 @@
 import os
 import re
+import queue
 import argparse
 import logging
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from library_catalog import LibraryCatalog
+from run_metrics import get_metrics
+from misc_utils import PathFilter, add_path_filter_arguments
+from fs_backend import get_fs, add_fs_arguments, configure_fs
+from title_index import TitleIndex
+from io_throttle import add_throttle_arguments, configure_throttle
 
 class LoggerClass:
     """
@@ -90,17 +99,17 @@ def validate_folder_path(folder_path, logger):
     Returns:
         bool: True if the folder path is valid, False otherwise.
     """
-    if not os.path.exists(folder_path):
+    if not get_fs().exists(folder_path):
         logger.log_message(f"The folder path [{folder_path}] does not exist.", logging.ERROR)
         return False
     
-    if not os.path.isdir(folder_path):
+    if not get_fs().isdir(folder_path):
         logger.log_message(f"The path [{folder_path}] is not a directory.", logging.ERROR)
         return False
     
     return True
 
-def analyze_folder_name(folder_name, use_rest_of_name, logger):
+def analyze_folder_name(folder_name, use_rest_of_name, logger, title_index=None):
     """
     Analyzes and formats the folder name based on year patterns.
 
@@ -108,9 +117,10 @@ def analyze_folder_name(folder_name, use_rest_of_name, logger):
         folder_name (str): The folder name to analyze.
         use_rest_of_name (bool): Flag to use the rest of the name after the year.
         logger (LoggerClass): The logger instance for logging messages.
+        title_index (TitleIndex): Optional offline title index giving the year of folders with none in their name.
 
     Returns:
-        str: The new folder name if a year pattern is found, None otherwise.
+        str: The new folder name if a year pattern is found (or the year is found in the title index), None otherwise.
     """
     logger.log_message(f"Analyzing folder name: [{folder_name}]", logging.DEBUG)
 
@@ -128,7 +138,7 @@ def analyze_folder_name(folder_name, use_rest_of_name, logger):
         logger.log_message(f"Match found: year_match={year_match} in '{folder_name}'", logging.DEBUG)
     else:
         logger.log_message(f"No year pattern found in '{folder_name}'.", logging.DEBUG)
-        return None
+        return resolve_folder_name(folder_name, use_rest_of_name, logger, title_index) if title_index else None
 
     # Extract and keep the original 'before_year' and 'after_year' logic
     before_year = (folder_name[:year_start-2].replace('.', ' ') +  
@@ -148,6 +158,36 @@ def analyze_folder_name(folder_name, use_rest_of_name, logger):
     logger.log_message(f"New folder name: [{new_folder_name}]" if new_folder_name != folder_name else "--->>> Folder not changed <<<---", logging.DEBUG)
     return new_folder_name if new_folder_name != folder_name else None
 
+def resolve_folder_name(folder_name, use_rest_of_name, logger, title_index):
+    """
+    Formats a folder name with no year, taking the year from the title index.
+
+    Args:
+        folder_name (str): The folder name to analyze.
+        use_rest_of_name (bool): Flag to use the release description after the title.
+        logger (LoggerClass): The logger instance for logging messages.
+        title_index (TitleIndex): The offline title index.
+
+    Returns:
+        str: The new folder name if the title is found in the index, None otherwise.
+    """
+    try:
+        resolved = title_index.resolve_folder(folder_name)
+    except ValueError as e:
+        logger.log_message(f"-- Title index lookup of '{folder_name}' failed: {e}", logging.ERROR)
+        return None
+    if not resolved:
+        logger.log_message(f"-- Title of '{folder_name}' not found in the title index.", logging.DEBUG)
+        return None
+    title, year, release = resolved
+    logger.log_message(f"-- Year {year} of [{title}] found in the title index.", logging.DEBUG)
+
+    new_folder_name = f"{title} ({year})"
+    if use_rest_of_name and release:
+        new_folder_name += f" [{release}]"
+    logger.log_message(f"New folder name: [{new_folder_name}]", logging.DEBUG)
+    return new_folder_name if new_folder_name != folder_name else None
+
 def rename_folder(folder_path, old_name, new_name, demo, logger):
     """
     Renames a folder from old_name to new_name.
@@ -158,6 +198,9 @@ def rename_folder(folder_path, old_name, new_name, demo, logger):
         new_name (str): The new folder name.
         demo (bool): Flag to enable demo mode where no actual changes are made.
         logger (LoggerClass): The logger instance for logging messages.
+
+    Returns:
+        str: The new path of the folder if it was renamed, None otherwise.
     """
     old_path = os.path.join(folder_path, old_name)
     new_path = os.path.join(folder_path, new_name)
@@ -165,14 +208,16 @@ def rename_folder(folder_path, old_name, new_name, demo, logger):
 
     logger.log_message(f'Renaming "{old_name}" to "{new_name}" in [{folder_path}]', logging.INFO)
 
-    while os.path.exists(new_path):
+    while get_fs().exists(new_path):
         new_path = os.path.join(folder_path, f"{new_name} ({counter})")
         counter += 1
 
     if not demo:
         try:
-            os.rename(old_path, new_path)
+            get_fs().rename(old_path, new_path)
+            get_metrics().inc('renames')
             logger.log_message(f"Renamed [{os.path.basename(new_path)}]", logging.INFO)
+            return new_path
         except PermissionError:
             logger.log_message(f"Permission denied when renaming [{old_name}] to [{new_name}].", logging.ERROR)
         except OSError as e:
@@ -181,6 +226,7 @@ def rename_folder(folder_path, old_name, new_name, demo, logger):
             logger.log_message(f"An unexpected error occurred: {e}", logging.ERROR)
     else:
         logger.log_message(f"Debug mode: Rename [{old_name}] => [{new_name}]", logging.DEBUG)
+    return None
 
 def contains_movie_file(folder_path):
     """
@@ -195,13 +241,13 @@ def contains_movie_file(folder_path):
     # Define movie file extensions
     movie_extensions = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.mpg'}
     
-    for file_name in os.listdir(folder_path):
-        if os.path.isfile(os.path.join(folder_path, file_name)):
+    for file_name, is_dir in get_fs().scandir(folder_path):
+        if not is_dir:
             if any(file_name.lower().endswith(ext) for ext in movie_extensions):
                 return True
     return False
 
-def process_folder(folder_path, use_rest_of_name, demo, logger, recurse):
+def process_folder(folder_path, use_rest_of_name, demo, logger, recurse, catalog=None, path_filter=None, depth=1, title_index=None):
     """
     Processes the folder to rename subdirectories containing movie files.
 
@@ -211,30 +257,143 @@ def process_folder(folder_path, use_rest_of_name, demo, logger, recurse):
         demo (bool): Flag to enable demo mode where no actual changes are made.
         logger (LoggerClass): The logger instance for logging messages.
         recurse (bool): Flag to enable recursive processing of subdirectories.
+        catalog (LibraryCatalog): Optional catalog to record the movie folders in.
+        path_filter (PathFilter): Optional filter pruning folders by name and depth before they are opened.
+        depth (int): Level of the subfolders of folder_path, 1 being the children of the root.
+        title_index (TitleIndex): Optional offline title index giving the year of folders with none in their name.
     """
     # Collect directories to process in a list
     directories_to_process = []
 
     # First pass: Collect all directories and check if they contain movie files
-    for folder_name in os.listdir(folder_path):
+    for folder_name, is_dir in get_fs().scandir(folder_path):
         subfolder_path = os.path.join(folder_path, folder_name)
 
-        if os.path.isdir(subfolder_path):
-            if contains_movie_file(subfolder_path):
+        if is_dir:
+            if path_filter and not path_filter.allows(folder_name, depth):
+                logger.log_message(f"Skipping excluded folder [{subfolder_path}]", logging.DEBUG)
+                continue
+            get_metrics().inc('folders_scanned')
+            if (not path_filter or path_filter.includes_folder(folder_name)) and contains_movie_file(subfolder_path):
                 logger.log_message(f"Folder to process: [{folder_name}]", logging.DEBUG)
                 directories_to_process.append((folder_path, folder_name))
 
             if recurse:
                 # Recursively process subfolders
-                process_folder(subfolder_path, use_rest_of_name, demo, logger, recurse)
+                process_folder(subfolder_path, use_rest_of_name, demo, logger, recurse, catalog, path_filter, depth + 1, title_index)
     
     # Second pass: Process collected directories
     for parent_folder, folder_name in directories_to_process:
-        new_folder_name = analyze_folder_name(folder_name, use_rest_of_name, logger)
+        old_path = os.path.join(parent_folder, folder_name)
+        new_path = None
+        new_folder_name = analyze_folder_name(folder_name, use_rest_of_name, logger, title_index)
         if new_folder_name:
-            rename_folder(parent_folder, folder_name, new_folder_name, demo, logger)
+            new_path = rename_folder(parent_folder, folder_name, new_folder_name, demo, logger)
+        if catalog:
+            if new_path:
+                catalog.rename_folder(old_path, new_path)
+            catalog.upsert_movie(new_path or old_path)
+
+class _FolderNode:
+    """
+    A folder of a parallel run: the movie folders found in it (with their new names) and the number of
+    tasks still running for it (its own scan, then one per subfolder being processed).
+    """
 
-def main(folder_path, use_rest_of_name, demo, log, log_file, loglevel, silent, recurse):
+    __slots__ = ('path', 'parent', 'depth', 'pending', 'movie_folders')
+
+    def __init__(self, path, parent, depth):
+        self.path = path
+        self.parent = parent
+        self.depth = depth
+        self.pending = 1
+        self.movie_folders = []
+
+def process_folder_parallel(folder_path, use_rest_of_name, demo, logger, recurse, catalog=None, path_filter=None, workers=8, title_index=None):
+    """
+    Processes the folder like process_folder, with folder scans, name analysis and renames spread over a pool of threads.
+
+    Each folder is scanned by its own task, which analyzes the names of the movie folders found and queues the scans
+    of the subfolders. Once a folder and everything below it are done, its movie folders are renamed one at a time
+    (renames in one parent are serialized, so collisions are handled as in a sequential run), while other parents
+    are renamed concurrently. A folder is therefore only renamed after all its children. Catalog updates are applied
+    by the calling thread, in the order the renames are made.
+
+    Args:
+        folder_path (str): The path of the parent folder.
+        use_rest_of_name (bool): Flag to use the rest of the name after the year.
+        demo (bool): Flag to enable demo mode where no actual changes are made.
+        logger (LoggerClass): The logger instance for logging messages.
+        recurse (bool): Flag to enable recursive processing of subdirectories.
+        catalog (LibraryCatalog): Optional catalog to record the movie folders in.
+        path_filter (PathFilter): Optional filter pruning folders by name and depth before they are opened.
+        workers (int): Number of threads.
+        title_index (TitleIndex): Optional offline title index giving the year of folders with none in their name.
+    """
+    lock = threading.Lock()
+    catalog_updates = queue.SimpleQueue()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fix_year')
+
+    def release(node):
+        # one of the tasks of the node is done, once none are left its movie folders can be renamed
+        with lock:
+            node.pending -= 1
+            ready = node.pending == 0
+        if ready:
+            executor.submit(rename_movie_folders, node)
+
+    def scan(node):
+        try:
+            for folder_name, is_dir in get_fs().scandir(node.path):
+                if not is_dir:
+                    continue
+                subfolder_path = os.path.join(node.path, folder_name)
+                if path_filter and not path_filter.allows(folder_name, node.depth):
+                    logger.log_message(f"Skipping excluded folder [{subfolder_path}]", logging.DEBUG)
+                    continue
+                get_metrics().inc('folders_scanned')
+                if (not path_filter or path_filter.includes_folder(folder_name)) and contains_movie_file(subfolder_path):
+                    logger.log_message(f"Folder to process: [{folder_name}]", logging.DEBUG)
+                    node.movie_folders.append((folder_name, analyze_folder_name(folder_name, use_rest_of_name, logger, title_index)))
+
+                if recurse:
+                    with lock:
+                        node.pending += 1
+                    executor.submit(scan, _FolderNode(subfolder_path, node, node.depth + 1))
+        except Exception as e:
+            logger.log_message(f"An error occurred while scanning [{node.path}]: {e}", logging.ERROR)
+        finally:
+            release(node)
+
+    def rename_movie_folders(node):
+        try:
+            for folder_name, new_folder_name in node.movie_folders:
+                new_path = rename_folder(node.path, folder_name, new_folder_name, demo, logger) if new_folder_name else None
+                catalog_updates.put((os.path.join(node.path, folder_name), new_path))
+        except Exception as e:
+            logger.log_message(f"An error occurred while renaming in [{node.path}]: {e}", logging.ERROR)
+        finally:
+            if node.parent:
+                release(node.parent)
+            else:
+                catalog_updates.put(None)
+
+    try:
+        executor.submit(scan, _FolderNode(folder_path, None, 1))
+        # the catalog connection belongs to this thread: apply the updates here until the root folder is done
+        while (update := catalog_updates.get()) is not None:
+            old_path, new_path = update
+            if catalog:
+                if new_path:
+                    catalog.rename_folder(old_path, new_path)
+                catalog.upsert_movie(new_path or old_path)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def main(folder_path, use_rest_of_name, demo, log, log_file, loglevel, silent, recurse, catalog_file=None, metrics_file=None, metrics_interval=30.0,
+         excludes=None, includes=None, max_depth=None, default_excludes=True,
+         snapshot_file=None, latency_ms=0.0, probe_latency_ms=0.0, workers=1, title_index_file=None,
+         max_meta_ops=None, adaptive_io=False):
     """
     Main function to initiate the renaming process based on user inputs.
 
@@ -247,6 +406,20 @@ def main(folder_path, use_rest_of_name, demo, log, log_file, loglevel, silent, r
         loglevel (str): Logging level (DEBUG, INFO, ERROR).
         silent (bool): Flag to suppress console output.
         recurse (bool): Flag to enable recursive processing of subdirectories.
+        catalog_file (str): Path of the SQLite library catalog to update, if any.
+        metrics_file (str): Path of the Prometheus textfile-collector file to write, if any.
+        metrics_interval (float): Seconds between metrics file updates during the run.
+        excludes (list[str]): Glob patterns of folder names to skip.
+        includes (list[str]): Glob patterns of folder names to rename (others are only traversed).
+        max_depth (int): Deepest folder level traversed.
+        default_excludes (bool): Whether to skip NAS metadata and extras folders by default.
+        snapshot_file (str): Replay against this library snapshot instead of the real filesystem.
+        latency_ms (float): Snapshot mode: latency added to every filesystem operation.
+        probe_latency_ms (float): Snapshot mode: latency added to every probe.
+        workers (int): Number of threads scanning and renaming folders in parallel (1 = sequential).
+        title_index_file (str): Offline title index (see title_index.py) giving the year of folders with none in their name.
+        max_meta_ops (float): Limit of filesystem metadata operations (listings, stats, renames) per second.
+        adaptive_io (bool): Lower the limit while the filesystem latency is above its baseline.
     """
     logger = LoggerClass(log, log_file, loglevel, silent, demo)
 
@@ -262,11 +435,22 @@ def main(folder_path, use_rest_of_name, demo, log, log_file, loglevel, silent, r
     logger.log_message(f"Parameters -> loglevel: {loglevel}", logging.DEBUG)
     logger.log_message(f"Parameters -> silent: {silent}", logging.DEBUG )
     logger.log_message(f"Parameters -> recurse: {recurse}", logging.DEBUG)
+    logger.log_message(f"Parameters -> catalog: {catalog_file}", logging.DEBUG)
+    logger.log_message(f"Parameters -> metrics_file: {metrics_file}", logging.DEBUG)
+    logger.log_message(f"Parameters -> excludes: {excludes} (default excludes: {default_excludes})", logging.DEBUG)
+    logger.log_message(f"Parameters -> includes: {includes}", logging.DEBUG)
+    logger.log_message(f"Parameters -> max_depth: {max_depth}", logging.DEBUG)
+    logger.log_message(f"Parameters -> snapshot: {snapshot_file} (latency {latency_ms} ms)", logging.DEBUG)
+    logger.log_message(f"Parameters -> workers: {workers}", logging.DEBUG)
+    logger.log_message(f"Parameters -> title_index: {title_index_file}", logging.DEBUG)
+    logger.log_message(f"Parameters -> max_meta_ops: {max_meta_ops} (adaptive: {adaptive_io})", logging.DEBUG)
    
     if not folder_path:
         folder_path = os.getcwd()
     folder_path = os.path.abspath(folder_path)
 
+    configure_fs(snapshot_file, latency_ms, probe_latency_ms)
+    throttled_fs = configure_throttle(max_meta_ops, adaptive=adaptive_io, logger=logger)
     if not validate_folder_path(folder_path, logger):
         return
     logger.log_message(f"folder_path: {folder_path}", logging.INFO)
@@ -280,14 +464,50 @@ def main(folder_path, use_rest_of_name, demo, log, log_file, loglevel, silent, r
         logger.log_message(f"Logging enabled, logging level {loglevel}", logging.INFO)
     if demo:
         logger.log_message("Demo mode enabled", logging.INFO)
+    if snapshot_file:
+        logger.log_message(f"Replaying snapshot {snapshot_file} (changes are kept in memory)", logging.INFO)
     if not use_rest_of_name:
         logger.log_message("Remove release description when found (resolution, release group, language, etc)", logging.INFO)
     if silent:
         logger.log_message("Silent mode: Console output suppressed", logging.INFO)
     if recurse:
         logger.log_message("Traverse mode: Traverse through subfolders", logging.INFO)
-
-    process_folder(folder_path, use_rest_of_name, demo, logger, recurse)
+    if catalog_file:
+        logger.log_message(f"Updating library catalog: {catalog_file}", logging.INFO)
+    if metrics_file:
+        logger.log_message(f"Writing metrics to: {metrics_file}", logging.INFO)
+    if workers > 1:
+        logger.log_message(f"Parallel mode: {workers} workers", logging.INFO)
+    if throttled_fs:
+        logger.log_message(f"I/O limit: {throttled_fs.meta.rate:g} metadata ops/s" + (" (adaptive)" if adaptive_io else ''), logging.INFO)
+    title_index = None
+    if title_index_file:
+        try:
+            title_index = TitleIndex(title_index_file)
+        except (OSError, ValueError) as e:
+            logger.log_message(f"Could not open title index [{title_index_file}]: {e}", logging.ERROR)
+            return
+        logger.log_message(f"Years of folders with none taken from title index: {title_index_file} ({title_index.count} titles)", logging.INFO)
+
+    path_filter = PathFilter(excludes, includes, max_depth, default_excludes)
+    catalog = LibraryCatalog(catalog_file) if catalog_file else None
+    metrics = get_metrics()
+    metrics.start(os.path.splitext(os.path.basename(__file__))[0], metrics_file, metrics_interval)
+    success = False
+    try:
+        if workers > 1:
+            process_folder_parallel(folder_path, use_rest_of_name, demo, logger, recurse, catalog, path_filter, workers, title_index)
+        else:
+            process_folder(folder_path, use_rest_of_name, demo, logger, recurse, catalog, path_filter, title_index=title_index)
+        success = True
+    finally:
+        if title_index:
+            title_index.close()
+        if throttled_fs:
+            logger.log_message(f"I/O limit delayed the run by {throttled_fs.waited():.1f}s", logging.INFO)
+        if catalog:
+            catalog.close()
+        metrics.finish(success)
 
     logger.log_message("\n", logging.INFO)
     logger.log_message("*" * 80, logging.INFO)
@@ -303,6 +523,18 @@ if __name__ == "__main__":
     parser.add_argument('--loglevel', '-LL', choices=['DEBUG', 'INFO', 'ERROR'], default='INFO', help="Set logging level")
     parser.add_argument('--silent', '-H', action='store_true', help="Silent/hush mode: suppress console output of log information")
     parser.add_argument('--recurse', '-R', action='store_true', help="Recursive mode: traverses through subfolders")
+    add_path_filter_arguments(parser)
+    add_fs_arguments(parser)
+    parser.add_argument('--metrics-file', '-M', type=str, help="Write run metrics to this file in Prometheus textfile-collector format")
+    parser.add_argument('--metrics-interval', type=float, default=30.0, help="Seconds between metrics file updates during the run")
+    parser.add_argument('--catalog', '-C', type=str, help="Update the SQLite library catalog at this path (query it with library_catalog.py)")
+    parser.add_argument('--title-index', '-T', type=str, help="Offline title index built with title_index.py: folders with no year in the name get the year of their title")
+    add_throttle_arguments(parser, meta_only=True)
+    parser.add_argument('--workers', '-W', type=int, default=1, help="Scan and rename folders with this many threads (renames stay serialized within each parent folder)")
 
     args = parser.parse_args()
-    main(args.folder_path, not args.nodesc, args.demo, args.log, args.logfile, args.loglevel, args.silent, args.recurse)
+    main(args.folder_path, not args.nodesc, args.demo, args.log, args.logfile, args.loglevel, args.silent, args.recurse, args.catalog,
+         args.metrics_file, args.metrics_interval,
+         args.exclude, args.include, args.max_depth, not args.no_default_excludes,
+         args.snapshot, args.latency_ms, args.probe_latency_ms, args.workers, args.title_index,
+         args.max_meta_ops, args.adaptive_io)
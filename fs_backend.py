@@ -0,0 +1,478 @@
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+
+from media_probe import probe_text_tracks
+
+
+MOVIE_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.mpg'}
+SNAPSHOT_VERSION = 1
+
+
+class LocalFS:
+    """
+    LocalFS performs the filesystem operations of the tools on the real filesystem.
+
+    Every directory listing, stat, copy, rename and probe made by fix_subs and fix_year goes through the
+    current backend (see get_fs), so the same code can run against an in-memory tree or a recorded snapshot.
+    """
+
+    name = 'local'
+
+    def __init__(self, probe_supervisor=None):
+        """
+        Initialize the backend.
+
+        Args:
+            probe_supervisor (ProbeSupervisor): Runs the MediaInfo probes in a supervised subprocess, None to run them in-process.
+        """
+        self.probe_supervisor = probe_supervisor
+
+    def listdir(self, path: str) -> list[str]:
+        return os.listdir(path)
+
+    def scandir(self, path: str) -> list[tuple[str, bool]]:
+        """
+        List the directories and regular files of a directory, without a stat call per entry where the OS provides it.
+
+        Symlinks are followed like os.path.isdir/isfile do. Entries that are neither (dangling symlinks, sockets,
+        devices) are left out, and so are symlinks to a directory the path is already inside of, so a symlink
+        cycle cannot make a walk loop.
+
+        Returns:
+            list[tuple[str, bool]]: (name, is_dir) of each entry, in directory order.
+        """
+        listing = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if entry.is_symlink() and self._is_ancestor(entry.path, path):
+                            continue
+                        listing.append((entry.name, True))
+                    elif entry.is_file():
+                        listing.append((entry.name, False))
+                except OSError:
+                    continue
+        return listing
+
+    @staticmethod
+    def _is_ancestor(link_path: str, path: str) -> bool:
+        """Check if a symlinked directory is path itself or one of the directories above it (by device and inode)."""
+        target = os.stat(link_path)
+        path = os.path.abspath(path)
+        while True:
+            st = os.stat(path)
+            if (st.st_dev, st.st_ino) == (target.st_dev, target.st_ino):
+                return True
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def isdir(self, path: str) -> bool:
+        return os.path.isdir(path)
+
+    def isfile(self, path: str) -> bool:
+        return os.path.isfile(path)
+
+    def getsize(self, path: str) -> int:
+        return os.path.getsize(path)
+
+    def getmtime(self, path: str) -> float:
+        return os.path.getmtime(path)
+
+    def access(self, path: str, mode: int) -> bool:
+        return os.access(path, mode)
+
+    def copy2(self, src: str, dst: str):
+        shutil.copy2(src, dst)
+
+    def rename(self, src: str, dst: str):
+        os.rename(src, dst)
+
+    def remove(self, path: str):
+        os.remove(path)
+
+    def open(self, path: str, mode: str = 'rb'):
+        return open(path, mode)
+
+    def probe_text_languages(self, path: str, logger=None) -> list[str]:
+        """
+        Get the languages of the text tracks of a movie file: container headers are read natively for
+        Matroska and MP4, other containers (or headers that cannot be parsed) are analyzed with MediaInfo.
+
+        Args:
+            path (str): Path of the movie file.
+            logger (LoggerClass): Optional logger for debug messages.
+
+        Returns:
+            list[str]: Lower-cased language codes of the text tracks (empty string for tracks with no language).
+        """
+        text_tracks = probe_text_tracks(path)
+        if text_tracks is not None:
+            return [language for _, language in text_tracks]
+
+        if logger:
+            logger.log_debug(f"{os.path.basename(path)}: probing with MediaInfo")
+        if self.probe_supervisor:
+            return self.probe_supervisor.probe(path, logger)
+        from pymediainfo import MediaInfo  # only needed here, so tools that never probe (fix_year) don't require it
+        media_info = MediaInfo.parse(path)
+        return [(track.language or '').lower() for track in media_info.tracks if track.track_type == 'Text']
+
+
+class _MemoryWriter(io.BytesIO):
+    """Writable in-memory file storing its content in the MemoryFS node when closed."""
+
+    def __init__(self, memory_fs, path: str):
+        super().__init__()
+        self.memory_fs = memory_fs
+        self.path = path
+
+    def close(self):
+        if not self.closed:
+            self.memory_fs._add(self.path, is_dir=False, size=len(self.getvalue()), mtime=time.time(), data=self.getvalue())
+        super().close()
+
+
+class MemoryFS:
+    """
+    MemoryFS keeps a directory tree in memory: names, sizes, mtimes, probed text tracks and optionally
+    file contents. Changes (copies, renames, written files) only modify the in-memory tree.
+
+    An optional latency is slept on every operation (and a separate one on every probe), to reproduce
+    the behavior of a slow network share (SMB/NFS) locally.
+
+    Attributes:
+        latency (float): Seconds added to every metadata operation.
+        probe_latency (float): Seconds added to every probe.
+    """
+
+    name = 'memory'
+
+    def __init__(self, latency: float = 0.0, probe_latency: float = 0.0):
+        """
+        Initialize an empty tree.
+
+        Args:
+            latency (float): Seconds added to every metadata operation.
+            probe_latency (float): Seconds added to every probe.
+        """
+        self.latency = latency
+        self.probe_latency = probe_latency
+        # normalized path -> node dict(is_dir, size, mtime, tracks, data, children)
+        self.nodes = {}
+
+    def add_dir(self, path: str, mtime: float = None):
+        """
+        Add a directory (and its missing parents) to the tree.
+        """
+        self._add(path, is_dir=True, size=0, mtime=mtime if mtime is not None else time.time())
+
+    def add_file(self, path: str, size: int = None, mtime: float = None, tracks: list[str] = None, data: bytes = None):
+        """
+        Add a file (and its missing parent directories) to the tree.
+
+        Args:
+            path (str): Path of the file.
+            size (int): Size of the file, len(data) when not given.
+            mtime (float): Modification time, now when not given.
+            tracks (list[str]): Languages of the text tracks, for movie files.
+            data (bytes): Content of the file, when it needs to be read.
+        """
+        self._add(path, is_dir=False, size=size if size is not None else len(data or b''),
+                  mtime=mtime if mtime is not None else time.time(), tracks=tracks, data=data)
+
+    def listdir(self, path: str) -> list[str]:
+        return list(self._dir(path)['children'])
+
+    def scandir(self, path: str) -> list[tuple[str, bool]]:
+        node = self._dir(path)
+        path = os.path.normpath(path)
+        return [(name, self.nodes[os.path.join(path, name)]['is_dir']) for name in node['children']]
+
+    def exists(self, path: str) -> bool:
+        return self._get(path) is not None
+
+    def isdir(self, path: str) -> bool:
+        node = self._get(path)
+        return node is not None and node['is_dir']
+
+    def isfile(self, path: str) -> bool:
+        node = self._get(path)
+        return node is not None and not node['is_dir']
+
+    def getsize(self, path: str) -> int:
+        return self._node(path)['size']
+
+    def getmtime(self, path: str) -> float:
+        return self._node(path)['mtime']
+
+    def access(self, path: str, mode: int) -> bool:
+        return self._get(path) is not None
+
+    def copy2(self, src: str, dst: str):
+        node = self._node(src)
+        if node['is_dir']:
+            raise IsADirectoryError(src)
+        if self.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        self._dir(os.path.dirname(dst))
+        self._add(dst, is_dir=False, size=node['size'], mtime=node['mtime'], tracks=node['tracks'], data=node['data'])
+
+    def rename(self, src: str, dst: str):
+        src, dst = os.path.normpath(src), os.path.normpath(dst)
+        self._node(src)
+        if self._get(dst) is not None:
+            raise FileExistsError(dst)
+        parent = self._dir(os.path.dirname(dst))
+
+        moved = {path: self.nodes.pop(path) for path in list(self._subtree(src))}
+        for path, node in moved.items():
+            self.nodes[dst + path[len(src):]] = node
+        del self._dir(os.path.dirname(src))['children'][os.path.basename(src)]
+        parent['children'][os.path.basename(dst)] = None
+        self._touch(os.path.dirname(src))
+        self._touch(os.path.dirname(dst))
+
+    def remove(self, path: str):
+        path = os.path.normpath(path)
+        if self._node(path)['is_dir']:
+            raise IsADirectoryError(21, 'Is a directory', path)
+        del self.nodes[path]
+        del self._dir(os.path.dirname(path))['children'][os.path.basename(path)]
+        self._touch(os.path.dirname(path))
+
+    def open(self, path: str, mode: str = 'rb'):
+        self._sleep(self.latency)
+        if 'w' in mode:
+            self._dir(os.path.dirname(path))
+            return _MemoryWriter(self, os.path.normpath(path))
+        node = self._node(path)
+        if node['data'] is None:
+            raise OSError(f"Content of [{path}] is not available in the {self.name} filesystem")
+        return io.BytesIO(node['data'])
+
+    def probe_text_languages(self, path: str, logger=None) -> list[str]:
+        self._sleep(self.probe_latency)
+        return list(self._node(path)['tracks'] or [])
+
+    def _add(self, path: str, is_dir: bool, size: int, mtime: float, tracks: list[str] = None, data: bytes = None):
+        path = os.path.normpath(path)
+        parent_path, name = os.path.split(path)
+        if name and parent_path != path and parent_path not in self.nodes:
+            self._add(parent_path, is_dir=True, size=0, mtime=mtime)
+        existing = self.nodes.get(path)
+        children = existing['children'] if existing and existing['is_dir'] and is_dir else {}
+        self.nodes[path] = {'is_dir': is_dir, 'size': size, 'mtime': mtime, 'tracks': tracks, 'data': data,
+                            'children': children if is_dir else None}
+        if name and parent_path in self.nodes and existing is None:
+            self.nodes[parent_path]['children'][name] = None
+            self.nodes[parent_path]['mtime'] = mtime
+
+    def _subtree(self, path: str):
+        """Yield the normalized paths of a node and all its descendants."""
+        yield path
+        node = self.nodes[path]
+        if node['is_dir']:
+            for name in node['children']:
+                yield from self._subtree(os.path.join(path, name))
+
+    def _touch(self, path: str):
+        node = self.nodes.get(os.path.normpath(path))
+        if node:
+            node['mtime'] = time.time()
+
+    def _get(self, path: str) -> dict | None:
+        self._sleep(self.latency)
+        return self.nodes.get(os.path.normpath(path))
+
+    def _node(self, path: str) -> dict:
+        node = self._get(path)
+        if node is None:
+            raise FileNotFoundError(2, 'No such file or directory', path)
+        return node
+
+    def _dir(self, path: str) -> dict:
+        node = self._node(path)
+        if not node['is_dir']:
+            raise NotADirectoryError(20, 'Not a directory', path)
+        return node
+
+    @staticmethod
+    def _sleep(seconds: float):
+        if seconds:
+            time.sleep(seconds)
+
+
+class SnapshotFS(MemoryFS):
+    """
+    SnapshotFS replays a library recorded with `fs_backend.py record`: the tree is loaded in memory and
+    the tools run against it as if it were the real share (with optional injected latency).
+    File contents are not recorded, reading a file raises OSError.
+    """
+
+    name = 'snapshot'
+
+    def __init__(self, snapshot_file: str, latency: float = 0.0, probe_latency: float = 0.0):
+        """
+        Load a snapshot.
+
+        Args:
+            snapshot_file (str): Path of the snapshot file.
+            latency (float): Seconds added to every metadata operation.
+            probe_latency (float): Seconds added to every probe.
+        """
+        super().__init__(latency, probe_latency)
+        with gzip.open(snapshot_file, 'rt', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {snapshot.get('version')} in [{snapshot_file}]")
+
+        self.root = os.path.normpath(snapshot['root'])
+        self.add_dir(self.root, snapshot['mtime'])
+        for rel_path, is_dir, size, mtime, tracks in snapshot['entries']:
+            path = os.path.join(self.root, *rel_path.split('/'))
+            if is_dir:
+                self.add_dir(path, mtime)
+            else:
+                self.add_file(path, size=size, mtime=mtime, tracks=tracks)
+
+
+def record_snapshot(root: str, snapshot_file: str, probe: bool = True, progress=None) -> int:
+    """
+    Record the metadata of a directory tree (names, types, sizes, mtimes and the text tracks of movie files)
+    into a gzip-compressed JSON snapshot.
+
+    Args:
+        root (str): The directory to record.
+        snapshot_file (str): Path of the snapshot file to write.
+        probe (bool): Whether to probe the text tracks of movie files.
+        progress (Callable): Optional callback called with the number of entries recorded so far.
+
+    Returns:
+        int: Number of entries recorded.
+    """
+    root = os.path.abspath(root)
+    local_fs = LocalFS()
+    entries = []
+
+    def walk(path: str, rel_path: str):
+        for name, is_dir in local_fs.scandir(path):
+            full_path = os.path.join(path, name)
+            rel = f"{rel_path}/{name}" if rel_path else name
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            tracks = None
+            if not is_dir and probe and os.path.splitext(name)[1].lower() in MOVIE_EXTENSIONS and st.st_size > 0:
+                try:
+                    tracks = local_fs.probe_text_languages(full_path)
+                except Exception:
+                    tracks = None
+            entries.append([rel, is_dir, 0 if is_dir else st.st_size, st.st_mtime, tracks])
+            if progress and len(entries) % 1000 == 0:
+                progress(len(entries))
+            if is_dir:
+                try:
+                    walk(full_path, rel)
+                except OSError:
+                    pass
+
+    walk(root, '')
+    with gzip.open(snapshot_file, 'wt', encoding='utf-8') as f:
+        json.dump({'version': SNAPSHOT_VERSION, 'root': root, 'mtime': os.path.getmtime(root), 'recorded': time.time(),
+                   'entries': entries}, f, separators=(',', ':'))
+    return len(entries)
+
+
+# Backend used by the tools, shared by every module (like logging.getLogger)
+_fs = LocalFS()
+
+
+def get_fs():
+    """
+    Get the filesystem backend of the current run.
+
+    Returns:
+        LocalFS | MemoryFS: The backend every filesystem operation goes through.
+    """
+    return _fs
+
+
+def set_fs(backend):
+    """
+    Set the filesystem backend of the current run.
+
+    Args:
+        backend (LocalFS | MemoryFS): The backend to use.
+    """
+    global _fs
+    _fs = backend
+
+
+def add_fs_arguments(parser):
+    """
+    Add the snapshot replay options shared by the tools to an argument parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the options to.
+    """
+    parser.add_argument('--snapshot', type=str, default=None, help="Run against a library snapshot recorded with 'fs_backend.py record' instead of the real filesystem (changes stay in memory).")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Snapshot mode: latency added to every filesystem operation, in milliseconds.")
+    parser.add_argument('--probe-latency-ms', type=float, default=0.0, help="Snapshot mode: latency added to every movie file probe, in milliseconds.")
+
+
+def configure_fs(snapshot_file: str = None, latency_ms: float = 0.0, probe_latency_ms: float = 0.0, probe_supervisor=None):
+    """
+    Select the backend from the command line options: the snapshot if one is given, the local filesystem otherwise.
+
+    Args:
+        snapshot_file (str): Path of the snapshot to replay.
+        latency_ms (float): Latency added to every filesystem operation, in milliseconds.
+        probe_latency_ms (float): Latency added to every probe, in milliseconds.
+        probe_supervisor (ProbeSupervisor): Local filesystem: runs the MediaInfo probes in a supervised subprocess.
+    """
+    if snapshot_file:
+        set_fs(SnapshotFS(snapshot_file, latency_ms / 1000, probe_latency_ms / 1000))
+    else:
+        set_fs(LocalFS(probe_supervisor))
+
+
+def parse_args():
+    """
+    Parse command line arguments.
+
+    Returns:
+        Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Record a library snapshot (names, sizes, mtimes, probed text tracks) to replay fix_subs/fix_year runs with --snapshot.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser('record', help="Record a snapshot of a directory tree.")
+    record.add_argument('path', type=str, help="Path to the directory to record.")
+    record.add_argument('snapshot', type=str, help="Snapshot file to write (gzip-compressed JSON).")
+    record.add_argument('--no-probe', action='store_true', help="Do not probe the text tracks of movie files.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not os.path.isdir(args.path):
+        print(f"Path '{args.path}' is not a directory.", file=sys.stderr)
+        sys.exit(1)
+    start = time.monotonic()
+    count = record_snapshot(args.path, args.snapshot, probe=not args.no_probe,
+                            progress=lambda n: print(f"\r{n} entries recorded", end='', file=sys.stderr))
+    print(f"\r{count} entries recorded to [{args.snapshot}] in {time.monotonic() - start:.1f}s", file=sys.stderr)
@@ -0,0 +1,323 @@
+import shutil
+import logging
+import threading
+import time
+
+from fs_backend import LocalFS, get_fs, set_fs
+
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Starting limits of the adaptive mode for the budgets not given explicitly
+ADAPTIVE_DEFAULTS = {'meta': 500.0, 'probe': 20.0, 'copy': 50 * 1024 * 1024}
+
+
+class TokenBucket:
+    """
+    TokenBucket lets operations through at a sustained rate with bursts up to its capacity; callers
+    over budget sleep until their tokens are available. Thread-safe.
+
+    Attributes:
+        rate (float): Tokens added per second (None = unlimited).
+        capacity (float): Maximum number of tokens saved up for a burst.
+        waited (float): Total seconds callers slept.
+    """
+
+    def __init__(self, rate: float | None, burst: float = None):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate (float): Tokens added per second, None for no limit.
+            burst (float): Capacity of the bucket (default: one second worth of tokens).
+        """
+        self.rate = rate
+        self.capacity = burst or max(rate or 0, 1)
+        self.tokens = self.capacity
+        self.waited = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Take tokens from the bucket, sleeping as long as needed to stay within the rate.
+        Requests larger than the capacity are let through and paid back by the next callers.
+
+        Args:
+            tokens (float): Number of tokens (operations or bytes).
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+
+    def set_rate(self, rate: float):
+        """
+        Change the rate, the tokens already saved up are kept.
+
+        Args:
+            rate (float): Tokens added per second.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.rate:
+                self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            self.rate = rate
+
+
+class AdaptiveController:
+    """
+    AdaptiveController scales the rates of token buckets down when the measured latency of metadata operations rises
+    above its baseline (the disks are busy, e.g. streaming) and back up when it recovers: multiplicative decrease,
+    additive increase, between a floor and the configured rates.
+
+    Attributes:
+        buckets (dict): TokenBucket by name, with their configured (maximum) rates in max_rates.
+        factor (float): Current fraction of the configured rates (floor .. 1).
+        latency (float): Exponentially weighted moving average of the operation latency, in seconds.
+        baseline (float): Lowest latency average seen, the latency of the idle disks.
+    """
+
+    SMOOTHING = 0.1        # weight of a new sample in the moving average
+    SLOW_RATIO = 2.0       # back off when the average is this many times the baseline
+    FAST_RATIO = 1.3       # speed up again when the average is back under this many times the baseline
+    DECREASE = 0.5         # rate multiplier when backing off
+    INCREASE = 0.05        # fraction of the configured rates added when speeding up
+    FLOOR = 0.05           # lowest fraction of the configured rates
+    INTERVAL = 1.0         # seconds between two adjustments
+    WARMUP = 20            # samples measured before the first adjustment
+
+    def __init__(self, buckets: dict[str, TokenBucket], logger=None):
+        """
+        Initialize the controller at the configured rates.
+
+        Args:
+            buckets (dict[str, TokenBucket]): The buckets to scale, their current rates are the maximum rates.
+            logger (LoggerClass): Optional logger for the rate changes.
+        """
+        self.buckets = buckets
+        self.max_rates = {name: bucket.rate for name, bucket in buckets.items()}
+        self.logger = logger
+        self.factor = 1.0
+        self.latency = None
+        self.baseline = None
+        self.samples = 0
+        self._last_adjust = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """
+        Record the latency of an operation and adjust the rates if needed.
+
+        Args:
+            seconds (float): Duration of the operation.
+        """
+        with self._lock:
+            self.samples += 1
+            self.latency = seconds if self.latency is None else self.latency + self.SMOOTHING * (seconds - self.latency)
+            if self.samples < self.WARMUP:
+                return
+            self.baseline = self.latency if self.baseline is None else min(self.baseline, self.latency)
+            now = time.monotonic()
+            if now - self._last_adjust < self.INTERVAL:
+                return
+            self._last_adjust = now
+
+            factor = self.factor
+            if self.latency > self.baseline * self.SLOW_RATIO:
+                factor = max(self.FLOOR, factor * self.DECREASE)
+            elif self.latency < self.baseline * self.FAST_RATIO:
+                factor = min(1.0, factor + self.INCREASE)
+            if factor == self.factor:
+                return
+            self.factor = factor
+            for name, bucket in self.buckets.items():
+                bucket.set_rate(self.max_rates[name] * factor)
+        if self.logger:
+            # log_message: fix_year has its own logger class with no log_debug
+            self.logger.log_message(f"I/O throttle: latency {self.latency * 1000:.1f} ms (baseline {self.baseline * 1000:.1f} ms), "
+                                    f"rates at {factor:.0%}", logging.DEBUG)
+
+
+class _ThrottledReader:
+    """File opened for reading whose reads are paid for with bandwidth tokens."""
+
+    def __init__(self, file, bucket: TokenBucket):
+        self._file = file
+        self._bucket = bucket
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self._bucket.acquire(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class ThrottledFS:
+    """
+    ThrottledFS wraps a filesystem backend and keeps its I/O within budgets: metadata operations per second
+    (listings, stats, renames), probes per second, and copy bandwidth (copies are made in chunks, each paid
+    for with tokens). In adaptive mode the budgets are lowered while the latency of metadata operations is above
+    its baseline, so a run yields to other users of the disks (media streaming) and speeds up when they are idle.
+
+    Attributes:
+        backend (LocalFS | MemoryFS): The wrapped backend.
+        meta (TokenBucket): Budget of metadata operations per second.
+        probe (TokenBucket): Budget of probes per second.
+        copy (TokenBucket): Budget of copied bytes per second.
+        controller (AdaptiveController): Rate controller of the adaptive mode, None otherwise.
+    """
+
+    def __init__(self, backend, meta_ops: float = None, probes: float = None, copy_bytes: float = None,
+                 adaptive: bool = False, logger=None):
+        """
+        Wrap a backend.
+
+        Args:
+            backend (LocalFS | MemoryFS): The backend to throttle.
+            meta_ops (float): Metadata operations per second (None = unlimited).
+            probes (float): Probes per second (None = unlimited).
+            copy_bytes (float): Copy bandwidth in bytes per second (None = unlimited).
+            adaptive (bool): Back off when the latency rises (unset budgets start at ADAPTIVE_DEFAULTS).
+            logger (LoggerClass): Optional logger for the adaptive rate changes.
+        """
+        if adaptive:
+            meta_ops = meta_ops or ADAPTIVE_DEFAULTS['meta']
+            probes = probes or ADAPTIVE_DEFAULTS['probe']
+            copy_bytes = copy_bytes or ADAPTIVE_DEFAULTS['copy']
+        self.backend = backend
+        self.name = backend.name
+        self.meta = TokenBucket(meta_ops)
+        self.probe = TokenBucket(probes)
+        self.copy = TokenBucket(copy_bytes, burst=max(copy_bytes or 0, COPY_CHUNK_SIZE))
+        self.controller = AdaptiveController({'meta': self.meta, 'probe': self.probe, 'copy': self.copy}, logger) if adaptive else None
+
+    def __getattr__(self, name):
+        # anything not throttled (e.g. MemoryFS.add_file) goes straight to the backend
+        return getattr(self.backend, name)
+
+    def _meta_op(self, operation, *args):
+        self.meta.acquire()
+        start = time.monotonic()
+        try:
+            return operation(*args)
+        finally:
+            if self.controller:
+                self.controller.record(time.monotonic() - start)
+
+    def listdir(self, path: str) -> list[str]:
+        return self._meta_op(self.backend.listdir, path)
+
+    def scandir(self, path: str) -> list[tuple[str, bool]]:
+        return self._meta_op(self.backend.scandir, path)
+
+    def exists(self, path: str) -> bool:
+        return self._meta_op(self.backend.exists, path)
+
+    def isdir(self, path: str) -> bool:
+        return self._meta_op(self.backend.isdir, path)
+
+    def isfile(self, path: str) -> bool:
+        return self._meta_op(self.backend.isfile, path)
+
+    def getsize(self, path: str) -> int:
+        return self._meta_op(self.backend.getsize, path)
+
+    def getmtime(self, path: str) -> float:
+        return self._meta_op(self.backend.getmtime, path)
+
+    def access(self, path: str, mode: int) -> bool:
+        return self._meta_op(self.backend.access, path, mode)
+
+    def rename(self, src: str, dst: str):
+        return self._meta_op(self.backend.rename, src, dst)
+
+    def remove(self, path: str):
+        return self._meta_op(self.backend.remove, path)
+
+    def open(self, path: str, mode: str = 'rb'):
+        file = self._meta_op(self.backend.open, path, mode)
+        return _ThrottledReader(file, self.copy) if 'r' in mode else file
+
+    def copy2(self, src: str, dst: str):
+        if not isinstance(self.backend, LocalFS):
+            self.copy.acquire(self.getsize(src))
+            return self.backend.copy2(src, dst)
+        # copy in chunks paid for with bandwidth tokens, then the metadata, like shutil.copy2
+        with self.open(src, 'rb') as fsrc, self.backend.open(dst, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+        shutil.copystat(src, dst)
+
+    def probe_text_languages(self, path: str, logger=None) -> list[str]:
+        self.probe.acquire()
+        return self.backend.probe_text_languages(path, logger)
+
+    def waited(self) -> float:
+        """
+        Get the time spent waiting for the budgets.
+
+        Returns:
+            float: Total seconds operations were delayed.
+        """
+        return self.meta.waited + self.probe.waited + self.copy.waited
+
+
+def add_throttle_arguments(parser, meta_only: bool = False):
+    """
+    Add the I/O budget options shared by the tools to an argument parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the options to.
+        meta_only (bool): Only the metadata operations budget, for tools that neither probe nor copy (fix_year).
+    """
+    parser.add_argument('--max-meta-ops', type=float, default=None, help="Limit filesystem metadata operations (listings, stats, renames) per second.")
+    if meta_only:
+        parser.add_argument('--adaptive-io', action='store_true', help="Lower the metadata operation limit while filesystem latency is above its baseline (busy disks) "
+                                                                       f"and raise it back when it recovers; an unset limit starts at {ADAPTIVE_DEFAULTS['meta']:g} ops/s.")
+        return
+    parser.add_argument('--max-probes', type=float, default=None, help="Limit movie file probes per second.")
+    parser.add_argument('--max-copy-mbps', type=float, default=None, help="Limit subtitle copy bandwidth in MB/s.")
+    parser.add_argument('--adaptive-io', action='store_true', help="Lower the I/O limits while filesystem latency is above its baseline (busy disks) "
+                                                                   f"and raise them back when it recovers; unset limits start at {ADAPTIVE_DEFAULTS['meta']:g} ops/s, "
+                                                                   f"{ADAPTIVE_DEFAULTS['probe']:g} probes/s and {ADAPTIVE_DEFAULTS['copy'] // (1024 * 1024)} MB/s.")
+
+
+def configure_throttle(meta_ops: float = None, probes: float = None, copy_mbps: float = None, adaptive: bool = False,
+                       logger=None) -> ThrottledFS | None:
+    """
+    Wrap the current filesystem backend with the I/O budgets given on the command line, if any.
+
+    Args:
+        meta_ops (float): Metadata operations per second.
+        probes (float): Probes per second.
+        copy_mbps (float): Copy bandwidth in MB/s.
+        adaptive (bool): Back off when the latency rises.
+        logger (LoggerClass): Optional logger for the adaptive rate changes.
+
+    Returns:
+        ThrottledFS: The throttled backend now in use, None if no budget was given.
+    """
+    if not (meta_ops or probes or copy_mbps or adaptive):
+        return None
+    throttled_fs = ThrottledFS(get_fs(), meta_ops, probes, copy_mbps * 1024 * 1024 if copy_mbps else None, adaptive, logger)
+    set_fs(throttled_fs)
+    return throttled_fs
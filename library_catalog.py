@@ -0,0 +1,312 @@
+import os
+import re
+import sys
+import csv
+import json
+import time
+import sqlite3
+import argparse
+from collections.abc import Generator
+
+
+# Matches a folder already formatted as "<name> (year)" optionally followed by " [release_description]"
+FORMATTED_NAME_PATTERN = re.compile(r"^(?P<title>.+?) \((?P<year>(19|20)\d{2})\)(?: \[.*\])?$")
+# Matches a loose ".YYYY." or "(YYYY)" year token, same rule fix_year uses to find the year
+YEAR_TOKEN_PATTERN = re.compile(r"(?<=\.)((19|20)\d{2})(?=\.)|(?<=\()((19|20)\d{2})(?=\))")
+
+
+def split_title_year(folder_name: str) -> tuple[str, int | None, bool]:
+    """
+    Split a movie folder name into title and year.
+
+    Args:
+        folder_name (str): The folder name to split.
+
+    Returns:
+        tuple: (title, year, name_ok) where name_ok is True when the folder follows the
+               "<name> (year)" format, year is None when no year token is found.
+    """
+    match = FORMATTED_NAME_PATTERN.match(folder_name)
+    if match:
+        return match.group('title'), int(match.group('year')), True
+
+    matches = list(YEAR_TOKEN_PATTERN.finditer(folder_name))
+    if matches:
+        last_match = matches[-1]
+        title = folder_name[:last_match.start()].replace('.', ' ').replace('(', ' ').split()
+        return ' '.join(title), int(last_match.group(0)), False
+
+    return folder_name, None, False
+
+
+class LibraryCatalog:
+    """
+    LibraryCatalog keeps an indexed SQLite catalog of the movie folders seen by fix_subs and fix_year.
+
+    Every run upserts what it found (title, year, folder, movie file, embedded text tracks, placed subtitle
+    and its source) so questions about the library can be answered from the index without crawling it again.
+
+    Attributes:
+        db_path (str): Path of the SQLite database file.
+        commit_every (int): Number of upserts batched in a transaction before committing.
+        conn (sqlite3.Connection): Open connection to the catalog.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS movies (
+            folder          TEXT PRIMARY KEY,
+            parent          TEXT NOT NULL,
+            folder_name     TEXT NOT NULL,
+            title           TEXT,
+            year            INTEGER,
+            name_ok         INTEGER NOT NULL DEFAULT 0,
+            movie_file      TEXT,
+            text_langs      TEXT,
+            subtitle_path   TEXT,
+            subtitle_source TEXT,
+            updated         REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_movies_subtitle_source ON movies (subtitle_source);
+        CREATE INDEX IF NOT EXISTS idx_movies_name_ok ON movies (name_ok);
+        CREATE INDEX IF NOT EXISTS idx_movies_year ON movies (year);
+        CREATE INDEX IF NOT EXISTS idx_movies_title ON movies (title COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_movies_parent ON movies (parent);
+    """
+
+    # Columns returned by query(), in output order
+    COLUMNS = ['folder', 'title', 'year', 'name_ok', 'movie_file', 'text_langs', 'subtitle_path', 'subtitle_source', 'updated']
+
+    def __init__(self, db_path: str, commit_every: int = 200):
+        """
+        Open (and create if needed) the catalog database.
+
+        Args:
+            db_path (str): Path of the SQLite database file.
+            commit_every (int): Number of upserts batched in a transaction before committing.
+        """
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self._pending = 0
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def upsert_movie(self, folder_path: str, movie_file: str = None, text_langs: list[str] = None,
+                     subtitle_path: str = None, subtitle_source: str = None):
+        """
+        Insert or update the catalog entry of a movie folder.
+
+        Title, year and name format are derived from the folder name. Fields passed as None keep the
+        value already stored, so fix_year and fix_subs can each fill in what they know; the subtitle path
+        goes with its source (a new source with no path, e.g. none or embedded, clears the old path).
+
+        Args:
+            folder_path (str): Absolute path of the movie folder.
+            movie_file (str): Path of the movie file found in the folder.
+            text_langs (list[str]): Languages of the embedded text tracks.
+            subtitle_path (str): Path of the subtitle placed (or found) for the movie.
+            subtitle_source (str): Where the subtitle came from (existing, embedded, folder, subs, archive, orphan, none).
+        """
+        parent, folder_name = os.path.split(folder_path)
+        title, year, name_ok = split_title_year(folder_name)
+
+        self.conn.execute(
+            """
+            INSERT INTO movies (folder, parent, folder_name, title, year, name_ok, movie_file, text_langs,
+                                subtitle_path, subtitle_source, updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(folder) DO UPDATE SET
+                title           = excluded.title,
+                year            = excluded.year,
+                name_ok         = excluded.name_ok,
+                movie_file      = COALESCE(excluded.movie_file, movies.movie_file),
+                text_langs      = COALESCE(excluded.text_langs, movies.text_langs),
+                subtitle_path   = CASE WHEN excluded.subtitle_source IS NOT NULL THEN excluded.subtitle_path
+                                       ELSE movies.subtitle_path END,
+                subtitle_source = COALESCE(excluded.subtitle_source, movies.subtitle_source),
+                updated         = excluded.updated
+            """,
+            (folder_path, parent, folder_name, title, year, int(name_ok), movie_file,
+             ','.join(text_langs) if text_langs is not None else None,
+             subtitle_path, subtitle_source, time.time()))
+        self._changed()
+
+    def rename_folder(self, old_path: str, new_path: str):
+        """
+        Move the catalog entries of a renamed folder (and anything below it) to the new path.
+
+        Args:
+            old_path (str): Path of the folder before the rename.
+            new_path (str): Path of the folder after the rename.
+        """
+        rows = self.conn.execute("SELECT * FROM movies WHERE folder = ? OR folder LIKE ? ESCAPE '\\'",
+                                 (old_path, self._like_prefix(old_path))).fetchall()
+        for row in rows:
+            folder = new_path + row['folder'][len(old_path):]
+            movie_file = row['movie_file']
+            if movie_file and movie_file.startswith(old_path):
+                movie_file = new_path + movie_file[len(old_path):]
+            subtitle_path = row['subtitle_path']
+            if subtitle_path and subtitle_path.startswith(old_path):
+                subtitle_path = new_path + subtitle_path[len(old_path):]
+
+            self.conn.execute("DELETE FROM movies WHERE folder = ?", (row['folder'],))
+            self.upsert_movie(folder, movie_file, row['text_langs'].split(',') if row['text_langs'] is not None else None,
+                              subtitle_path, row['subtitle_source'])
+        self._changed()
+
+    def query(self, missing_subtitle: bool = False, bad_name: bool = False, no_year: bool = False,
+              title: str = None, year: int = None, under: str = None, limit: int = None) -> list[dict]:
+        """
+        Query the catalog using its indexes.
+
+        Args:
+            missing_subtitle (bool): Only movies for which no subtitle was found.
+            bad_name (bool): Only folders not matching "<name> (year)".
+            no_year (bool): Only folders with no year in the name.
+            title (str): Case insensitive title pattern, '*' and '?' wildcards allowed.
+            year (int): Only movies of this year.
+            under (str): Only folders below this path.
+            limit (int): Maximum number of rows to return.
+
+        Returns:
+            list[dict]: The matching catalog entries ordered by folder.
+        """
+        conditions, params = [], []
+        if missing_subtitle:
+            conditions.append("subtitle_source = 'none'")
+        if bad_name:
+            conditions.append("name_ok = 0")
+        if no_year:
+            conditions.append("year IS NULL")
+        if title:
+            conditions.append("title LIKE ? ESCAPE '\\'")
+            params.append(title.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('*', '%').replace('?', '_'))
+        if year:
+            conditions.append("year = ?")
+            params.append(year)
+        if under:
+            under = os.path.abspath(under)
+            conditions.append("folder LIKE ? ESCAPE '\\'")
+            params.append(self._like_prefix(under))
+
+        sql = f"SELECT {', '.join(self.COLUMNS)} FROM movies"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY folder"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def iter_folders(self, under: str = None) -> Generator[tuple[str, str | None], None, None]:
+        """
+        Stream the movie folders of the catalog without loading them all in memory.
+
+        Args:
+            under (str): Only folders below this path.
+
+        Yields:
+            tuple: (folder, movie_file) for each catalog entry, movie_file is None when it was not recorded.
+        """
+        sql, params = "SELECT folder, movie_file FROM movies", []
+        if under:
+            sql += " WHERE folder LIKE ? ESCAPE '\\'"
+            params.append(self._like_prefix(os.path.abspath(under)))
+        for row in self.conn.execute(sql, params):
+            yield row['folder'], row['movie_file']
+
+    def commit(self):
+        """
+        Commit pending upserts.
+        """
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        """
+        Commit pending upserts and close the database.
+        """
+        if self.conn is not None:
+            self.commit()
+            self.conn.close()
+            self.conn = None
+
+    def _changed(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    @staticmethod
+    def _like_prefix(path: str) -> str:
+        escaped = path.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return escaped + ('\\\\' if os.sep == '\\' else os.sep) + '%'
+
+
+def write_rows(rows: list[dict], output_format: str, out=sys.stdout):
+    """
+    Write catalog rows to the output in the requested format.
+
+    Args:
+        rows (list[dict]): Rows returned by LibraryCatalog.query.
+        output_format (str): One of table, csv or json.
+        out (file): Output stream.
+    """
+    if output_format == 'json':
+        json.dump(rows, out, indent=2)
+        out.write('\n')
+    elif output_format == 'csv':
+        writer = csv.DictWriter(out, fieldnames=LibraryCatalog.COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            year = row['year'] if row['year'] else '----'
+            subs = row['subtitle_source'] or '?'
+            out.write(f"{year}  {subs:<8}  {'ok ' if row['name_ok'] else 'BAD'}  {row['folder']}\n")
+        out.write(f"{len(rows)} folder{'s' if len(rows) != 1 else ''}\n")
+
+
+def parse_args():
+    """
+    Parse command line arguments.
+
+    Returns:
+        Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Query the library catalog built by fix_subs/fix_year runs with --catalog.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    query = subparsers.add_parser('query', help="Query catalog entries.")
+    query.add_argument('catalog', type=str, help="Path to the catalog database.")
+    query.add_argument('--missing-subs', '-M', action='store_true', help="Movies with no subtitle found (no file, no embedded track).")
+    query.add_argument('--bad-names', '-B', action='store_true', help="Folders not matching '<name> (year)'.")
+    query.add_argument('--no-year', '-N', action='store_true', help="Folders with no year in the name.")
+    query.add_argument('--title', '-T', type=str, help="Title pattern, '*' and '?' wildcards allowed (case insensitive).")
+    query.add_argument('--year', '-Y', type=int, help="Only movies of this year.")
+    query.add_argument('--under', '-U', type=str, help="Only folders below this path.")
+    query.add_argument('--limit', type=int, help="Maximum number of rows.")
+    query.add_argument('--format', '-f', choices=['table', 'csv', 'json'], default='table', help="Output format.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not os.path.exists(args.catalog):
+        print(f"Catalog '{args.catalog}' does not exist.", file=sys.stderr)
+        sys.exit(1)
+    with LibraryCatalog(args.catalog) as catalog:
+        rows = catalog.query(missing_subtitle=args.missing_subs, bad_name=args.bad_names, no_year=args.no_year,
+                             title=args.title, year=args.year, under=args.under, limit=args.limit)
+    write_rows(rows, args.format)
@@ -1,13 +1,19 @@
 #import logging
 import os
+import re
 import sys
+import gzip
+import time
+import shutil
 import logging
 import functools
+import threading
 from datetime import datetime
 
 from pathlib import Path
 
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, MemoryHandler
+from concurrent.futures import ThreadPoolExecutor
 
 class LoggerClass:
     """
@@ -21,7 +27,9 @@ class LoggerClass:
     """
 
     def __init__(self, log_to_file: bool = True, log_file: str = None, loglevel: str = 'INFO', silent: bool = False, demo: bool = False,
-                 max_file_size: int = 0.5 * 1024 * 1024, backup_count: int = 5, file_log_format: str = None, console_log_format: str = None, log_prefix: str = f"{os.path.splitext(os.path.basename(__file__))[0]}"):
+                 max_file_size: int = 0.5 * 1024 * 1024, backup_count: int = 5, file_log_format: str = None, console_log_format: str = None, log_prefix: str = f"{os.path.splitext(os.path.basename(__file__))[0]}",
+                 buffered: bool = False, buffer_capacity: int = 1000, flush_interval: float = 5.0,
+                 retention_bytes: int = 512 * 1024 * 1024, retention_days: float = None, compress: bool = True):
         """
         Initializes LoggerClass with logging configuration.
 
@@ -36,6 +44,13 @@ class LoggerClass:
             file_log_format (str): Optional custom log format string for file.
             console_log_format (str): Optional custom log format string for console.
             log_prefix (str): Prefix to use for auto-generated log names (default: the main calling file name).
+            buffered (bool): Buffer file records in memory and rotate to compressed segments kept by total size/age
+                             instead of RotatingFileHandler with backup_count (meant for long DEBUG runs).
+            buffer_capacity (int): Buffered mode: number of records buffered before writing them to the file.
+            flush_interval (float): Buffered mode: maximum number of seconds a record stays in the buffer.
+            retention_bytes (int): Buffered mode: maximum total size of the rotated segments (None = unlimited).
+            retention_days (float): Buffered mode: maximum age in days of the rotated segments (None = unlimited).
+            compress (bool): Buffered mode: gzip rotated segments in the background.
         """
         self.loglevel_map = logging.getLevelNamesMapping()
 
@@ -51,6 +66,13 @@ class LoggerClass:
         self.demo_prefix = '[DEMO MODE] ' if demo else ''
         # prefix to use for auto-generated log names (by default - the main calling file name)
         self.log_prefix = log_prefix
+        # buffered mode settings (see BufferedFileHandler and CompressingRotatingFileHandler)
+        self.buffered = buffered
+        self.buffer_capacity = buffer_capacity
+        self.flush_interval = flush_interval
+        self.retention_bytes = retention_bytes
+        self.retention_days = retention_days
+        self.compress = compress
 
         # Create a logger
         self.logger = logging.getLogger('MyLogger')
@@ -86,9 +108,16 @@ class LoggerClass:
             if not log_file:
                 log_file = f"{log_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
 
-            self.file_handler = RotatingFileHandler(log_file, maxBytes=max_file_size, backupCount=backup_count)
-            self.file_handler.setFormatter(file_formatter)
-            self.logger.addHandler(self.file_handler)
+            if self.buffered:
+                self.file_handler = CompressingRotatingFileHandler(log_file, max_bytes=max_file_size, retention_bytes=self.retention_bytes,
+                                                                   retention_days=self.retention_days, compress=self.compress)
+                self.file_handler.setFormatter(file_formatter)
+                self.buffer_handler = BufferedFileHandler(self.file_handler, capacity=self.buffer_capacity, flush_interval=self.flush_interval)
+                self.logger.addHandler(self.buffer_handler)
+            else:
+                self.file_handler = RotatingFileHandler(log_file, maxBytes=max_file_size, backupCount=backup_count)
+                self.file_handler.setFormatter(file_formatter)
+                self.logger.addHandler(self.file_handler)
 
         # Set up console handler if not in silent mode
         if not self.silent:
@@ -98,7 +127,9 @@ class LoggerClass:
                 #log_format = "%(asctime)s :: %(levelname)s :: %(name)s :: %(filename)s :: %(lineno)d :: %(message)s"
 
             self.console_handler = logging.StreamHandler(sys.stdout)
-            console_formatter = ColoredFormatter(fmt=console_log_format, datefmt="%Y-%m-%d %H:%M:%S", style="{", demo=self.demo)
+            # color only when writing to a terminal, redirected output gets the plain formatter
+            formatter_class = ColoredFormatter if sys.stdout.isatty() else PlainFormatter
+            console_formatter = formatter_class(fmt=console_log_format, datefmt="%Y-%m-%d %H:%M:%S", style="{", demo=self.demo)
             # #console_formatter = logging.Formatter(fmt=console_log_format, datefmt="%Y-%m-%d %H:%M:%S", style="{")
             # console_formatter = DebugFormatter(fmt=console_log_format, datefmt="%Y-%m-%d %H:%M:%S", style="%")
             self.console_handler.setFormatter(console_formatter)
@@ -121,6 +152,9 @@ class LoggerClass:
         Returns:
             list[str]: List of log file paths.
         """
+        if isinstance(self.file_handler, CompressingRotatingFileHandler):
+            return self.file_handler.get_log_files()
+
         log_files = [self.file_handler.baseFilename]
 
         # Add rotated log files based on backup count
@@ -193,7 +227,8 @@ class LoggerClass:
             # Add padding and center the chunk
             #print('123456789+'*(console_width//10))
             chunk = f"{self.demo_prefix}{chunk.ljust(padding_width - len(self.demo_prefix), padding_char)}"
-            self.logger.log(level, chunk)
+            # continuation chunks are flagged so handlers counting messages (run metrics) count each message once
+            self.logger.log(level, chunk, extra={'continuation': i > 0})
 
     def get_demo_prefix(self) -> str:
         return self.demo_prefix
@@ -251,31 +286,24 @@ from colorama import init as clr_init
 # Initialize colorama to support ANSI codes on Windows
 clr_init(autoreset=True)
 
-class ColoredFormatter(logging.Formatter):
-    """Custom formatter to add color to log messages based on log level."""
-    
-    # Define a dictionary mapping log levels to color settings (asctime, level, message) to use with colored instruction from termcolor library
-    LOG_COLORS = {
-            logging.DEBUG:   ( ('light_yellow', None, []),    ('light_green', None, []),     ('light_yellow', None, []) ),
-            logging.INFO:    ( ("light_yellow", None, []),    ('white', None, []),           ('white', None, []) ),
-            logging.WARNING: ( ('yellow', None, []),          ('yellow', None, []),          ('light_yellow', None, []) ),
-            logging.ERROR:   ( ('light_red', None, ['bold']), ('light_red', None, ['bold']), ('light_red', None, ['bold']) ),
-            logging.CRITICAL:( ('white', 'on_red', ['bold']), ('white', 'on_red', ['bold']), ('white', 'on_red', ['bold']) ),
-            logging.FATAL:   ( ('white', 'on_red', ['bold']), ('white', 'on_red', ['bold']), ('white', 'on_red', ['bold']) )
-        }
+class PlainFormatter(logging.Formatter):
+    """Formatter adding milliseconds to the time, used as is when the console is not a terminal."""
 
     def __init__(self, fmt: str = "%(asctime)s %(levelname)s -> %(message)s", datefmt: str = "%Y-%m-%d %H:%M:%S",
                  style: str = "%", demo: bool = False):
         """
-        Initialize the formatter with optional formatting strings and demo mode.
-        
+        Initialize the formatter with optional formatting strings.
+
         :param fmt: Format string for the log message.
         :param datefmt: Format string for the date in log messages.
         :param style: Style of the format string.
-        :param demo: If True, applies color to the log message content (message) for demonstration purposes.
+        :param demo: Demo mode flag, accepted so both console formatters can be built the same way.
         """
         super().__init__(fmt=fmt, datefmt=datefmt, style=style)
         self.demo = demo
+        # strftime result of the last second formatted, most consecutive records share it
+        self._last_second = None
+        self._last_second_text = ''
 
     def formatTime(self, record: logging.LogRecord, datefmt: str = None) -> str:
         """
@@ -285,48 +313,270 @@ class ColoredFormatter(logging.Formatter):
         :param datefmt: Optional date format string.
         :return: The formatted time string with milliseconds.
         """
-        dt = datetime.fromtimestamp(record.created)
+        second = int(record.created)
+        if second != self._last_second:
+            self._last_second_text = datetime.fromtimestamp(second).strftime(datefmt or self.default_time_format)
+            self._last_second = second
         # Format time with milliseconds (fractional seconds)
-        return dt.strftime(datefmt) + f".{int(dt.microsecond / 10000):02d}"
+        return self._last_second_text + f".{int(record.msecs / 10):02d}"
+
+
+class ColoredFormatter(PlainFormatter):
+    """Custom formatter to add color to log messages based on log level."""
     
+    # Define a dictionary mapping log levels to color settings (asctime, level, message) to use with colored instruction from termcolor library
+    LOG_COLORS = {
+            logging.DEBUG:   ( ('light_yellow', None, ()),    ('light_green', None, ()),     ('light_yellow', None, ()) ),
+            logging.INFO:    ( ("light_yellow", None, ()),    ('white', None, ()),           ('white', None, ()) ),
+            logging.WARNING: ( ('yellow', None, ()),          ('yellow', None, ()),          ('light_yellow', None, ()) ),
+            logging.ERROR:   ( ('light_red', None, ('bold',)), ('light_red', None, ('bold',)), ('light_red', None, ('bold',)) ),
+            logging.CRITICAL:( ('white', 'on_red', ('bold',)), ('white', 'on_red', ('bold',)), ('white', 'on_red', ('bold',)) ),
+        }
+
+    # Fields of the format string colored for each style of format string
+    FIELD_PATTERNS = {
+        '%': re.compile(r"%\((asctime|levelname|message)\)[-#0 +]*\d*(?:\.\d+)?[a-zA-Z]"),
+        '{': re.compile(r"\{(asctime|levelname|message)(?:[!:][^{}]*)?\}"),
+        '$': re.compile(r"\$\{?(asctime|levelname|message)\b\}?"),
+    }
+
+    def __init__(self, fmt: str = "%(asctime)s %(levelname)s -> %(message)s", datefmt: str = "%Y-%m-%d %H:%M:%S",
+                 style: str = "%", demo: bool = False):
+        """
+        Initialize the formatter with optional formatting strings and demo mode.
+
+        The escape sequences of each level are computed once here: every level gets its own format string with
+        the color codes around asctime and message and a precolored level name, so formatting a record does not
+        call termcolor and does not modify the record (other handlers keep seeing plain text).
+        
+        :param fmt: Format string for the log message.
+        :param datefmt: Format string for the date in log messages.
+        :param style: Style of the format string.
+        :param demo: If True, the level name is shown in reverse video.
+        """
+        super().__init__(fmt=fmt, datefmt=datefmt, style=style, demo=demo)
+        self._level_formatters = {levelno: PlainFormatter(fmt=self._colorize(self._fmt, style, levelno), datefmt=datefmt, style=style)
+                                  for levelno in self.LOG_COLORS}
+
+    def _colorize(self, fmt: str, style: str, levelno: int) -> str:
+        """
+        Build the format string of a level with the color escape sequences in place.
+
+        :param fmt: Format string for the log message.
+        :param style: Style of the format string.
+        :param levelno: The log level to build the format string for.
+        :return: The colored format string.
+        """
+        parts = dict(zip(('asctime', 'levelname', 'message'), self.LOG_COLORS[levelno]))
+
+        def replace(match: re.Match) -> str:
+            field = match.group(1)
+            color, on_color, attrs = parts[field]
+            if field == 'levelname':
+                attrs = tuple(attrs) + (('reverse',) if self.demo else ())
+                text = colored(f"{logging.getLevelName(levelno):^7}", color, on_color, attrs)
+                # the level name is a literal of the level's format string, escape it for the style
+                return text.replace('{', '{{').replace('}', '}}') if style == '{' else text.replace('%', '%%') if style == '%' else text.replace('$', '$$')
+            prefix, _, suffix = colored('\0', color, on_color, attrs).partition('\0')
+            return prefix + match.group(0) + suffix
+
+        return self.FIELD_PATTERNS[style].sub(replace, fmt)
+
     def format(self, record: logging.LogRecord) -> str:
         """
-        Format the log record with color coding based on log level.
+        Format the log record with the precomputed color coding of its level.
         
         :param record: The log record to format.
         :return: The formatted log record string.
         """
-        # seems to be a bug in the logging library, the attribute <asctime> is not part of the record, so we add it if its not there
-        if not hasattr(record, 'asctime'):
-            record.asctime = self.formatTime(record, self.datefmt)
+        level_formatter = self._level_formatters.get(record.levelno)
+        if level_formatter is None:
+            return super().format(record)
+        return level_formatter.format(record)
 
-        # Apply color settings based on log level
-        levelno = record.levelno
-        colors = self.LOG_COLORS.get(levelno, (None, None, []))  # Retrieve the tuple for the given log level
+class CompressingRotatingFileHandler(logging.FileHandler):
+    """
+    File handler rotating to timestamped segments that are gzip-compressed in the background.
 
-            # Retrieve color settings based on the log level for each part of the log record
-        color, on_color, attrs = colors[0]
-        if color or on_color or attrs:
-            # Debug: Print what color settings are being applied
-            # print(f"Debug: asctime={record.asctime}, color={asctime_color}, on_color={asctime_on_color}, attrs={asctime_attrs} {colored(record.asctime, asctime_color)=}")
-            record.asctime = colored(record.asctime, color, on_color, attrs)
-        
-        color, on_color, attrs = colors[1]
-        if color or on_color or attrs:
-            if self.demo:
-                if 'reverse' not in attrs:
-                    attrs.append('reverse')
-                if levelno == logging.DEMO:
-                    record.levelname = colored(f"{f"{record.levelname} ({record.levelno})":^10}", color, on_color, attrs)
-            else:
-                record.levelname = colored(f"{f"{record.levelname}":^7}", color, on_color, attrs)
+    Unlike RotatingFileHandler it tracks the file size itself instead of seeking on every emit, can write a batch
+    of records with a single write, and keeps segments by total size and/or age instead of by count.
+    """
 
-        color, on_color, attrs = colors[2]
-        if color or on_color or attrs:
-            #print(f"Debug: {record.msg=}, {color=}, {on_color=}, {attrs=} {colored(record.msg, color, on_color, attrs)=}")
-            record.msg = colored(record.msg, color, on_color, attrs) #if record.levelno < logging.INFO else record.msg
-        
-        return super().format(record)
+    def __init__(self, filename: str, max_bytes: int = 16 * 1024 * 1024, retention_bytes: int = None,
+                 retention_days: float = None, compress: bool = True, encoding: str = 'utf-8'):
+        """
+        Initialize the handler.
+
+        :param filename: Path of the active log file.
+        :param max_bytes: Size of the active file that triggers a rotation.
+        :param retention_bytes: Maximum total size of the rotated segments, oldest are deleted first (None = unlimited).
+        :param retention_days: Maximum age of the rotated segments in days (None = unlimited).
+        :param compress: If True, rotated segments are gzip-compressed in a background thread.
+        :param encoding: Encoding of the log file.
+        """
+        super().__init__(filename, mode='a', encoding=encoding)
+        self.max_bytes = int(max_bytes)
+        self.retention_bytes = retention_bytes
+        self.retention_days = retention_days
+        self.compress = compress
+        self._size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        # a single worker keeps compression and retention in rotation order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compress')
+
+    def emit(self, record: logging.LogRecord):
+        """
+        Write a single record, rotating first if it does not fit in the active file.
+        """
+        self.emit_batch([record])
+
+    def emit_batch(self, records: list[logging.LogRecord]):
+        """
+        Format a batch of records and write them with a single write.
+
+        :param records: The log records to write.
+        """
+        try:
+            text = ''.join(self.format(record) + self.terminator for record in records)
+            if self._size and self._size + len(text) > self.max_bytes:
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(text)
+            self.stream.flush()
+            self._size += len(text)
+        except Exception:
+            for record in records:
+                self.handleError(record)
+
+    def doRollover(self):
+        """
+        Close the active file, rename it to a timestamped segment and hand it over for compression and retention.
+        """
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        segment = f"{self.baseFilename}.{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        if os.path.exists(self.baseFilename):
+            os.rename(self.baseFilename, segment)
+            self._executor.submit(self._archive_segment, segment)
+        self._size = 0
+
+    def get_log_files(self) -> list[str]:
+        """
+        Retrieves the active log file and its rotated segments, oldest segment first.
+
+        :return: List of log file paths.
+        """
+        return [self.baseFilename] + self._segments()
+
+    def close(self):
+        """
+        Close the active file and wait for pending compressions.
+        """
+        super().close()
+        self._executor.shutdown(wait=True)
+
+    def _segments(self) -> list[str]:
+        folder, base = os.path.split(self.baseFilename)
+        prefix = base + '.'
+        segments = [os.path.join(folder, f) for f in os.listdir(folder or '.') if f.startswith(prefix) and not f.endswith('.tmp')]
+        return sorted(segments)
+
+    def _archive_segment(self, segment: str):
+        if self.compress:
+            try:
+                with open(segment, 'rb') as src, gzip.open(segment + '.gz.tmp', 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.replace(segment + '.gz.tmp', segment + '.gz')
+                os.remove(segment)
+            except OSError as e:
+                sys.stderr.write(f"*** Could not compress log segment [{segment}]: {e} ***\n")
+        self._apply_retention()
+
+    def _apply_retention(self):
+        # segments can vanish or be locked (another process, an antivirus scan): skip them rather than fail the handler
+        try:
+            segments = self._segments()
+        except OSError as e:
+            sys.stderr.write(f"*** Could not list log segments of [{self.baseFilename}]: {e} ***\n")
+            return
+        if self.retention_days is not None:
+            oldest_allowed = time.time() - self.retention_days * 86400
+            for segment in list(segments):
+                try:
+                    if os.path.getmtime(segment) < oldest_allowed:
+                        segments.remove(segment)
+                        os.remove(segment)
+                except OSError as e:
+                    sys.stderr.write(f"*** Could not remove old log segment [{segment}]: {e} ***\n")
+        if self.retention_bytes is not None:
+            sizes = {}
+            for segment in segments:
+                try:
+                    sizes[segment] = os.path.getsize(segment)
+                except OSError:
+                    pass  # already gone
+            segments = [segment for segment in segments if segment in sizes]
+            total = sum(sizes.values())
+            while segments and total > self.retention_bytes:
+                segment = segments.pop(0)
+                total -= sizes[segment]
+                try:
+                    os.remove(segment)
+                except OSError as e:
+                    sys.stderr.write(f"*** Could not remove log segment [{segment}]: {e} ***\n")
+
+
+class BufferedFileHandler(MemoryHandler):
+    """
+    MemoryHandler flushing its buffer to the target when it is full, when a record at flush_level or above is logged,
+    or every flush_interval seconds, whichever comes first.
+    When the target supports it, the buffer is written as one batch.
+    """
+
+    def __init__(self, target: logging.Handler, capacity: int = 1000, flush_interval: float = 5.0, flush_level: int = logging.ERROR):
+        """
+        Initialize the handler and start the periodic flush thread.
+
+        :param target: Handler receiving the buffered records.
+        :param capacity: Number of records buffered before a flush.
+        :param flush_interval: Maximum number of seconds a record stays in the buffer.
+        :param flush_level: Records at this level or above flush the buffer immediately.
+        """
+        super().__init__(capacity, flushLevel=flush_level, target=target, flushOnClose=True)
+        self.flush_interval = flush_interval
+        self._stop_event = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name='log-flush', daemon=True)
+        self._flusher.start()
+
+    def flush(self):
+        """
+        Write the buffered records to the target.
+        """
+        with self.lock:
+            if self.target and self.buffer:
+                if hasattr(self.target, 'emit_batch'):
+                    self.target.acquire()
+                    try:
+                        self.target.emit_batch(self.buffer)
+                    finally:
+                        self.target.release()
+                else:
+                    for record in self.buffer:
+                        self.target.handle(record)
+                self.buffer.clear()
+
+    def close(self):
+        """
+        Stop the periodic flush thread and flush the remaining records.
+        """
+        self._stop_event.set()
+        super().close()
+
+    def _flush_periodically(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
 
 # class DebugFormatter(logging.Formatter):
 
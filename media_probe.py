@@ -0,0 +1,303 @@
+import os
+import struct
+
+
+# Containers parsed natively, anything else goes to MediaInfo
+MATROSKA_EXTENSIONS = {'.mkv', '.mka', '.mks', '.webm'}
+MP4_EXTENSIONS = {'.mp4', '.m4v', '.mov'}
+
+# Matroska element IDs (marker bits included)
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+LANGUAGE = 0x22B59C
+LANGUAGE_BCP47 = 0x22B59D
+CLUSTER = 0x1F43B675
+MATROSKA_SUBTITLE_TRACK = 17
+
+# MP4/QuickTime handler types MediaInfo reports as Text tracks
+MP4_TEXT_HANDLERS = {b'text', b'sbtl', b'subt', b'clcp'}
+
+# Upper bounds keeping a corrupt file from making the probe read or loop without end
+MAX_TRACKS_SIZE = 16 * 1024 * 1024
+MAX_ELEMENTS = 10000
+
+# ISO 639-2 (bibliographic and terminology) to ISO 639-1, the form MediaInfo reports languages in
+ISO639_2_TO_1 = {
+    'eng': 'en', 'spa': 'es', 'fre': 'fr', 'fra': 'fr', 'ger': 'de', 'deu': 'de', 'ita': 'it', 'por': 'pt',
+    'dut': 'nl', 'nld': 'nl', 'swe': 'sv', 'nor': 'no', 'nob': 'nb', 'nno': 'nn', 'dan': 'da', 'fin': 'fi',
+    'ice': 'is', 'isl': 'is', 'pol': 'pl', 'cze': 'cs', 'ces': 'cs', 'slo': 'sk', 'slk': 'sk', 'slv': 'sl',
+    'hun': 'hu', 'rum': 'ro', 'ron': 'ro', 'bul': 'bg', 'hrv': 'hr', 'srp': 'sr', 'bos': 'bs', 'mac': 'mk',
+    'mkd': 'mk', 'alb': 'sq', 'sqi': 'sq', 'gre': 'el', 'ell': 'el', 'tur': 'tr', 'rus': 'ru', 'ukr': 'uk',
+    'bel': 'be', 'est': 'et', 'lav': 'lv', 'lit': 'lt', 'heb': 'he', 'ara': 'ar', 'per': 'fa', 'fas': 'fa',
+    'hin': 'hi', 'ben': 'bn', 'tam': 'ta', 'tel': 'te', 'urd': 'ur', 'tha': 'th', 'vie': 'vi', 'ind': 'id',
+    'may': 'ms', 'msa': 'ms', 'chi': 'zh', 'zho': 'zh', 'jpn': 'ja', 'kor': 'ko', 'cat': 'ca', 'baq': 'eu',
+    'eus': 'eu', 'glg': 'gl', 'wel': 'cy', 'cym': 'cy', 'gle': 'ga', 'arm': 'hy', 'hye': 'hy', 'geo': 'ka',
+    'kat': 'ka', 'fil': 'fil', 'tgl': 'tl', 'lat': 'la', 'und': '',
+}
+
+# QuickTime Macintosh language codes (mdhd language values below 0x400)
+MAC_LANGUAGES = ['en', 'fr', 'de', 'it', 'nl', 'sv', 'es', 'da', 'pt', 'no', 'he', 'ja', 'ar', 'fi', 'el',
+                 'is', 'mt', 'tr', 'hr', 'zh', 'ur', 'hi', 'th', 'ko', 'lt', 'pl', 'hu', 'et', 'lv']
+
+
+def probe_text_tracks(file_path: str) -> list[tuple[str, str]] | None:
+    """
+    Read the text tracks of a Matroska or MP4/QuickTime file from its headers only.
+
+    Only the track headers are read (a few bounded reads), not the media data, so probing costs a fraction
+    of a MediaInfo analysis.
+
+    Args:
+        file_path (str): Path of the movie file.
+
+    Returns:
+        list[tuple[str, str]]: (codec, language) of each text track, language as MediaInfo reports it
+                               (ISO 639-1 when one exists, empty when undefined), or None when the container is
+                               not supported or could not be parsed, in which case the caller should use MediaInfo.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        with open(file_path, 'rb') as f:
+            if ext in MATROSKA_EXTENSIONS:
+                return _matroska_text_tracks(f)
+            if ext in MP4_EXTENSIONS:
+                return _mp4_text_tracks(f, os.fstat(f.fileno()).st_size)
+    except (OSError, ValueError, IndexError, struct.error, UnicodeDecodeError):
+        return None
+    return None
+
+
+def normalize_language(language: str) -> str:
+    """
+    Convert an ISO 639-2 language code to the ISO 639-1 code MediaInfo reports.
+
+    Args:
+        language (str): Language code as stored in the container.
+
+    Returns:
+        str: The 2-letter code when one exists, the code unchanged otherwise, empty for undefined.
+    """
+    language = language.strip().lower()
+    return ISO639_2_TO_1.get(language, language)
+
+
+# Matroska (EBML) ------------------------------------------------------------------------------------------------------
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool) -> tuple[int, int]:
+    """
+    Decode an EBML variable-length integer.
+
+    Returns:
+        tuple: (value, position after the integer), value is -1 for an unknown size.
+    """
+    first = data[pos]
+    if first == 0:
+        raise ValueError("Invalid EBML variable-length integer")
+    length = 8 - first.bit_length() + 1
+    if pos + length > len(data):
+        raise ValueError("Truncated EBML variable-length integer")
+    value = first if keep_marker else first & (0xFF >> length)
+    all_ones = value == (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+        all_ones = all_ones and byte == 0xFF
+    if not keep_marker and all_ones:
+        value = -1
+    return value, pos + length
+
+
+def _iter_elements(data: bytes, pos: int, end: int):
+    """
+    Yield (id, header_start, data_start, data_end) of the EBML elements in data[pos:end].
+    An element of unknown size extends to end.
+    """
+    count = 0
+    while pos < end:
+        header_start = pos
+        element_id, pos = _read_vint(data, pos, keep_marker=True)
+        size, pos = _read_vint(data, pos, keep_marker=False)
+        data_end = end if size < 0 else pos + size
+        yield element_id, header_start, pos, data_end
+        pos = data_end
+        count += 1
+        if count > MAX_ELEMENTS:
+            raise ValueError("Too many EBML elements")
+
+
+def _read_element_header(f, offset: int) -> tuple[int, int, int]:
+    """
+    Read the header of the EBML element at a file offset.
+
+    Returns:
+        tuple: (id, data_start, size), size is -1 when unknown.
+    """
+    f.seek(offset)
+    header = f.read(12)
+    element_id, pos = _read_vint(header, 0, keep_marker=True)
+    size, pos = _read_vint(header, pos, keep_marker=False)
+    return element_id, offset + pos, size
+
+
+def _matroska_text_tracks(f) -> list[tuple[str, str]]:
+    element_id, data_start, size = _read_element_header(f, 0)
+    if element_id != EBML_HEADER:
+        raise ValueError("Not an EBML file")
+    segment_id, segment_start, _ = _read_element_header(f, data_start + size)
+    if segment_id != SEGMENT:
+        raise ValueError("No Matroska segment")
+
+    # The Tracks element is almost always within the first few KB: scan the start of the segment for it,
+    # and follow the SeekHead when a Cluster comes first.
+    f.seek(segment_start)
+    head = f.read(64 * 1024)
+    tracks_position = None
+    for element_id, header_start, start, end in _iter_elements(head, 0, len(head)):
+        if element_id == TRACKS:
+            if end <= len(head):
+                return _parse_tracks(head, start, end)
+            tracks_position = header_start
+            break
+        if element_id == SEEK_HEAD and end <= len(head):
+            tracks_position = _seek_position(head, start, end, TRACKS)
+        if element_id == CLUSTER or end > len(head):
+            break
+
+    if tracks_position is None:
+        raise ValueError("Matroska Tracks element not found")
+    element_id, data_start, size = _read_element_header(f, segment_start + tracks_position)
+    if element_id != TRACKS or size < 0 or size > MAX_TRACKS_SIZE:
+        raise ValueError("Invalid Matroska Tracks element")
+    f.seek(data_start)
+    data = f.read(size)
+    return _parse_tracks(data, 0, len(data))
+
+
+def _seek_position(data: bytes, start: int, end: int, wanted_id: int) -> int | None:
+    for element_id, _, seek_start, seek_end in _iter_elements(data, start, end):
+        if element_id != SEEK:
+            continue
+        seek_id = position = None
+        for child_id, _, child_start, child_end in _iter_elements(data, seek_start, seek_end):
+            if child_id == SEEK_ID:
+                seek_id = int.from_bytes(data[child_start:child_end], 'big')
+            elif child_id == SEEK_POSITION:
+                position = int.from_bytes(data[child_start:child_end], 'big')
+        if seek_id == wanted_id and position is not None:
+            return position
+    return None
+
+
+def _parse_tracks(data: bytes, start: int, end: int) -> list[tuple[str, str]]:
+    text_tracks = []
+    for element_id, _, entry_start, entry_end in _iter_elements(data, start, end):
+        if element_id != TRACK_ENTRY:
+            continue
+        track_type, codec, language, language_bcp47 = None, '', 'eng', None  # Matroska default language is eng
+        for child_id, _, child_start, child_end in _iter_elements(data, entry_start, entry_end):
+            value = data[child_start:child_end]
+            if child_id == TRACK_TYPE:
+                track_type = int.from_bytes(value, 'big')
+            elif child_id == CODEC_ID:
+                codec = value.rstrip(b'\0').decode('ascii')
+            elif child_id == LANGUAGE:
+                language = value.rstrip(b'\0').decode('ascii')
+            elif child_id == LANGUAGE_BCP47:
+                language_bcp47 = value.rstrip(b'\0').decode('ascii')
+        if track_type == MATROSKA_SUBTITLE_TRACK:
+            text_tracks.append((codec, language_bcp47.lower() if language_bcp47 else normalize_language(language)))
+    return text_tracks
+
+
+# MP4 / QuickTime (ISO BMFF) -------------------------------------------------------------------------------------------
+
+def _iter_boxes(f, start: int, end: int):
+    """
+    Yield (type, payload_start, box_end) of the boxes in the file range [start, end), reading only box headers.
+    """
+    pos = start
+    count = 0
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(16)
+        size, box_type = struct.unpack('>I4s', header[:8])
+        payload_start = pos + 8
+        if size == 1:
+            size = struct.unpack('>Q', header[8:16])[0]
+            payload_start = pos + 16
+        elif size == 0:
+            size = end - pos
+        if size < payload_start - pos or pos + size > end:
+            raise ValueError(f"Invalid MP4 box size for {box_type!r}")
+        yield box_type, payload_start, pos + size
+        pos += size
+        count += 1
+        if count > MAX_ELEMENTS:
+            raise ValueError("Too many MP4 boxes")
+
+
+def _find_box(f, start: int, end: int, box_type: bytes) -> tuple[int, int] | None:
+    for child_type, payload_start, box_end in _iter_boxes(f, start, end):
+        if child_type == box_type:
+            return payload_start, box_end
+    return None
+
+
+def _mp4_language(packed: int) -> str:
+    if packed == 0x7FFF:
+        return ''
+    if packed < 0x400:
+        return MAC_LANGUAGES[packed] if packed < len(MAC_LANGUAGES) else ''
+    code = ''.join(chr(((packed >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0))
+    return normalize_language(code)
+
+
+def _mp4_text_tracks(f, file_size: int) -> list[tuple[str, str]]:
+    moov = _find_box(f, 0, file_size, b'moov')
+    if moov is None:
+        raise ValueError("MP4 moov box not found")
+
+    text_tracks = []
+    for box_type, trak_start, trak_end in _iter_boxes(f, *moov):
+        if box_type != b'trak':
+            continue
+        mdia = _find_box(f, trak_start, trak_end, b'mdia')
+        if mdia is None:
+            continue
+
+        handler = language = extended_language = None
+        minf = None
+        for child_type, child_start, child_end in _iter_boxes(f, *mdia):
+            if child_type == b'hdlr':
+                f.seek(child_start + 8)  # version/flags, pre_defined
+                handler = f.read(4)
+            elif child_type == b'mdhd':
+                f.seek(child_start)
+                version = f.read(1)[0]
+                f.seek(child_start + (32 if version == 1 else 20))
+                language = _mp4_language(struct.unpack('>H', f.read(2))[0] & 0x7FFF)
+            elif child_type == b'elng':
+                f.seek(child_start + 4)
+                extended_language = f.read(min(child_end - child_start - 4, 64)).split(b'\0')[0].decode('ascii')
+            elif child_type == b'minf':
+                minf = (child_start, child_end)
+
+        if handler not in MP4_TEXT_HANDLERS:
+            continue
+
+        codec = ''
+        stbl = _find_box(f, *minf, b'stbl') if minf else None
+        stsd = _find_box(f, *stbl, b'stsd') if stbl else None
+        if stsd and stsd[1] - stsd[0] >= 16:
+            f.seek(stsd[0] + 12)  # version/flags, entry_count, first entry size
+            codec = f.read(4).decode('latin-1')
+
+        text_tracks.append((codec, extended_language.lower() if extended_language else (language or '')))
+    return text_tracks
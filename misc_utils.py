@@ -1,6 +1,13 @@
-import os
+import re
+import fnmatch
+import unicodedata
 from collections.abc import Generator
 
+from fs_backend import get_fs
+
+SUBTITLE_EXTENSIONS = ('.srt', '.sub', '.vtt')
+MOVIE_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.mpg')
+
 def _subdirs(root: str) -> Generator[str, None, None]:
     """
     Yield the names of subdirectories within the specified root directory.
@@ -11,8 +18,8 @@ def _subdirs(root: str) -> Generator[str, None, None]:
     Yields:
         str: Name of each subdirectory within the root directory.
     """
-    for file in os.listdir(root):
-        if os.path.isdir(os.path.join(root, file)):
+    for file, is_dir in get_fs().scandir(root):
+        if is_dir:
             yield file
 
 def _files(root: str) -> Generator[str, None, None]:
@@ -23,10 +30,11 @@ def _files(root: str) -> Generator[str, None, None]:
         root (str): The path of the root directory to search.
 
     Yields:
-        str: Name of each file within the root directory.
+        str: Name of each regular file within the root directory (the backend leaves out dangling symlinks,
+             sockets and other special files, as os.path.isfile does).
     """
-    for file in os.listdir(root):
-        if os.path.isfile(os.path.join(root, file)):
+    for file, is_dir in get_fs().scandir(root):
+        if not is_dir:
             yield file
 
 def _movie_files(root: str) -> Generator[str, None, None]:
@@ -41,9 +49,8 @@ def _movie_files(root: str) -> Generator[str, None, None]:
         str: Name of each movie file within the root directory, with extensions 
              like .mp4, .mkv, .avi, .mov, .wmv, .flv, .mpeg, .mpg.
     """
-    movie_extensions = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.mpg'}
     for file in _files(root):
-        if any(file.lower().endswith(ext) for ext in movie_extensions):
+        if file.lower().endswith(MOVIE_EXTENSIONS):
             yield file
 
 def _subtitle_files(root: str) -> Generator[str, None, None]:
@@ -58,7 +65,152 @@ def _subtitle_files(root: str) -> Generator[str, None, None]:
         str: Name of each subtitle file within the root directory, with extensions 
              like .srt, .sub, .vtt.
     """
-    sub_extensions = {'.srt', '.sub', '.vtt'}
     for file in _files(root):
-        if any(file.lower().endswith(ext) for ext in sub_extensions):
+        if file.lower().endswith(SUBTITLE_EXTENSIONS):
             yield file
+
+# Folders that never hold a movie of their own: NAS/OS metadata and recycle bins, and movie extras
+DEFAULT_EXCLUDES = [
+    '@eaDir', '.@__thumb', '@Recycle', '#recycle', '#snapshot', '.AppleDouble', '.AppleDB', '.Trash*',
+    '$RECYCLE.BIN', 'System Volume Information', 'lost+found', '.streams',
+    'Extras', 'Featurettes', 'Sample', 'Samples', 'Behind The Scenes', 'Deleted Scenes', 'Trailers', 'Interviews',
+]
+
+class PathFilter:
+    """
+    PathFilter decides which folders are traversed and processed, from their name and depth only,
+    so excluded trees are pruned before they are opened.
+
+    The glob patterns (fnmatch syntax, case insensitive, matched against the folder name) are compiled
+    once into a single regular expression per list.
+
+    Attributes:
+        excludes (list[str]): Patterns of folders neither processed nor traversed.
+        includes (list[str]): Patterns of folders processed as movie folders (all when empty).
+        max_depth (int): Deepest folder level traversed, 1 being the children of the root (None = unlimited).
+    """
+
+    def __init__(self, excludes: list[str] = None, includes: list[str] = None, max_depth: int = None, default_excludes: bool = True):
+        """
+        Compile the filter.
+
+        Args:
+            excludes (list[str]): Patterns of folders to skip, added to the default ones.
+            includes (list[str]): Patterns of folders to process, the others are only traversed.
+            max_depth (int): Deepest folder level traversed, 1 being the children of the root.
+            default_excludes (bool): Whether to skip DEFAULT_EXCLUDES too.
+        """
+        self.excludes = (DEFAULT_EXCLUDES if default_excludes else []) + list(excludes or [])
+        self.includes = list(includes or [])
+        self.max_depth = max_depth
+        self._exclude_re = self._compile(self.excludes)
+        self._include_re = self._compile(self.includes)
+
+    @staticmethod
+    def _compile(patterns: list[str]):
+        if not patterns:
+            return None
+        return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns), re.IGNORECASE)
+
+    def allows(self, name: str, depth: int) -> bool:
+        """
+        Check if a folder may be opened (traversed or processed).
+
+        Args:
+            name (str): Name of the folder.
+            depth (int): Level of the folder, 1 being the children of the root.
+
+        Returns:
+            bool: False if the folder is excluded or deeper than max_depth.
+        """
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        return not (self._exclude_re and self._exclude_re.match(name))
+
+    def includes_folder(self, name: str) -> bool:
+        """
+        Check if a folder should be processed as a movie folder.
+
+        Args:
+            name (str): Name of the folder.
+
+        Returns:
+            bool: True if no include patterns were given or the name matches one of them.
+        """
+        return not self._include_re or bool(self._include_re.match(name))
+
+# Tokens of release descriptions (resolution, source, codecs) that end the title part of a folder name
+STRONG_RELEASE_TOKEN_PATTERN = re.compile(
+    r"^(\d{3,4}[pi]|[48]k|uhd|bluray|blu-ray|bdrip|brrip|bdremux|remux|dvdrip|dvdscr|dvd|dvd5|dvd9|webrip|web-dl|webdl|hdtv|hdrip|"
+    r"x264|x265|h264|h265|hevc|avc|xvid|divx|10bit|hdr|hdr10|aac|ac3|dts|dd5|truehd)$",
+    re.IGNORECASE)
+# Release tokens that are also everyday words ('Madame.Web', 'Internal.Affairs'): only release tokens after a strong one
+WEAK_RELEASE_TOKEN_PATTERN = re.compile(
+    r"^(web|dv|atmos|proper|repack|extended|unrated|remastered|theatrical|directors|dc|imax|limited|internal|multi|dual|subbed|dubbed)$",
+    re.IGNORECASE)
+
+def release_tokens(name: str) -> list[str]:
+    """
+    Get the release tokens of a name, everyday words counting only once a strong token (resolution, source, codec) is seen.
+
+    Args:
+        name (str): The folder or file name, e.g. 'Madame.Web.1080p.WEB-DL.x264'.
+
+    Returns:
+        list[str]: The release tokens lower-cased, in order, e.g. ['1080p', 'web-dl', 'x264'].
+    """
+    tokens, strong_seen = [], False
+    for word in re.split(r'[ ._()\[\]]+', name.lower()):
+        # 'web-dl' is one token, 'x264-GRP' is a codec then a release group
+        for token in [word] if STRONG_RELEASE_TOKEN_PATTERN.match(word) else word.split('-'):
+            if STRONG_RELEASE_TOKEN_PATTERN.match(token):
+                strong_seen = True
+                tokens.append(token)
+            elif strong_seen and WEAK_RELEASE_TOKEN_PATTERN.match(token):
+                tokens.append(token)
+    return tokens
+
+def normalize_title(title: str) -> str:
+    """
+    Normalize a movie title for lookups: accents removed, lower case, '&' as 'and', apostrophes dropped and
+    any other punctuation (dots, dashes, colons...) turned into single spaces.
+
+    Args:
+        title (str): The title to normalize.
+
+    Returns:
+        str: The normalized title.
+    """
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(c for c in title if not unicodedata.combining(c)).lower()
+    title = title.replace('&', ' and ').replace("'", '').replace('\u2019', '')
+    return ' '.join(re.findall(r'[^\W_]+', title))
+
+def split_release_name(folder_name: str) -> tuple[str, str]:
+    """
+    Split a folder name with no year into the title and the release description, at the first strong release token
+    (resolution, source or codec): words like 'Web' or 'Internal' before it belong to the title.
+
+    Args:
+        folder_name (str): The folder name, e.g. 'The.Matrix.1080p.BluRay.x264'.
+
+    Returns:
+        tuple: (title, release) e.g. ('The Matrix', '1080p.BluRay.x264'), release is empty if no release token is found.
+    """
+    tokens = [token for token in re.split(r'[ ._]+', folder_name) if token]
+    for i, token in enumerate(tokens):
+        if STRONG_RELEASE_TOKEN_PATTERN.match(token.strip('[]()')):
+            return ' '.join(tokens[:i]), '.'.join(token.strip('[]()') for token in tokens[i:])
+    return ' '.join(tokens), ''
+
+def add_path_filter_arguments(parser):
+    """
+    Add the folder filter options shared by the tools to an argument parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the options to.
+    """
+    parser.add_argument('--exclude', '-X', action='append', default=[], metavar='GLOB', help="Skip folders matching this name pattern (repeatable), in addition to NAS metadata and extras folders.")
+    parser.add_argument('--include', '-I', action='append', default=[], metavar='GLOB', help="Only process folders matching this name pattern (repeatable), others are still traversed.")
+    parser.add_argument('--max-depth', type=int, default=None, help="Do not traverse deeper than this folder level (1 = the children of the path).")
+    parser.add_argument('--no-default-excludes', action='store_true', help=f"Do not skip the default folders: {', '.join(DEFAULT_EXCLUDES)}.")
@@ -2,9 +2,11 @@ import os
 import shutil
 import json
 import yaml
+import zipfile
 
-from pymediainfo import MediaInfo
 from logger_class import LoggerClass  # Import the LoggerClass from its file
+from run_metrics import get_metrics
+from fs_backend import get_fs
 
 class Movie:
     def __init__(self, movpath: str, demo: bool, logger: LoggerClass):
@@ -16,6 +18,12 @@ class Movie:
         self.file_base, self.file_ext = os.path.splitext(self.file_name)
         self.target_subtitle_path = os.path.join(self.folder_path, self.file_base + '.srt')
 
+        # filled in lazily by get_text_languages() so the container is only probed once per movie
+        self.text_languages = None
+        # outcome of the subtitle search, set by SubtitleManager (existing, embedded, folder, subs, archive, orphan, none)
+        self.subtitle_path = None
+        self.subtitle_source = None
+
         #self.logger.log_debug(f"Created Movie object:\n{json.dumps(self.__json__(), indent=4)}")
         # self.logger.log_debug(f"Created Movie object: {yaml.dump(self.__json__())}")
 
@@ -43,6 +51,21 @@ class Movie:
     def __yaml__(self):
         return yaml.dump(self.__json__())
 
+    def get_text_languages(self) -> list[str]:
+        """
+        Get the languages of the text tracks embedded in the movie file, probing the file only once.
+        Matroska and MP4 track headers are read natively, other containers (or files the native probe
+        cannot parse) are analyzed with MediaInfo (see LocalFS.probe_text_languages).
+
+        Returns:
+            list[str]: Lower-cased language codes of the text tracks (empty string for tracks with no language).
+        """
+        if self.text_languages is None:
+            get_metrics().inc('probes')
+            with get_metrics().timer('probe_duration'):
+                self.text_languages = get_fs().probe_text_languages(self.full_path, self.logger)
+        return self.text_languages
+
     def has_embedded_subtitles(self, lang: str, logger: LoggerClass) -> bool:
         """
         Check if the movie has embedded subtitles in the specified language.
@@ -53,41 +76,49 @@ class Movie:
         Returns:
             bool: True if embedded subtitles in the specified language are found, otherwise False.
         """
-        media_info = MediaInfo.parse(os.path.join(self.folder_path, self.file_name))
         langs = {'english': 'en', 'spanish': 'sp'}
+        text_languages = self.get_text_languages()
 
-        ret_val = any(track.track_type == 'Text' and track.language is not None and track.language.lower() == langs[lang] for track in media_info.tracks)
+        ret_val = langs[lang] in text_languages
         if logger.get_loglevel() == 'DEBUG': # only execute this code if needed for debug mode
-            if len(media_info.tracks) == 0:
+            if len(text_languages) == 0:
                 logger.log_debug(f"{self.file_name}: No text tracks found in media file")
             else:
-                for track in media_info.tracks:
-                    if track.track_type == 'Text':
-                        logger.log_debug(f"Text Tracks found [{self.file_name}]: Type={track.track_type}, Lang={track.language}, found '{langs[lang]}'?={'Yes' if langs[lang]==track.language else 'Nope'}")
-            logger.log_debug(f"{self.file_name}: {'Found' if ret_val else 'Didn\'t find'} embedded subtitles in {lang}: {ret_val}")
+                for track_lang in text_languages:
+                    logger.log_debug(f"Text Tracks found [{self.file_name}]: Type=Text, Lang={track_lang}, found '{langs[lang]}'?={'Yes' if langs[lang]==track_lang else 'Nope'}")
+            found = 'Found' if ret_val else "Didn't find"
+            logger.log_debug(f"{self.file_name}: {found} embedded subtitles in {lang}: {ret_val}")
         return ret_val
 
-    def set_subtitle_file(self, subtitle_path: str) -> bool:
+    def set_subtitle_file(self, subtitle_path: str, member: str = None) -> bool:
         """
         Rename or copy the subtitle file to the movie's folder with the name of the target_subtitle path (same as movie with extension .srt).
 
         Args:
-            subtitle_path (str): Path to the subtitle file.
+            subtitle_path (str): Path to the subtitle file, or to the zip archive containing it.
+            member (str): Name of the subtitle inside the zip archive, extracted straight to the target path.
 
         Returns:
             bool: True if the operation was successful, otherwise False.
         """
-        if os.path.exists(self.target_subtitle_path):
+        fs = get_fs()
+        source_path = os.path.join(subtitle_path, member) if member else subtitle_path
+        if fs.exists(self.target_subtitle_path):
             self.logger.log_debug(f"Subtitle already exists at {self.target_subtitle_path}. Skipping.")
             return True
 
         try:
             if self.demo:
-                self.logger.log_debug(f"\tCopying subtitle from [{subtitle_path}] to [{self.target_subtitle_path}]")
+                self.logger.log_debug(f"\tCopying subtitle from [{source_path}] to [{self.target_subtitle_path}]")
             else:
-                shutil.copy2(subtitle_path, self.target_subtitle_path)
+                if member:
+                    self._extract_subtitle(subtitle_path, member)
+                else:
+                    fs.copy2(subtitle_path, self.target_subtitle_path)
+                get_metrics().inc('subtitles_placed')
+                get_metrics().inc('bytes_copied', fs.getsize(self.target_subtitle_path))
             self.logger.log_info("="*80)
-            self.logger.log_info(f"[{self.folder_path}] Copied subtitle file from [{subtitle_path}] to [{self.target_subtitle_path}]")
+            self.logger.log_info(f"[{self.folder_path}] Copied subtitle file from [{source_path}] to [{self.target_subtitle_path}]")
         except FileNotFoundError as e:
             self.logger.log_error(f"*** Subtitle file not found: {e} ***")
             return False
@@ -97,9 +128,31 @@ class Movie:
         except OSError as e:
             self.logger.log_error(f"*** OS error occurred while copying subtitle file: {e} ***")
             return False
+        except zipfile.BadZipFile as e:
+            self.logger.log_error(f"*** Corrupt subtitle archive [{subtitle_path}]: {e} ***")
+            return False
         except Exception as e:
             # Log any other unexpected exceptions
             self.logger.log_error(f"*** Unexpected error occurred: {e} ***")
             return False
         
         return True
+
+    def _extract_subtitle(self, archive_path: str, member: str):
+        """
+        Extract a subtitle from a zip archive straight to the target subtitle path (no temporary file),
+        a partially written target is removed if the extraction fails.
+
+        Args:
+            archive_path (str): Path of the zip archive.
+            member (str): Name of the subtitle inside the archive.
+        """
+        fs = get_fs()
+        with fs.open(archive_path, 'rb') as f, zipfile.ZipFile(f) as archive, archive.open(member) as src:
+            try:
+                with fs.open(self.target_subtitle_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            except BaseException:
+                if fs.exists(self.target_subtitle_path):
+                    fs.remove(self.target_subtitle_path)
+                raise
@@ -1,22 +1,38 @@
 import os
+import re
 import shutil
 import yaml
 import json
+import zipfile
 
-from misc_utils import _files, _subdirs, _movie_files, _subtitle_files
+from misc_utils import _files, _subdirs, _movie_files, _subtitle_files, SUBTITLE_EXTENSIONS
 from movie_class import Movie
 from logger_class import LoggerClass  # Import the LoggerClass from its file
+from fs_backend import get_fs
 
 class SubtitleManager:
-    def __init__(self, logger: LoggerClass, demo: bool):
+    # Name tokens identifying the language of a language folder, subtitle file or archive member
+    # (other languages are listed so their subtitles are not taken for untagged ones, ambiguous words like 'it' are left out)
+    LANGUAGE_TOKENS = {
+        'english': {'english', 'eng', 'en'},
+        'spanish': {'spanish', 'spa', 'es', 'esp', 'espanol', 'español', 'castellano', 'latino'},
+        'french': {'french', 'fre', 'fra', 'fr', 'francais', 'français'},
+        'german': {'german', 'ger', 'deu', 'deutsch'},
+        'italian': {'italian', 'ita', 'italiano'},
+        'portuguese': {'portuguese', 'por', 'pt', 'ptbr', 'portugues', 'português'},
+    }
+
+    def __init__(self, logger: LoggerClass, demo: bool, orphan_index=None):
         """
         Initialize class:
         Args:
             logger (LoggerClass): Logger instance to record the operations.
             demo (bool): Flag to enable demo mode where no actual changes are made. 
+            orphan_index (SubtitleIndex): Optional index of the stray subtitles of the library, searched last.
         """
         self.logger = logger
         self.demo = demo
+        self.orphan_index = orphan_index
         self.sub_ext = '.srt'  # Subtitle file extension
 
     def find_largest_srt_file(self, folder_path: str, sub_lang: str) -> str:
@@ -37,7 +53,7 @@ class SubtitleManager:
             return ''
         self.logger.log_debug(f"{folder_path} Subtitles found: {srt_files}")
         
-        largest_file = max(srt_files, key=lambda x: os.path.getsize(os.path.join(folder_path, x)), default='')
+        largest_file = max(srt_files, key=lambda x: get_fs().getsize(os.path.join(folder_path, x)), default='')
         self.logger.log_debug(f"Largest file found: {largest_file}")
         return os.path.join(folder_path, largest_file)
 
@@ -51,10 +67,33 @@ class SubtitleManager:
         Returns:
             bool: True if a subtitle file was successfully found, otherwise False.
         """
+        source, subtitle_path, member = self.plan_subtitle(movie)
+        if source in ('folder', 'subs', 'archive', 'orphan'):
+            return self._place_subtitle(movie, subtitle_path, source, member)
+
+        if source == 'none':
+            self.logger.log_info("="*50)
+            self.logger.log_info(f"[{movie.folder_path}]: No suitable subtitle file found for movie [{movie.file_name}].")
+        movie.subtitle_path, movie.subtitle_source = subtitle_path, source
+        return source != 'none'
+
+    def plan_subtitle(self, movie: Movie) -> tuple[str, str | None, str | None]:
+        """
+        Decide which subtitle the movie should get, without changing anything on disk.
+
+        Args:
+            movie (Movie): The movie object to decide for.
+
+        Returns:
+            tuple: (source, subtitle_path, member) where source is existing (target subtitle already there), embedded
+                   (text track in the movie file), folder, subs or orphan (file to copy to the target, orphan being a
+                   stray subtitle found in the orphan index), archive (member of the zip archive at subtitle_path to
+                   extract to the target) or none.
+        """
         srt_file_path = movie.target_subtitle_path #os.path.join(movie.folder_path, movie.file_name + self.sub_ext)
-        if os.path.exists(srt_file_path):
+        if get_fs().exists(srt_file_path):
             self.logger.log_debug(f"[{movie.folder_path}]: Subtitle file [{srt_file_path}] already exists.")
-            return True
+            return 'existing', srt_file_path, None
 
         langs2chk = ['spanish', 'english'] if 'spanish' in movie.file_name.lower() else ['english', 'spanish']
 
@@ -64,21 +103,154 @@ class SubtitleManager:
             # Check for embedded subtitles first
             if movie.has_embedded_subtitles(sub_lang, self.logger):
                 self.logger.log_debug(f"[{movie.folder_path}]: Embedded {sub_lang} subtitles found in [{movie.file_name+movie.file_ext}].")
-                return True
+                return 'embedded', None, None
 
             # Look for another subtitle file in the movie's folder and make as target
             largest_file = self.find_largest_srt_file(movie.folder_path, sub_lang)
             if largest_file:
-                return movie.set_subtitle_file(largest_file)
+                return 'folder', largest_file, None
             
             # Look for subtitle files in the 'subs' folder
             subs_folder = os.path.join(movie.folder_path, 'subs')
-            if os.path.exists(subs_folder):
+            if get_fs().isdir(subs_folder):
                 largest_file = self.find_largest_srt_file(subs_folder, sub_lang)
                 if largest_file:
-                    return movie.set_subtitle_file(largest_file)
+                    return 'subs', largest_file, None
 
-        self.logger.log_info("="*50)
-        self.logger.log_info(f"[{movie.folder_path}]: No suitable subtitle file found for movie [{movie.file_name}].")
-        
+                # Then in its language folders (subs/English/*.srt) and zip archives
+                packed = self.find_packed_subtitle(subs_folder, sub_lang)
+                if packed:
+                    subtitle_path, member = packed
+                    return 'archive' if member else 'subs', subtitle_path, member
+
+        # Last resort: a stray subtitle elsewhere in the library (parent, sibling or shared subtitles folder)
+        if self.orphan_index:
+            for sub_lang in langs2chk:
+                orphan = self.find_orphan_subtitle(movie, sub_lang)
+                if orphan:
+                    return 'orphan', orphan, None
+
+        return 'none', None, None
+
+    def find_orphan_subtitle(self, movie: Movie, sub_lang: str) -> str | None:
+        """
+        Find the best stray subtitle of a movie in the orphan index.
+
+        The index ranks the matches by release name and size; among them a subtitle tagged with the language wins,
+        then an untagged one. Subtitles tagged with another language are left for that language.
+
+        Args:
+            movie (Movie): The movie object to find a subtitle for.
+            sub_lang (str): Language of the subtitle to look for.
+
+        Returns:
+            str: The path of the subtitle found, or None.
+        """
+        matches = self.orphan_index.match(os.path.basename(movie.folder_path), movie.file_base)
+        untagged = None
+        for path, size, names in matches:
+            lang = self._language_of(*names)
+            if lang == sub_lang:
+                self.logger.log_debug(f"Stray {sub_lang} subtitle found: {path} ({size} bytes)")
+                return path
+            if lang is None and untagged is None:
+                untagged = path
+        if untagged:
+            self.logger.log_debug(f"Stray untagged subtitle found: {untagged}")
+        return untagged
+
+    def find_packed_subtitle(self, subs_folder: str, sub_lang: str) -> tuple[str, str | None] | None:
+        """
+        Find the best subtitle in the language folders and zip archives of a subs folder.
+
+        Candidates are ranked from their names and sizes only (read from the central directory for archive
+        members, nothing is extracted): tagged with the language first, then untagged, largest first.
+        Candidates tagged with another language are left for that language.
+
+        Args:
+            subs_folder (str): Path to the subs folder.
+            sub_lang (str): Language of the subtitle to look for.
+
+        Returns:
+            tuple: (path, member) of the best candidate, member being the name of the subtitle inside the zip archive
+                   at path (None for a plain file), or None if no candidate is found.
+        """
+        fs = get_fs()
+        candidates = []
+        for name, is_dir in fs.scandir(subs_folder):
+            path = os.path.join(subs_folder, name)
+            if is_dir:
+                for file_name in _subtitle_files(path):
+                    file_path = os.path.join(path, file_name)
+                    try:
+                        size = fs.getsize(file_path)
+                    except OSError as e:
+                        self.logger.log_warning(f"*** Could not read [{file_path}], skipped: {e} ***")
+                        continue
+                    candidates.append((self._language_of(name, file_name), size, file_path, None))
+            elif name.lower().endswith('.zip'):
+                for member, size in self._archive_members(path):
+                    candidates.append((self._language_of(name, *member.split('/')), size, path, member))
+
+        candidates = [candidate for candidate in candidates if candidate[0] in (sub_lang, None)]
+        if not candidates:
+            self.logger.log_debug(f"No {sub_lang} subtitle found in the language folders or archives of {subs_folder}")
+            return None
+        _, size, path, member = max(candidates, key=lambda candidate: (candidate[0] == sub_lang, candidate[1]))
+        self.logger.log_debug(f"Best packed subtitle found: {os.path.join(path, member) if member else path} ({size} bytes)")
+        return path, member
+
+    def _archive_members(self, archive_path: str) -> list[tuple[str, int]]:
+        """
+        List the subtitle members of a zip archive from its central directory.
+
+        Args:
+            archive_path (str): Path of the zip archive.
+
+        Returns:
+            list: (member name, uncompressed size) of the readable subtitle members, empty if the archive cannot be read.
+        """
+        try:
+            with get_fs().open(archive_path, 'rb') as f, zipfile.ZipFile(f) as archive:
+                return [(info.filename, info.file_size) for info in archive.infolist()
+                        if not info.is_dir() and info.filename.lower().endswith(SUBTITLE_EXTENSIONS)
+                        and not info.flag_bits & 0x1]  # encrypted members cannot be extracted
+        except (OSError, zipfile.BadZipFile) as e:
+            self.logger.log_warning(f"*** Could not read archive [{archive_path}]: {e} ***")
+            return []
+
+    def _language_of(self, *names: str) -> str | None:
+        """
+        Get the language a subtitle is tagged with, the innermost name (file name, then folder) wins.
+
+        Args:
+            names (str): Names of the folders/archive then of the subtitle file, outermost first.
+
+        Returns:
+            str: The language (a key of LANGUAGE_TOKENS), or None if untagged.
+        """
+        for name in reversed(names):
+            tokens = set(re.split(r'[\W_]+', name.lower()))
+            for lang, lang_tokens in self.LANGUAGE_TOKENS.items():
+                if tokens & lang_tokens:
+                    return lang
+        return None
+
+    def _place_subtitle(self, movie: Movie, subtitle_path: str, source: str, member: str = None) -> bool:
+        """
+        Set the subtitle file of the movie and record where it came from.
+
+        Args:
+            movie (Movie): The movie object to set the subtitle for.
+            subtitle_path (str): Path of the subtitle file (or zip archive) to use.
+            source (str): Where the subtitle file was found (folder, subs, archive, orphan).
+            member (str): Name of the subtitle inside the zip archive.
+
+        Returns:
+            bool: True if the subtitle file was set, otherwise False.
+        """
+        if movie.set_subtitle_file(subtitle_path, member):
+            movie.subtitle_path = os.path.join(subtitle_path, member) if member else subtitle_path
+            movie.subtitle_source = source
+            return True
         return False
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import multiprocessing
+
+from pymediainfo import MediaInfo
+
+try:
+    import resource  # POSIX only, the memory limit is not applied elsewhere
+except ImportError:
+    resource = None
+
+
+def _probe_worker(conn, memory_bytes: int):
+    """
+    Probe loop run in the worker subprocess: receives file paths, sends back the text track languages.
+
+    Args:
+        conn (multiprocessing.connection.Connection): Pipe to the supervisor.
+        memory_bytes (int): Address space limit of the process (0 = unlimited).
+    """
+    if memory_bytes and resource:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    while True:
+        try:
+            path = conn.recv()
+        except EOFError:
+            return
+        if path is None:
+            return
+        try:
+            media_info = MediaInfo.parse(path)
+            conn.send(('ok', [(track.language or '').lower() for track in media_info.tracks if track.track_type == 'Text']))
+        except MemoryError:
+            conn.send(('memory', 'memory limit exceeded'))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+class ProbeSupervisor:
+    """
+    ProbeSupervisor runs MediaInfo probes in a worker subprocess, so a corrupt or pathological file cannot hang
+    or crash the run: each probe has a timeout, the worker has a memory limit, and a worker that times out,
+    runs out of memory or dies is replaced for the next probe.
+
+    Files that made a probe fail that way are quarantined (keyed by path, size and mtime, so a replaced file is
+    probed again) and skipped by later probes; the quarantine is persisted when a file is given.
+
+    Attributes:
+        timeout (float): Seconds a probe may take before the worker is killed.
+        memory_mb (int): Memory limit of the worker in MB (0 = unlimited, POSIX only).
+        quarantine_file (str): Path of the JSON file persisting the quarantine, None to keep it for the run only.
+        quarantine (dict): Quarantined paths with their size, mtime, reason and date.
+    """
+
+    def __init__(self, timeout: float = 60.0, memory_mb: int = 2048, quarantine_file: str = None):
+        """
+        Initialize the supervisor (the worker is only started by the first probe).
+
+        Args:
+            timeout (float): Seconds a probe may take before the worker is killed.
+            memory_mb (int): Memory limit of the worker in MB (0 = unlimited).
+            quarantine_file (str): Path of the JSON file persisting the quarantine.
+        """
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.quarantine_file = quarantine_file
+        self.quarantine = self._load_quarantine()
+
+        # spawn rather than fork: the tools run logging and metrics threads whose locks a fork could copy held
+        self._context = multiprocessing.get_context('spawn')
+        self._process = None
+        self._conn = None
+
+    def probe(self, path: str, logger=None) -> list[str]:
+        """
+        Get the languages of the text tracks of a movie file with MediaInfo, in the worker subprocess.
+
+        Args:
+            path (str): Path of the movie file.
+            logger (LoggerClass): Optional logger for warnings and debug messages.
+
+        Returns:
+            list[str]: Lower-cased language codes of the text tracks, empty if the file is quarantined or the probe failed.
+        """
+        if self.is_quarantined(path):
+            if logger:
+                logger.log_debug(f"{os.path.basename(path)}: quarantined ({self.quarantine[path]['reason']}), not probed")
+            return []
+
+        self._start_worker()
+        try:
+            self._conn.send(path)
+            if not self._conn.poll(self.timeout):
+                self._stop_worker(kill=True)
+                return self._fail(path, f"timed out after {self.timeout:g}s", logger)
+            status, result = self._conn.recv()
+        except (EOFError, OSError):
+            exitcode = self._process.exitcode
+            self._stop_worker(kill=True)
+            return self._fail(path, f"probe process died (exit code {exitcode})", logger)
+
+        if status == 'ok':
+            return result
+        if status == 'memory':
+            # the worker may be left in a bad state after a MemoryError: start a fresh one for the next probe
+            self._stop_worker(kill=True)
+            return self._fail(path, result, logger)
+        if logger:
+            logger.log_error(f"*** Could not probe [{path}]: {result} ***")
+        return []
+
+    def is_quarantined(self, path: str) -> bool:
+        """
+        Check if a file is quarantined (and has not changed since).
+
+        Args:
+            path (str): Path of the movie file.
+
+        Returns:
+            bool: True if the file is quarantined.
+        """
+        entry = self.quarantine.get(path)
+        if not entry:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return entry['size'] == st.st_size and entry['mtime'] == st.st_mtime
+
+    def close(self):
+        """
+        Stop the worker subprocess.
+        """
+        self._stop_worker(kill=False)
+
+    def _fail(self, path: str, reason: str, logger) -> list[str]:
+        if logger:
+            logger.log_warning(f"*** Probe of [{path}] {reason}, quarantining the file ***")
+        try:
+            st = os.stat(path)
+        except OSError:
+            return []
+        self.quarantine[path] = {'size': st.st_size, 'mtime': st.st_mtime, 'reason': reason, 'quarantined': time.time()}
+        self._save_quarantine(logger)
+        return []
+
+    def _start_worker(self):
+        if self._process and self._process.is_alive():
+            return
+        if self._process:
+            # died between two probes
+            self._stop_worker(kill=True)
+        self._conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(target=_probe_worker, args=(child_conn, self.memory_mb * 1024 * 1024),
+                                              name='probe-worker', daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def _stop_worker(self, kill: bool):
+        if not self._process:
+            return
+        if kill:
+            self._process.kill()
+        else:
+            try:
+                self._conn.send(None)
+            except OSError:
+                pass
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._conn.close()
+        self._process = self._conn = None
+
+    def _load_quarantine(self) -> dict:
+        if not self.quarantine_file or not os.path.exists(self.quarantine_file):
+            return {}
+        try:
+            with open(self.quarantine_file, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_quarantine(self, logger):
+        if not self.quarantine_file:
+            return
+        tmp_file = f"{self.quarantine_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.quarantine, f, indent=1)
+            os.replace(tmp_file, self.quarantine_file)
+        except OSError as e:
+            if logger:
+                logger.log_error(f"*** Could not save quarantine file [{self.quarantine_file}]: {e} ***")
+
+
+def add_probe_arguments(parser):
+    """
+    Add the probe supervision options shared by the tools to an argument parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the options to.
+    """
+    parser.add_argument('--probe-timeout', type=float, default=60.0, help="Seconds a MediaInfo probe may take before it is killed and the file quarantined (default 60, 0 = probe in-process without supervision).")
+    parser.add_argument('--probe-memory-mb', type=int, default=2048, help="Memory limit of the MediaInfo probe process in MB (default 2048, 0 = unlimited, POSIX only).")
+    parser.add_argument('--quarantine', type=str, default=None, help="Persist the files whose probe timed out or crashed in this JSON file, so later runs skip them.")
@@ -0,0 +1,163 @@
+import sys
+import time
+import logging
+import threading
+
+from run_metrics import get_metrics
+
+
+class ProgressDisplay:
+    """
+    ProgressDisplay keeps a single status line at the bottom of the terminal with the progress of the run:
+    movie folders done out of the (estimated) total, folders/sec, probes/sec, bytes copied, elapsed time and ETA.
+
+    The total is estimated while the library is walked: folders discovered but not visited yet are assumed
+    to hold movie folders at the rate seen so far, so the estimate converges to the exact count when the walk ends.
+    The line is redrawn at most every refresh_interval seconds by a background thread, on stderr, and cleared
+    before every log record written to the console so log lines never mix with it.
+
+    Attributes:
+        enabled (bool): False when the output is not a terminal or the console is silent, everything is then a no-op.
+        done (int): Movie folders processed.
+    """
+
+    def __init__(self, silent: bool = False, stream=None, refresh_interval: float = 0.5):
+        """
+        Initialize the display (nothing is drawn before start).
+
+        Args:
+            silent (bool): Console output suppressed, disables the display.
+            stream (file): Stream the status line is written to (default: stderr).
+            refresh_interval (float): Minimum number of seconds between two redraws.
+        """
+        self.stream = stream or sys.stderr
+        self.enabled = not silent and self.stream.isatty()
+        self.refresh_interval = refresh_interval
+
+        self.done = 0
+        self.found = 0
+        self.discovered = 0
+        self.visited = 0
+
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._line_shown = False
+        self._stop_event = threading.Event()
+        self._ticker = None
+
+    def start(self, console_handler: logging.Handler = None):
+        """
+        Start redrawing the status line.
+
+        Args:
+            console_handler (logging.Handler): Handler writing log records to the console, records are written above the status line.
+        """
+        if not self.enabled:
+            return
+        self._start = time.monotonic()
+        if console_handler:
+            emit = console_handler.emit
+
+            def emit_above_status_line(record):
+                with self._lock:
+                    self._clear()
+                    emit(record)
+            console_handler.emit = emit_above_status_line
+        self._ticker = threading.Thread(target=self._tick, name='progress', daemon=True)
+        self._ticker.start()
+
+    def stop(self):
+        """
+        Draw the final status line and stop redrawing.
+        """
+        if not self._ticker:
+            return
+        self._stop_event.set()
+        self._ticker.join()
+        self._ticker = None
+        with self._lock:
+            self._draw()
+            self.stream.write('\n')
+            self.stream.flush()
+            self._line_shown = False
+
+    def discover(self, count: int):
+        """
+        Record folders found by the walk that will be visited later.
+
+        Args:
+            count (int): Number of folders found.
+        """
+        self.discovered += count
+
+    def visit(self, movie_folder: bool):
+        """
+        Record that the walk visited one of the discovered folders.
+
+        Args:
+            movie_folder (bool): Whether it is a movie folder.
+        """
+        self.visited += 1
+        if movie_folder:
+            self.found += 1
+
+    def advance(self, count: int = 1):
+        """
+        Record that movie folders were processed.
+
+        Args:
+            count (int): Number of movie folders processed.
+        """
+        self.done += count
+
+    def estimated_total(self) -> int:
+        """
+        Estimate the number of movie folders of the run.
+
+        Returns:
+            int: Movie folders found so far plus the expected number in the folders not visited yet.
+        """
+        pending = max(self.discovered - self.visited, 0)
+        expected = pending * self.found / self.visited if self.visited else 0
+        return max(self.found + round(expected), self.done)
+
+    def status_line(self) -> str:
+        """
+        Build the status line text.
+
+        Returns:
+            str: The status line.
+        """
+        metrics = get_metrics()
+        elapsed = max(time.monotonic() - self._start, 1e-6)
+        total = self.estimated_total()
+        exact = self.discovered <= self.visited
+        percent = 100 * self.done / total if total else 0
+        rate = self.done / elapsed
+        eta = _format_seconds((total - self.done) / rate) if rate > 0 and total > self.done else '--:--:--'
+        return (f"[{self.done}/{'' if exact else '~'}{total} {percent:5.1f}%] "
+                f"{metrics.get('folders_scanned') / elapsed:6.1f} folders/s "
+                f"{metrics.get('probes') / elapsed:6.1f} probes/s "
+                f"{metrics.get('bytes_copied') / 1024 / 1024:7.1f} MB copied "
+                f"elapsed {_format_seconds(elapsed)} ETA {eta}")
+
+    def _tick(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            with self._lock:
+                self._draw()
+
+    def _draw(self):
+        self.stream.write('\r\x1b[K' + self.status_line())
+        self.stream.flush()
+        self._line_shown = True
+
+    def _clear(self):
+        if self._line_shown:
+            self.stream.write('\r\x1b[K')
+            self.stream.flush()
+            self._line_shown = False
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
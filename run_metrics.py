@@ -0,0 +1,258 @@
+import os
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+class RunMetrics:
+    """
+    RunMetrics collects counters and histograms of a run and exports them in Prometheus
+    textfile-collector format (for node-exporter's --collector.textfile.directory).
+
+    The file is rewritten atomically every `interval` seconds while the run is in progress and once more
+    at the end of the run, so long runs and stalls show up on dashboards while they happen.
+
+    Attributes:
+        namespace (str): Prefix of every exported metric name (the tool name).
+        metrics_file (str): Path of the .prom file to write, None to only collect.
+        interval (float): Seconds between periodic writes during the run.
+    """
+
+    # name: help text. Exported as <namespace>_<name>_total
+    COUNTERS = {
+        'folders_scanned': "Folders scanned for movie files.",
+        'probes': "Movie files probed for embedded text tracks.",
+        'subtitles_placed': "Subtitle files placed next to a movie.",
+        'bytes_copied': "Bytes of subtitle files copied.",
+        'orphan_subtitles_indexed': "Stray subtitle files indexed for matching to movies.",
+        'renames': "Folders renamed.",
+        'errors': "Errors logged.",
+    }
+
+    # name: (help text, bucket upper bounds in seconds). Exported as <namespace>_<name>_seconds
+    HISTOGRAMS = {
+        'probe_duration': ("Time spent probing a movie file.", (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)),
+        'folder_duration': ("Time spent processing a movie folder.", (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)),
+    }
+
+    def __init__(self, namespace: str = 'fix_subs'):
+        """
+        Initialize an empty set of metrics.
+
+        Args:
+            namespace (str): Prefix of every exported metric name.
+        """
+        self.namespace = namespace
+        self.metrics_file = None
+        self.interval = 30.0
+
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+        self._histograms = {name: ([0] * len(buckets), [0.0, 0]) for name, (_, buckets) in self.HISTOGRAMS.items()}
+        self._start_time = time.time()
+        self._last_success = None
+        self._in_progress = False
+        self._stop_event = threading.Event()
+        self._writer = None
+        self._log_handler = None
+
+    def inc(self, name: str, value: int = 1):
+        """
+        Increment a counter.
+
+        Args:
+            name (str): Counter name, one of COUNTERS.
+            value (int): Amount to add.
+        """
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, seconds: float):
+        """
+        Record an observation in a histogram.
+
+        Args:
+            name (str): Histogram name, one of HISTOGRAMS.
+            seconds (float): Observed duration.
+        """
+        buckets = self.HISTOGRAMS[name][1]
+        with self._lock:
+            counts, total = self._histograms[name]
+            for i, bound in enumerate(buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            total[0] += seconds
+            total[1] += 1
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Context manager observing the duration of its block in a histogram.
+
+        Args:
+            name (str): Histogram name, one of HISTOGRAMS.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def get(self, name: str) -> int:
+        """
+        Get the current value of a counter.
+
+        Args:
+            name (str): Counter name, one of COUNTERS.
+
+        Returns:
+            int: The counter value.
+        """
+        return self._counters[name]
+
+    def start(self, namespace: str, metrics_file: str = None, interval: float = 30.0):
+        """
+        Start a run: reset the run clock, count logged errors and start the periodic writer.
+
+        Args:
+            namespace (str): Prefix of every exported metric name (the tool name).
+            metrics_file (str): Path of the .prom file to write, None to only collect.
+            interval (float): Seconds between periodic writes during the run.
+        """
+        self.namespace = namespace
+        self.metrics_file = metrics_file
+        self.interval = interval
+        self._start_time = time.time()
+        self._in_progress = True
+
+        # errors are counted from what gets logged at ERROR level or above
+        self._log_handler = _ErrorCountingHandler(self)
+        logging.getLogger('MyLogger').addHandler(self._log_handler)
+
+        if metrics_file:
+            self._last_success = self._read_last_success(metrics_file)
+            self.write()
+            self._stop_event.clear()
+            self._writer = threading.Thread(target=self._write_periodically, name='metrics-writer', daemon=True)
+            self._writer.start()
+
+    def finish(self, success: bool = True):
+        """
+        End the run: stop the periodic writer and write the final values.
+
+        Args:
+            success (bool): Whether the run completed, updates the last success timestamp.
+        """
+        self._in_progress = False
+        if success:
+            self._last_success = time.time()
+        if self._log_handler:
+            logging.getLogger('MyLogger').removeHandler(self._log_handler)
+            self._log_handler = None
+        if self._writer:
+            self._stop_event.set()
+            self._writer.join()
+            self._writer = None
+        if self.metrics_file:
+            self.write()
+
+    def render(self) -> str:
+        """
+        Render the metrics in Prometheus text exposition format.
+
+        Returns:
+            str: The metrics text.
+        """
+        ns = self.namespace
+        lines = []
+        with self._lock:
+            for name, help_text in self.COUNTERS.items():
+                lines.append(f"# HELP {ns}_{name}_total {help_text}")
+                lines.append(f"# TYPE {ns}_{name}_total counter")
+                lines.append(f"{ns}_{name}_total {self._counters[name]}")
+
+            for name, (help_text, buckets) in self.HISTOGRAMS.items():
+                counts, (total, count) = self._histograms[name]
+                lines.append(f"# HELP {ns}_{name}_seconds {help_text}")
+                lines.append(f"# TYPE {ns}_{name}_seconds histogram")
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{ns}_{name}_seconds_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{ns}_{name}_seconds_bucket{{le="+Inf"}} {count}')
+                lines.append(f"{ns}_{name}_seconds_sum {total:.6f}")
+                lines.append(f"{ns}_{name}_seconds_count {count}")
+
+        now = time.time()
+        lines.append(f"# HELP {ns}_run_duration_seconds Duration of the current (or last) run.")
+        lines.append(f"# TYPE {ns}_run_duration_seconds gauge")
+        lines.append(f"{ns}_run_duration_seconds {now - self._start_time:.3f}")
+        lines.append(f"# HELP {ns}_run_in_progress Whether a run is in progress.")
+        lines.append(f"# TYPE {ns}_run_in_progress gauge")
+        lines.append(f"{ns}_run_in_progress {int(self._in_progress)}")
+        lines.append(f"# HELP {ns}_last_update_timestamp_seconds Time the metrics file was last written.")
+        lines.append(f"# TYPE {ns}_last_update_timestamp_seconds gauge")
+        lines.append(f"{ns}_last_update_timestamp_seconds {now:.3f}")
+        if self._last_success is not None:
+            lines.append(f"# HELP {ns}_last_success_timestamp_seconds Time the last successful run finished.")
+            lines.append(f"# TYPE {ns}_last_success_timestamp_seconds gauge")
+            lines.append(f"{ns}_last_success_timestamp_seconds {self._last_success:.3f}")
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """
+        Atomically write the metrics file (write to a temporary file, then rename over the old one),
+        so the textfile collector never reads a partial file.
+        """
+        tmp_file = f"{self.metrics_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_file, self.metrics_file)
+        except OSError as e:
+            logging.getLogger('MyLogger').warning(f"*** Could not write metrics file [{self.metrics_file}]: {e} ***")
+
+    def _write_periodically(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def _read_last_success(self, metrics_file: str) -> float | None:
+        """
+        Carry the last success timestamp over from the file of a previous run, so a failed run does not hide it.
+        """
+        try:
+            with open(metrics_file, encoding='utf-8') as f:
+                match = re.search(rf"^{re.escape(self.namespace)}_last_success_timestamp_seconds (\S+)$", f.read(), re.MULTILINE)
+            return float(match.group(1)) if match else None
+        except (OSError, ValueError):
+            return None
+
+
+class _ErrorCountingHandler(logging.Handler):
+    """Logging handler counting the messages logged at ERROR level or above (once per message, not per wrapped chunk)."""
+
+    def __init__(self, metrics: RunMetrics):
+        super().__init__(level=logging.ERROR)
+        self.metrics = metrics
+
+    def emit(self, record: logging.LogRecord):
+        if not getattr(record, 'continuation', False):
+            self.metrics.inc('errors')
+
+
+# Metrics of the current run, shared by every module (like logging.getLogger)
+_metrics = RunMetrics()
+
+
+def get_metrics() -> RunMetrics:
+    """
+    Get the metrics of the current run.
+
+    Returns:
+        RunMetrics: The shared metrics instance.
+    """
+    return _metrics
@@ -0,0 +1,189 @@
+import os
+import re
+from collections import defaultdict
+
+from misc_utils import normalize_title, split_release_name, release_tokens, SUBTITLE_EXTENSIONS, MOVIE_EXTENSIONS
+from library_catalog import split_title_year
+from movie_subtitle_manager import SubtitleManager
+from run_metrics import get_metrics
+from fs_backend import get_fs
+
+
+# Folder names that say nothing about the movie, the folder above them is used instead
+GENERIC_FOLDERS = {'subs', 'sub', 'subtitles', 'subtitle', 'srt', 'subtitulos'}
+# Language words dropped from the end of titles ('The.Matrix.English.srt')
+LANGUAGE_WORDS = set().union(*SubtitleManager.LANGUAGE_TOKENS.values())
+
+
+def _title_key(name: str) -> tuple[str, int | None] | None:
+    """
+    Get the (normalized title, year) key of a folder or subtitle file name.
+
+    Args:
+        name (str): The name, without the file extension.
+
+    Returns:
+        tuple: (title, year), year being None if the name has none, or None if no title is left.
+    """
+    # the year of a file name can be its last token ('Alien.1979'), the year pattern wants a dot after it
+    title, year, _ = split_title_year(name + '.')
+    if year is None:
+        title = split_release_name(name)[0]
+    words = normalize_title(title).split()
+    while words and words[-1] in LANGUAGE_WORDS:
+        words.pop()
+    return (' '.join(words), year) if words else None
+
+
+def _release_tokens(name: str) -> set[str]:
+    """
+    Get the release tokens of a name (resolution, source, codecs... and the release group), lower-cased.
+
+    Args:
+        name (str): The folder or file name.
+
+    Returns:
+        set[str]: The release tokens found.
+    """
+    tokens = set(release_tokens(name))
+    group = re.search(r'-(\w+)(?:\.\w+)?$', name)  # release group, before a language tag if any
+    if group and tokens:
+        tokens.add(group.group(1).lower())
+    return tokens
+
+
+class SubtitleIndex:
+    """
+    SubtitleIndex is a reverse index of the stray subtitle files of a library: the ones sitting outside any movie
+    folder, in a parent folder, a sibling folder or a shared 'Subtitles' dump. It is built with a single scan and
+    then matches a movie to its best subtitle with dictionary lookups, without searching the disk again.
+
+    Subtitles are keyed by the normalized title and year of their file name, or of their folder (the folder above
+    generic 'Subtitles' or language folders) when the file name has no title ('English.srt'), and by their full
+    normalized release name. A movie is matched by
+    its folder and file names: exact release name first, then the most release tokens in common, then the largest.
+
+    Attributes:
+        by_release (dict): Entries by normalized release name.
+        by_title_year (dict): Entries by (normalized title, year), year None for names without one.
+        by_title (dict): Entries by normalized title, for a movie or subtitle with no year.
+        count (int): Number of subtitle files indexed.
+    """
+
+    def __init__(self, logger=None):
+        """
+        Initialize an empty index.
+
+        Args:
+            logger (LoggerClass): Optional logger for debug messages.
+        """
+        self.logger = logger
+        self.by_release = defaultdict(list)
+        self.by_title_year = defaultdict(list)
+        self.by_title = defaultdict(list)
+        self.count = 0
+
+    def scan(self, root: str, path_filter=None) -> int:
+        """
+        Index the stray subtitle files below a folder. Subtitles in a folder holding a movie file, and in its
+        'subs' folder, belong to that movie and are left out.
+
+        Args:
+            root (str): The folder to scan, typically the library root.
+            path_filter (PathFilter): Optional filter pruning folders by name and depth.
+
+        Returns:
+            int: Number of subtitle files indexed by this scan.
+        """
+        count = self.count
+        root = os.path.abspath(root)
+        # the names of the folders below the root only: the root names the library, not a movie
+        self._scan(root, [], path_filter, 1)
+        if self.logger:
+            self.logger.log_info(f"Indexed {self.count - count} stray subtitle file{'s' if self.count - count != 1 else ''} under [{root}]")
+        return self.count - count
+
+    def add(self, path: str, size: int, folder_names: list[str] = ()):
+        """
+        Add a subtitle file to the index.
+
+        Args:
+            path (str): Path of the subtitle file.
+            size (int): Size of the file in bytes.
+            folder_names (list[str]): Names of the folders above the file below the scanned root, outermost first.
+        """
+        stem = os.path.splitext(os.path.basename(path))[0]
+        names, key = [stem], _title_key(stem)
+        if not key or (key[1] is None and key[0].isdigit()):
+            # a file name with no title ('English.srt', '2_English.srt'): the nearest folder naming the movie, above
+            # 'Subtitles' and language folders (never a collection folder when the file is named after its movie)
+            folder_name = next((name for name in reversed(folder_names)
+                                if name.lower() not in GENERIC_FOLDERS and name.lower() not in LANGUAGE_WORDS), None)
+            if folder_name and _title_key(folder_name):
+                names.append(folder_name)
+                key = _title_key(folder_name)
+        entry = (path, size, tuple(folder_names[-2:]) + (os.path.basename(path),),
+                 set().union(*(_release_tokens(name) for name in names)))
+
+        self.by_release[normalize_title(stem)].append(entry)
+        if key:
+            self.by_title_year[key].append(entry)
+            self.by_title[key[0]].append(entry)
+        self.count += 1
+        get_metrics().inc('orphan_subtitles_indexed')
+
+    def match(self, folder_name: str, file_base: str) -> list[tuple[str, int, tuple[str, ...]]]:
+        """
+        Find the stray subtitles of a movie, best first.
+
+        Args:
+            folder_name (str): Name of the movie folder.
+            file_base (str): Name of the movie file without its extension.
+
+        Returns:
+            list: (path, size, names) of the matching subtitles, names being the file name and the folders above
+                  it (for their language tags), ordered by release name match, release tokens in common and size.
+        """
+        exact = self.by_release.get(normalize_title(file_base), [])
+        candidates = {entry[0]: entry for entry in exact}
+        for name in (file_base, folder_name):
+            key = _title_key(name)
+            if not key:
+                continue
+            title, year = key
+            entries = self.by_title_year.get(key, []) + self.by_title_year.get((title, None), []) if year else self.by_title.get(title, [])
+            for entry in entries:
+                candidates[entry[0]] = entry
+
+        tokens = _release_tokens(folder_name) | _release_tokens(file_base)
+        ranked = sorted(candidates.values(), reverse=True,
+                        key=lambda entry: (entry in exact, len(entry[3] & tokens), entry[1]))
+        return [(path, size, names) for path, size, names, _ in ranked]
+
+    def _scan(self, folder_path: str, folder_names: list[str], path_filter, depth: int):
+        fs = get_fs()
+        try:
+            entries = fs.scandir(folder_path)
+        except OSError as e:
+            if self.logger:
+                self.logger.log_warning(f"*** Could not list [{folder_path}]: {e} ***")
+            return
+        movie_folder = any(not is_dir and name.lower().endswith(MOVIE_EXTENSIONS) for name, is_dir in entries)
+
+        for name, is_dir in entries:
+            path = os.path.join(folder_path, name)
+            if is_dir:
+                if movie_folder and name.lower() == 'subs':
+                    continue
+                if path_filter and not path_filter.allows(name, depth):
+                    continue
+                self._scan(path, folder_names + [name], path_filter, depth + 1)
+            elif not movie_folder and name.lower().endswith(SUBTITLE_EXTENSIONS):
+                try:
+                    size = fs.getsize(path)
+                except OSError as e:
+                    # removed since the listing, or unreadable: skip it rather than fail the whole index
+                    if self.logger:
+                        self.logger.log_warning(f"*** Could not read [{path}], not indexed: {e} ***")
+                    continue
+                self.add(path, size, folder_names)
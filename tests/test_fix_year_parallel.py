@@ -0,0 +1,129 @@
+"""
+Check that fix_year's parallel mode (--workers N) renames a library exactly like the sequential run: same folder
+tree and same catalog rows, with movie folders nested in movie folders renamed children first.
+
+Run with: python -m unittest discover -s tests   (or pytest)
+"""
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fix_year import LoggerClass, process_folder, process_folder_parallel
+from library_catalog import LibraryCatalog
+
+
+RUN_TIMEOUT = 30
+
+
+def write_library(root: str):
+    """
+    Write a small library: movie folders needing a rename at several depths, name collisions in one parent, movie
+    folders holding other movie folders, and folders left as they are.
+
+    Args:
+        root (str): Folder to write the library in.
+    """
+    movies = [
+        'Movies/The.Matrix.1999.1080p.BluRay.x264-GRP/movie.mkv',
+        'Movies/Alien.1979.720p.BluRay/alien.mkv',
+        'Movies/Alien.1979.1080p.WEB-DL/alien.mkv',       # renamed to the same name: one gets ' (1)'
+        'Movies/Heat (1995)/heat.avi',                    # already well named
+        'Movies/No Year Here/movie.mp4',                  # no year, left as is
+        'Movies/Extras/readme.txt',                       # no movie file
+        'Saga.Box.2003.1080p/box.mkv',                    # a movie folder holding other movie folders
+        'Saga.Box.2003.1080p/Part.One.2001.DVDRip/part1.avi',
+        'Saga.Box.2003.1080p/Part.Two.2003.DVDRip/part2.avi',
+        'Saga.Box.2003.1080p/Part.Two.2003.DVDRip/Extras.2003.Making.Of/making_of.mkv',
+    ]
+    for group in range(4):
+        for i in range(6):
+            movies.append(f'Group{group}/Film.{group}{i}.{1950 + group * 10 + i}.720p.HDTV/film.mkv')
+    for movie in movies:
+        path = os.path.join(root, *movie.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'\0')
+
+
+class FixYearParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, 'library')
+        self.logger = LoggerClass(False, None, 'CRITICAL', True, False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_fix_year(self, use_rest_of_name: bool, workers: int) -> tuple[list[str], list[tuple]]:
+        """
+        Write the library in a fresh folder (always the same path), fix it and return the result.
+
+        Returns:
+            tuple: (relative paths of the folders and files, catalog rows without their update time).
+        """
+        shutil.rmtree(self.root, ignore_errors=True)  # left by a failed run
+        write_library(self.root)
+        catalog_file = os.path.join(self.tmp_dir.name, f'catalog_{workers}.sqlite')
+        rows, errors = [], []
+
+        def run():
+            # the catalog connection belongs to the thread that opens it
+            try:
+                with LibraryCatalog(catalog_file) as catalog:
+                    if workers > 1:
+                        process_folder_parallel(self.root, use_rest_of_name, False, self.logger, True, catalog, workers=workers)
+                    else:
+                        process_folder(self.root, use_rest_of_name, False, self.logger, True, catalog)
+                    catalog.commit()
+                    rows.extend(tuple(row) for row in catalog.conn.execute(
+                        "SELECT folder, parent, folder_name, title, year, name_ok, movie_file, text_langs, subtitle_path, "
+                        "subtitle_source FROM movies ORDER BY folder"))
+            except Exception as e:
+                errors.append(e)
+
+        # a parallel run that loses track of its pending tasks never returns: fail instead of hanging the suite
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(RUN_TIMEOUT)
+        self.assertFalse(thread.is_alive(), f"fix_year with {workers} workers did not finish in {RUN_TIMEOUT}s")
+        if errors:
+            raise errors[0]
+
+        tree = sorted(os.path.relpath(os.path.join(folder, name), self.root)
+                      for folder, folders, files in os.walk(self.root) for name in folders + files)
+        os.remove(catalog_file)
+        # the next run writes the library again at the same path, so the catalogs compare as they are
+        shutil.rmtree(self.root)
+        return tree, rows
+
+    def test_parallel_matches_sequential(self):
+        for use_rest_of_name in (False, True):
+            sequential = self.run_fix_year(use_rest_of_name, 1)
+            for workers in (2, 8):
+                with self.subTest(use_rest_of_name=use_rest_of_name, workers=workers):
+                    self.assertEqual(self.run_fix_year(use_rest_of_name, workers), sequential)
+
+    def test_nested_movie_folders_renamed(self):
+        tree, rows = self.run_fix_year(False, 4)
+        self.assertIn(os.path.join('Movies', 'The Matrix (1999)', 'movie.mkv'), tree)
+        self.assertIn(os.path.join('Movies', 'Alien (1979)'), tree)
+        self.assertIn(os.path.join('Movies', 'Alien (1979) (1)'), tree)
+        self.assertIn(os.path.join('Movies', 'No Year Here'), tree)
+        # the children are renamed (and moved in the catalog) before their parent
+        folders = {os.path.relpath(row[0], self.root) for row in rows}
+        parts = [path for path in tree if path.endswith(('part1.avi', 'part2.avi', 'making_of.mkv'))]
+        self.assertEqual(len(parts), 3)
+        for path in parts:
+            self.assertIn(os.path.dirname(path), folders)
+        self.assertIn(os.path.join('Saga Box (2003)', 'Part Two (2003)', 'Extras (2003)', 'making_of.mkv'), tree)
+        self.assertFalse(any('Saga.Box' in path for path in tree))
+
+
+if __name__ == '__main__':
+    unittest.main()
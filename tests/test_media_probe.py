@@ -0,0 +1,197 @@
+"""
+Check the native container probe (media_probe) against MediaInfo on small generated Matroska and MP4 samples.
+
+Run with: python -m unittest discover -s tests   (or pytest)
+The comparisons are skipped when pymediainfo or the MediaInfo library is not installed.
+"""
+import os
+import sys
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_probe import probe_text_tracks
+
+try:
+    from pymediainfo import MediaInfo
+    MEDIAINFO_AVAILABLE = MediaInfo.can_parse()
+except (ImportError, OSError):
+    MEDIAINFO_AVAILABLE = False
+
+
+# Matroska sample writer --------------------------------------------------------------------------------------------
+
+def _ebml_size(n: int) -> bytes:
+    for length in range(1, 9):
+        if n < (1 << (7 * length)) - 1:
+            return ((1 << (7 * length)) | n).to_bytes(length, 'big')
+    raise ValueError(n)
+
+
+def _element(element_id: int, data: bytes) -> bytes:
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big') + _ebml_size(len(data)) + data
+
+
+def _uint(element_id: int, value: int, size: int = 1) -> bytes:
+    return _element(element_id, value.to_bytes(size, 'big'))
+
+
+def _string(element_id: int, value: str) -> bytes:
+    return _element(element_id, value.encode('ascii'))
+
+
+def write_mkv(path: str, text_tracks: list[tuple[str, str | None, str | None]], seek_head_first: bool = False):
+    """
+    Write a minimal Matroska file: a video track, the given text tracks and one cluster.
+
+    Args:
+        path (str): Path of the file to write.
+        text_tracks (list): (codec id, language or None, BCP 47 language or None) of each subtitle track.
+        seek_head_first (bool): Put the Tracks element after the cluster, found through a SeekHead.
+    """
+    ebml = _element(0x1A45DFA3, _uint(0x4286, 1) + _uint(0x42F7, 1) + _uint(0x42F2, 4) + _uint(0x42F3, 8) +
+                    _string(0x4282, 'matroska') + _uint(0x4287, 4) + _uint(0x4285, 2))
+    info = _element(0x1549A966, _uint(0x2AD7B1, 1000000, 3) + _string(0x4D80, 'test') + _string(0x5741, 'test') +
+                    _element(0x4489, struct.pack('>f', 1000.0)))
+    entries = _element(0xAE, _uint(0xD7, 1) + _uint(0x73C5, 1) + _uint(0x83, 1) + _string(0x86, 'V_UNCOMPRESSED') +
+                       _string(0x22B59C, 'und') + _element(0xE0, _uint(0xB0, 16, 2) + _uint(0xBA, 16, 2)))
+    for number, (codec, language, language_bcp47) in enumerate(text_tracks, 2):
+        entry = _uint(0xD7, number) + _uint(0x73C5, number) + _uint(0x83, 17) + _string(0x86, codec)
+        if language is not None:
+            entry += _string(0x22B59C, language)
+        if language_bcp47 is not None:
+            entry += _string(0x22B59D, language_bcp47)
+        entries += _element(0xAE, entry)
+    tracks = _element(0x1654AE6B, entries)
+    cluster = _element(0x1F43B675, _uint(0xE7, 0) + _element(0xA3, bytes([0x81, 0, 0, 0x80]) + bytes(16 * 16 * 2)))
+
+    if seek_head_first:
+        def seek_head(position):
+            return _element(0x114D9B74, _element(0x4DBB, _element(0x53AB, (0x1654AE6B).to_bytes(4, 'big')) +
+                                                 _uint(0x53AC, position, 4)))
+        segment = seek_head(len(seek_head(0)) + len(info) + len(cluster)) + info + cluster + tracks
+    else:
+        segment = info + tracks + cluster
+    with open(path, 'wb') as f:
+        f.write(ebml + _element(0x18538067, segment))
+
+
+# MP4 sample writer -------------------------------------------------------------------------------------------------
+
+def _box(box_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(data), box_type) + data
+
+
+def _full_box(box_type: bytes, data: bytes, flags: int = 0) -> bytes:
+    return _box(box_type, struct.pack('>I', flags) + data)
+
+
+def _packed_language(language: str | int) -> int:
+    if isinstance(language, int):
+        return language  # QuickTime Macintosh language code
+    return sum((ord(c) - 0x60) << shift for c, shift in zip(language, (10, 5, 0)))
+
+
+def _trak(track_id: int, handler: bytes, language: str | int, codec: bytes, extended_language: str = None) -> bytes:
+    matrix = struct.pack('>9I', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    tkhd = _full_box(b'tkhd', struct.pack('>IIIII', 0, 0, track_id, 0, 1000) + bytes(16) + matrix + bytes(8), flags=3)
+    mdhd = _full_box(b'mdhd', struct.pack('>IIIIHH', 0, 0, 1000, 1000, _packed_language(language), 0))
+    hdlr = _full_box(b'hdlr', struct.pack('>I4s', 0, handler) + bytes(12) + b'test\0')
+    elng = _full_box(b'elng', extended_language.encode('ascii') + b'\0') if extended_language else b''
+    stsd = _full_box(b'stsd', struct.pack('>I', 1) + struct.pack('>I4s', 16, codec) + bytes(6) + struct.pack('>H', 1))
+    stbl = _box(b'stbl', stsd + _full_box(b'stts', bytes(4)) + _full_box(b'stsc', bytes(4)) +
+                _full_box(b'stsz', bytes(8)) + _full_box(b'stco', bytes(4)))
+    header = _full_box(b'vmhd', bytes(8), flags=1) if handler == b'vide' else _full_box(b'nmhd', b'')
+    dinf = _box(b'dinf', _full_box(b'dref', struct.pack('>I', 1) + _full_box(b'url ', b'', flags=1)))
+    return _box(b'trak', tkhd + _box(b'mdia', mdhd + hdlr + elng + _box(b'minf', header + dinf + stbl)))
+
+
+def write_mp4(path: str, text_tracks: list[tuple[bytes, str | int, bytes, str | None]], moov_last: bool = False):
+    """
+    Write a minimal MP4/QuickTime file: a video track and the given text tracks, with no samples.
+
+    Args:
+        path (str): Path of the file to write.
+        text_tracks (list): (handler type, language or Mac language code, codec, elng language or None) of each text track.
+        moov_last (bool): Put the moov box after the media data.
+    """
+    ftyp = _box(b'ftyp', b'isom\0\0\0\x01isomiso2mp41')
+    mvhd = _full_box(b'mvhd', struct.pack('>IIIIIH', 0, 0, 1000, 1000, 0x10000, 0x100) + bytes(10) +
+                     struct.pack('>9I', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000) + bytes(24) + struct.pack('>I', 9))
+    traks = _trak(1, b'vide', 'und', b'avc1')
+    for track_id, (handler, language, codec, extended_language) in enumerate(text_tracks, 2):
+        traks += _trak(track_id, handler, language, codec, extended_language)
+    moov = _box(b'moov', mvhd + traks)
+    mdat = _box(b'mdat', bytes(100000))
+    with open(path, 'wb') as f:
+        f.write(ftyp + (mdat + moov if moov_last else moov + mdat))
+
+
+# Tests -------------------------------------------------------------------------------------------------------------
+
+SAMPLES = {
+    'tracks.mkv': (write_mkv, [('S_TEXT/UTF8', 'eng', None), ('S_TEXT/UTF8', 'spa', None), ('S_HDMV/PGS', 'fre', None)], {}),
+    'seek_head.mkv': (write_mkv, [('S_TEXT/UTF8', None, None), ('S_TEXT/ASS', 'ger', None)], {'seek_head_first': True}),
+    'no_text.mkv': (write_mkv, [], {}),
+    'bcp47.mkv': (write_mkv, [('S_TEXT/UTF8', 'eng', 'pt-BR')], {}),
+    'tracks.mp4': (write_mp4, [(b'sbtl', 'eng', b'tx3g', None), (b'text', 'spa', b'tx3g', None)], {}),
+    'moov_last.mp4': (write_mp4, [(b'subt', 'fre', b'wvtt', None), (b'sbtl', 'eng', b'tx3g', 'en-US')], {'moov_last': True}),
+    'mac_language.mov': (write_mp4, [(b'text', 0, b'text', None)], {}),
+}
+
+
+class MediaProbeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        for name, (writer, text_tracks, options) in SAMPLES.items():
+            writer(os.path.join(cls.tmp_dir.name, name), text_tracks, **options)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def sample(self, name: str) -> str:
+        return os.path.join(self.tmp_dir.name, name)
+
+    @unittest.skipUnless(MEDIAINFO_AVAILABLE, "pymediainfo or the MediaInfo library is not installed")
+    def test_languages_match_mediainfo(self):
+        for name in SAMPLES:
+            with self.subTest(sample=name):
+                path = self.sample(name)
+                native = probe_text_tracks(path)
+                self.assertIsNotNone(native, "native probe could not parse the sample")
+                expected = [(track.language or '').lower() for track in MediaInfo.parse(path).tracks if track.track_type == 'Text']
+                self.assertEqual([language for _, language in native], expected)
+
+    def test_expected_languages(self):
+        self.assertEqual(probe_text_tracks(self.sample('tracks.mkv')),
+                         [('S_TEXT/UTF8', 'en'), ('S_TEXT/UTF8', 'es'), ('S_HDMV/PGS', 'fr')])
+        self.assertEqual(probe_text_tracks(self.sample('seek_head.mkv')), [('S_TEXT/UTF8', 'en'), ('S_TEXT/ASS', 'de')])
+        self.assertEqual(probe_text_tracks(self.sample('no_text.mkv')), [])
+        self.assertEqual(probe_text_tracks(self.sample('bcp47.mkv')), [('S_TEXT/UTF8', 'pt-br')])
+        self.assertEqual(probe_text_tracks(self.sample('moov_last.mp4')), [('wvtt', 'fr'), ('tx3g', 'en-us')])
+        self.assertEqual(probe_text_tracks(self.sample('mac_language.mov')), [('text', 'en')])
+
+    def test_truncated_files_fall_back(self):
+        for name in ('tracks.mkv', 'tracks.mp4'):
+            with self.subTest(sample=name):
+                with open(self.sample(name), 'rb') as f:
+                    data = f.read(40)
+                path = self.sample('truncated_' + name)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self.assertIsNone(probe_text_tracks(path))
+
+    def test_other_containers_not_probed(self):
+        path = self.sample('movie.avi')
+        with open(path, 'wb') as f:
+            f.write(b'RIFF\0\0\0\0AVI ')
+        self.assertIsNone(probe_text_tracks(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
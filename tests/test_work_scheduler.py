@@ -0,0 +1,129 @@
+"""
+Check the WorkScheduler budgets and cursor: folders done in a pass are skipped by the next run, a complete pass
+resets the cursor, demo runs leave it alone and the budgets bound both the processing and the crawl.
+
+Run with: python -m unittest discover -s tests   (or pytest)
+"""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from work_scheduler import WorkScheduler
+from logger_class import LoggerClass
+from fs_backend import MemoryFS, get_fs, set_fs
+
+
+FOLDERS = [f'/library/Movie {i:02d}' for i in range(10)]
+
+
+class WorkSchedulerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.logger = LoggerClass(log_to_file=False, loglevel='CRITICAL', silent=True)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cursor_file = os.path.join(self.tmp_dir.name, 'cursor.json')
+        self.previous_fs = get_fs()
+        fs = MemoryFS()
+        for i, folder in enumerate(FOLDERS):
+            # Movie 00 is the oldest
+            fs.add_dir(folder, mtime=1000.0 + i)
+        set_fs(fs)
+        self.pulled = 0
+
+    def tearDown(self):
+        set_fs(self.previous_fs)
+        self.tmp_dir.cleanup()
+
+    def walk(self):
+        # a lazy walk, counting the folders pulled from it
+        for folder in FOLDERS:
+            self.pulled += 1
+            yield (folder,)
+
+    def run_scheduler(self, **options) -> tuple[WorkScheduler, list[str]]:
+        scheduler = WorkScheduler(self.logger, cursor_file=self.cursor_file, **options)
+        return scheduler, [item[0] for item in scheduler.run(self.walk())]
+
+    def saved_cursor(self) -> dict[str, float] | None:
+        if not os.path.exists(self.cursor_file):
+            return None
+        with open(self.cursor_file, encoding='utf-8') as f:
+            return json.load(f)['done']
+
+    def test_orders(self):
+        self.assertEqual(self.run_scheduler()[1], FOLDERS)
+        self.assertEqual(self.run_scheduler(order='newest')[1], FOLDERS[::-1])
+        self.assertEqual(self.run_scheduler(order='oldest')[1], FOLDERS)
+        self.assertEqual(self.run_scheduler(priority=lambda path: path.endswith('5'))[1][-1], FOLDERS[5])
+
+    def test_cursor_continues_and_resets(self):
+        scheduler, done = self.run_scheduler(max_items=4)
+        self.assertEqual(done, FOLDERS[:4])
+        self.assertTrue(scheduler.budget_exhausted)
+        self.assertEqual(set(self.saved_cursor()), set(FOLDERS[:4]))
+
+        scheduler, done = self.run_scheduler(order='name', max_items=4)
+        self.assertEqual(done, FOLDERS[4:8])
+        self.assertEqual((scheduler.skipped, scheduler.remaining), (4, 2))
+        self.assertEqual(set(self.saved_cursor()), set(FOLDERS[:8]))
+
+        # the pass reaches the end of the library: the next run starts over
+        scheduler, done = self.run_scheduler()
+        self.assertEqual(done, FOLDERS[8:])
+        self.assertFalse(scheduler.budget_exhausted)
+        self.assertEqual(self.saved_cursor(), {})
+        self.assertEqual(self.run_scheduler(max_items=1)[1], FOLDERS[:1])
+
+    def test_changed_folder_done_again(self):
+        self.run_scheduler(max_items=2)
+        get_fs().add_dir(FOLDERS[0], mtime=5000.0)
+        self.assertEqual(self.run_scheduler(max_items=2)[1], [FOLDERS[0], FOLDERS[2]])
+
+    def test_failed_folder_not_recorded(self):
+        scheduler = WorkScheduler(self.logger, cursor_file=self.cursor_file)
+        with self.assertRaises(RuntimeError):
+            for folder, in scheduler.run(self.walk()):
+                if folder == FOLDERS[3]:
+                    raise RuntimeError(folder)
+        self.assertEqual(set(self.saved_cursor()), set(FOLDERS[:3]))
+
+    def test_demo_leaves_cursor(self):
+        self.run_scheduler(demo=True, max_items=3)
+        self.assertIsNone(self.saved_cursor())
+        self.run_scheduler(max_items=3)
+        self.run_scheduler(demo=True)
+        self.assertEqual(set(self.saved_cursor()), set(FOLDERS[:3]))
+
+    def test_item_budget_stops_the_walk(self):
+        self.run_scheduler(max_items=3)
+        # the fourth folder is pulled to find out the budget is spent, the rest of the walk is not
+        self.assertEqual(self.pulled, 4)
+
+    def test_time_budget_bounds_the_crawl(self):
+        for order in WorkScheduler.ORDERS:
+            with self.subTest(order=order):
+                self.pulled = 0
+                scheduler, done = self.run_scheduler(order=order, max_seconds=0)
+                self.assertEqual(done, [])
+                self.assertEqual(self.pulled, 1)
+                self.assertTrue(scheduler.budget_exhausted)
+                self.assertIsNone(scheduler.remaining)
+
+    def test_cut_walk_is_not_a_complete_pass(self):
+        self.run_scheduler(max_items=1)
+        # every folder collected before the time budget ran out was already done: the cursor must survive
+        scheduler, done = self.run_scheduler(order='name', max_seconds=0)
+        self.assertEqual((done, scheduler.skipped), ([], 1))
+        self.assertTrue(scheduler.budget_exhausted)
+        self.assertEqual(set(self.saved_cursor()), {FOLDERS[0]})
+
+
+if __name__ == '__main__':
+    unittest.main()
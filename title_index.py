@@ -0,0 +1,241 @@
+import io
+import os
+import sys
+import gzip
+import mmap
+import time
+import struct
+import argparse
+
+from misc_utils import normalize_title, split_release_name
+
+
+MAGIC = b'TIDX\x01\x00\x00\x00'
+HEADER = struct.Struct('<8sI')
+OFFSET = struct.Struct('<I')
+DEFAULT_TYPES = ('movie', 'tvMovie')
+
+
+class TitleIndex:
+    """
+    TitleIndex looks up the year of a movie from its title in an offline index built from the IMDb title dumps.
+
+    The index file holds one 'normalized title<TAB>year<TAB>votes' record per title (primary and original), sorted
+    by title then by votes, after a header and a table of record offsets. It is memory-mapped, so opening it is
+    instant, only the pages touched by a lookup are read, and a lookup is a binary search over the offsets.
+
+    Attributes:
+        path (str): Path of the index file.
+        count (int): Number of records.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (memory-map) an index built with build_index.
+
+        Args:
+            path (str): Path of the index file.
+
+        Raises:
+            ValueError: If the file is not a title index.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            self._map.close()
+            raise ValueError(f"[{path}] is not a title index (truncated)")
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"[{path}] is not a title index")
+        self._records_start = HEADER.size + self.count * OFFSET.size
+        if len(self._map) < self._records_start or (self.count and not self._offsets_valid()):
+            self._map.close()
+            raise ValueError(f"[{path}] is a truncated or corrupt title index")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def lookup(self, title: str) -> list[tuple[int, int]]:
+        """
+        Find the movies with a given title.
+
+        Args:
+            title (str): The title, normalized here.
+
+        Returns:
+            list[tuple[int, int]]: (year, votes) of each movie with that title, most voted first.
+
+        Raises:
+            ValueError: If a record read is corrupt.
+        """
+        key = normalize_title(title).encode('utf-8')
+        if not key:
+            return []
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        matches = []
+        while low < self.count and self._key(low) == key:
+            _, year, votes = self._record(low)
+            matches.append((year, votes))
+            low += 1
+        return matches
+
+    def resolve_year(self, title: str) -> int | None:
+        """
+        Get the year of the movie with a given title, when it is not ambiguous.
+
+        Args:
+            title (str): The title.
+
+        Returns:
+            int: The year of the title's most voted movie, None if the title is unknown or several movies share it
+                 with no votes to tell them apart.
+        """
+        matches = self.lookup(title)
+        if not matches:
+            return None
+        years = {year for year, votes in matches if votes == matches[0][1]}
+        return matches[0][0] if len(years) == 1 else None
+
+    def resolve_folder(self, folder_name: str) -> tuple[str, int, str] | None:
+        """
+        Resolve the year of a folder name that has none, e.g. 'The.Matrix.1080p.BluRay'.
+
+        Args:
+            folder_name (str): The folder name.
+
+        Returns:
+            tuple: (title, year, release) e.g. ('The Matrix', 1999, '1080p.BluRay'), None if the title is not found.
+        """
+        title, release = split_release_name(folder_name)
+        year = self.resolve_year(title)
+        return (title, year, release) if year else None
+
+    def close(self):
+        self._map.close()
+
+    def _offsets_valid(self) -> bool:
+        # records are written in offset order: the first starts the records region, the last lies inside it, and
+        # the region ends a record (each record read is bounds-checked too)
+        first = OFFSET.unpack_from(self._map, HEADER.size)[0]
+        last = OFFSET.unpack_from(self._map, self._records_start - OFFSET.size)[0]
+        return first == 0 and self._records_start + last < len(self._map) and self._map[-1:] == b'\n'
+
+    def _line(self, i: int) -> bytes:
+        start = self._records_start + OFFSET.unpack_from(self._map, HEADER.size + i * OFFSET.size)[0]
+        end = self._map.find(b'\n', start) if start < len(self._map) else -1
+        if end < 0:
+            raise ValueError(f"[{self.path}] is a corrupt title index (record {i} out of bounds)")
+        return self._map[start:end]
+
+    def _record(self, i: int) -> tuple[bytes, int, int]:
+        fields = self._line(i).split(b'\t')
+        if len(fields) != 3 or not fields[1].isdigit() or not fields[2].isdigit():
+            raise ValueError(f"[{self.path}] is a corrupt title index (record {i} malformed)")
+        return fields[0], int(fields[1]), int(fields[2])
+
+    def _key(self, i: int) -> bytes:
+        return self._line(i).partition(b'\t')[0]
+
+
+def _read_tsv(path: str):
+    """Yield the rows of an IMDb TSV dump (optionally gzip-compressed) as lists of fields, header skipped."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='\n') as f:
+        next(f, None)
+        for line in f:
+            yield line.rstrip('\n').split('\t')
+
+
+def build_index(basics_file: str, index_file: str, ratings_file: str = None, title_types: tuple[str] = DEFAULT_TYPES,
+                min_votes: int = 0) -> int:
+    """
+    Build a title index from the IMDb dumps (https://datasets.imdbws.com/).
+
+    Args:
+        basics_file (str): Path of title.basics.tsv(.gz).
+        index_file (str): Path of the index file to write.
+        ratings_file (str): Optional path of title.ratings.tsv(.gz), the votes tell apart movies sharing a title.
+        title_types (tuple[str]): Title types to index.
+        min_votes (int): Leave out titles with fewer votes (needs ratings_file), to keep the index small.
+
+    Returns:
+        int: Number of records written.
+    """
+    votes = {}
+    if ratings_file:
+        for row in _read_tsv(ratings_file):
+            votes[row[0]] = int(row[2])
+
+    records = set()
+    for tconst, title_type, primary_title, original_title, _, start_year, *_ in _read_tsv(basics_file):
+        if title_type not in title_types or not start_year.isdigit():
+            continue
+        title_votes = votes.get(tconst, 0)
+        if title_votes < min_votes:
+            continue
+        for title in {normalize_title(primary_title), normalize_title(original_title)}:
+            if title:
+                records.add((title.encode('utf-8'), -title_votes, int(start_year)))
+
+    tmp_file = f"{index_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        data = io.BytesIO()
+        offsets = bytearray()
+        for key, negative_votes, year in sorted(records):
+            offsets += OFFSET.pack(data.tell())
+            data.write(b'%s\t%d\t%d\n' % (key, year, -negative_votes))
+        f.write(offsets)
+        f.write(data.getbuffer())
+    os.replace(tmp_file, index_file)
+    return len(records)
+
+
+def parse_args():
+    """
+    Parse command line arguments.
+
+    Returns:
+        Namespace: Parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Build or query the offline title/year index used by fix_year --title-index to name folders with no year.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Build the index from the IMDb dumps (https://datasets.imdbws.com/).")
+    build.add_argument('basics', type=str, help="Path of title.basics.tsv(.gz).")
+    build.add_argument('index', type=str, help="Index file to write.")
+    build.add_argument('--ratings', type=str, default=None, help="Path of title.ratings.tsv(.gz), its votes tell apart movies sharing a title.")
+    build.add_argument('--types', type=str, default=','.join(DEFAULT_TYPES), help=f"Comma separated title types to index (default {','.join(DEFAULT_TYPES)}).")
+    build.add_argument('--min-votes', type=int, default=0, help="Leave out titles with fewer votes (needs --ratings).")
+
+    lookup = subparsers.add_parser('lookup', help="Look up titles or folder names.")
+    lookup.add_argument('index', type=str, help="Path of the index file.")
+    lookup.add_argument('names', type=str, nargs='+', help="Titles or folder names to look up.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.command == 'build':
+        start = time.monotonic()
+        count = build_index(args.basics, args.index, args.ratings, tuple(args.types.split(',')), args.min_votes)
+        print(f"{count} titles indexed to [{args.index}] in {time.monotonic() - start:.1f}s", file=sys.stderr)
+    else:
+        with TitleIndex(args.index) as index:
+            for name in args.names:
+                resolved = index.resolve_folder(name)
+                matches = ', '.join(f"{year} ({votes} votes)" for year, votes in index.lookup(split_release_name(name)[0]))
+                print(f"{name}: {f'{resolved[0]} ({resolved[1]})' if resolved else 'not resolved'}{f'  [{matches}]' if matches else ''}")
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+from collections.abc import Callable, Generator, Iterable
+
+from logger_class import LoggerClass
+from fs_backend import get_fs
+
+
+class WorkScheduler:
+    """
+    WorkScheduler decides in which order movie folders are processed and when a run stops.
+
+    Folders can be ordered by modification time (newest first, so fresh downloads are handled right away),
+    by name or by a custom priority, and a run can be bounded by a wall-clock and/or item budget. The wall-clock
+    budget bounds the crawl as well: the sorted orders stop collecting folders once it is spent.
+    Folders processed in the current pass are persisted in a cursor file, so the next run skips them
+    and continues with the rest of the backlog; a pass that reaches the end of the library resets the cursor.
+
+    Attributes:
+        order (str): One of ORDERS.
+        priority (Callable): Optional sort key taking the folder path, lower values are processed first
+                             (overrides order).
+        max_seconds (float): Wall-clock budget of the run in seconds (None = unlimited).
+        max_items (int): Maximum number of folders processed in the run (None = unlimited).
+        cursor_file (str): Path of the JSON file persisting the folders done in the current pass.
+        demo (bool): Demo run: the cursor is read but not saved, so a later real run still fixes the folders.
+        logger (LoggerClass): Logger instance for logging messages.
+    """
+
+    ORDERS = ('listdir', 'newest', 'oldest', 'name')
+
+    # save the cursor every this many folders, so an interrupted run keeps most of its progress
+    SAVE_EVERY = 50
+
+    def __init__(self, logger: LoggerClass, order: str = 'listdir', priority: Callable[[str], object] = None,
+                 max_seconds: float = None, max_items: int = None, cursor_file: str = None, demo: bool = False):
+        """
+        Initialize the scheduler.
+
+        Args:
+            logger (LoggerClass): Logger instance for logging messages.
+            order (str): listdir (as found), newest or oldest (folder mtime), name.
+            priority (Callable): Optional sort key taking the folder path, overrides order.
+            max_seconds (float): Wall-clock budget of the run in seconds.
+            max_items (int): Maximum number of folders processed in the run.
+            cursor_file (str): Path of the cursor file, None to not persist progress.
+            demo (bool): Do not save the cursor (the folders were not really fixed).
+        """
+        if order not in self.ORDERS:
+            raise ValueError(f"Unknown order '{order}', expected one of {self.ORDERS}")
+        self.logger = logger
+        self.order = order
+        self.priority = priority
+        self.max_seconds = max_seconds
+        self.max_items = max_items
+        self.cursor_file = cursor_file
+        self.demo = demo
+
+        self.done = self._load_cursor()
+        self._mtimes = {}
+        self.processed = 0
+        self.skipped = 0
+        self.remaining = None  # folders left when the budget ran out, only known for sorted orders
+        self.budget_exhausted = False
+        self._walk_cut = False  # the time budget ran out while collecting the folders to sort
+
+    def run(self, items: Iterable[tuple]) -> Generator[tuple, None, None]:
+        """
+        Yield the work items in scheduled order until the budget runs out.
+
+        An item counts as done when the next one is requested, so an item whose processing raised
+        is not recorded in the cursor.
+
+        Args:
+            items (Iterable[tuple]): Work items, the first element of each is the folder path.
+
+        Yields:
+            tuple: The next work item to process.
+        """
+        start = time.monotonic()
+        items = self._ordered(items, start)
+        completed = False
+        try:
+            for position, item in enumerate(items):
+                folder_path = item[0]
+                mtime = self._mtime(folder_path)
+                if self.done.get(folder_path) == mtime:
+                    self.skipped += 1
+                    continue
+
+                if not self._budget_left(start):
+                    # stop pulling the walk: the budget bounds the crawl too
+                    self.budget_exhausted = True
+                    if isinstance(items, list) and not self._walk_cut:
+                        self.remaining = len(items) - position
+                    break
+                yield item
+                # stat again: placing a subtitle changes the folder mtime
+                self.done[folder_path] = self._mtime(folder_path, cached=False)
+                self.processed += 1
+                if self._persist and self.processed % self.SAVE_EVERY == 0:
+                    self._save_cursor()
+            # a walk cut short is not a complete pass, even if every folder collected was already done
+            self.budget_exhausted = self.budget_exhausted or self._walk_cut
+            completed = True
+        finally:
+            self._finish(time.monotonic() - start, completed)
+
+    def _ordered(self, items: Iterable[tuple], start: float) -> Iterable[tuple]:
+        if self.priority:
+            return sorted(self._collect(items, start), key=lambda item: self.priority(item[0]))
+        if self.order == 'newest':
+            return sorted(self._collect(items, start), key=lambda item: self._mtime(item[0]), reverse=True)
+        if self.order == 'oldest':
+            return sorted(self._collect(items, start), key=lambda item: self._mtime(item[0]))
+        if self.order == 'name':
+            return sorted(self._collect(items, start), key=lambda item: os.path.basename(item[0]).lower())
+        return items
+
+    def _collect(self, items: Iterable[tuple], start: float) -> list[tuple]:
+        # sorting needs the whole walk: stop pulling it when the time budget is spent, the folders collected so far
+        # are sorted and the next run walks again
+        collected = []
+        for item in items:
+            collected.append(item)
+            if self.max_seconds is not None and time.monotonic() - start >= self.max_seconds:
+                self._walk_cut = True
+                break
+        return collected
+
+    def _budget_left(self, start: float) -> bool:
+        if self.max_items is not None and self.processed >= self.max_items:
+            return False
+        if self.max_seconds is not None and time.monotonic() - start >= self.max_seconds:
+            return False
+        return True
+
+    def _finish(self, elapsed: float, completed: bool):
+        if self.budget_exhausted:
+            left = f"at most {self.remaining}" if self.remaining is not None else "the rest of the library"
+            self.logger.log_info(f"Budget reached after {self.processed} folder{'s' if self.processed != 1 else ''} in {elapsed:.1f}s, "
+                                 f"{left} left for the next run.")
+        elif completed and self.cursor_file:
+            # the whole library was covered: start the next pass from scratch
+            self.logger.log_debug(f"Pass complete ({self.processed} processed, {self.skipped} already done in previous runs), resetting cursor.")
+            self.done = {}
+        if self._persist:
+            self._save_cursor()
+        elif self.cursor_file:
+            self.logger.log_info(f"Demo mode: cursor [{self.cursor_file}] not updated.")
+
+    @property
+    def _persist(self) -> bool:
+        return bool(self.cursor_file) and not self.demo
+
+    def _mtime(self, folder_path: str, cached: bool = True) -> float:
+        if cached and folder_path in self._mtimes:
+            return self._mtimes[folder_path]
+        try:
+            mtime = get_fs().getmtime(folder_path)
+        except OSError:
+            mtime = 0.0
+        self._mtimes[folder_path] = mtime
+        return mtime
+
+    def _load_cursor(self) -> dict[str, float]:
+        if not self.cursor_file or not os.path.exists(self.cursor_file):
+            return {}
+        try:
+            with open(self.cursor_file, encoding='utf-8') as f:
+                return json.load(f).get('done', {})
+        except (OSError, ValueError) as e:
+            self.logger.log_warning(f"*** Could not read cursor file [{self.cursor_file}], starting a new pass: {e} ***")
+            return {}
+
+    def _save_cursor(self):
+        tmp_file = f"{self.cursor_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'saved': time.time(), 'done': self.done}, f)
+            os.replace(tmp_file, self.cursor_file)
+        except OSError as e:
+            self.logger.log_error(f"*** Could not save cursor file [{self.cursor_file}]: {e} ***")